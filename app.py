@@ -1,75 +1,36 @@
-from flask import Flask, jsonify, render_template
-import requests
-import time
-import pyttsx3
-import speech_recognition as sr
-import threading
+from flask import Flask, Response, jsonify, render_template, request
 import re
-
-# KoGPT2 임포트
-from transformers import PreTrainedTokenizerFast, GPT2LMHeadModel
-import torch
+from pattern import find_canonical_name
+from slots_feed import SlotsFeed
+from slot_store import open_slot_store, SlotError
+from device_transport import transport, TransportError
+from motor_frame import MotorFrame
+from tts import speak
+from voice_jobs import VoiceJobs, JobQueueFullError
+from speech_stream import listen_command
+import metrics
 
 app = Flask(__name__)
+voice_jobs = VoiceJobs()
 
 # ESP32 IP 주소 및 포트
 ESP32_IP = "192.168.0.100"
 ESP32_PORT = 80
 
-tts_engine = pyttsx3.init()
-tts_lock = threading.Lock()
-
-slots = {}
-
-# 동의어 사전
-synonyms = {
-    "주민등록증": ["주민등록증", "민증", "등록증"],
-    "롯데카드": ["롯데카드", "롯데"],
-    "삼성카드": ["삼성카드", "삼성"],
-    # 필요시 추가
-}
-
-def get_canonical_name(name):
-    for key, syns in synonyms.items():
-        if name in syns:
-            return key
-    return name
-
-# KoGPT2 모델, 토크나이저 로딩 (필요시 사전 다운로드)
-tokenizer = PreTrainedTokenizerFast.from_pretrained("skt/kogpt2-base-v2")
-model = GPT2LMHeadModel.from_pretrained("skt/kogpt2-base-v2")
-model.eval()
-
-def speak(text):
-    with tts_lock:
-        tts_engine.say(text)
-        tts_engine.runAndWait()
+slots = open_slot_store()
+slots_feed = SlotsFeed(slots)
 
 def send_esp32_command(command):
     url = f"http://{ESP32_IP}:{ESP32_PORT}/command"
     try:
-        response = requests.post(url, json={"command": command}, timeout=3)
+        response = transport.post(url, json={"command": command})
         if response.status_code == 200:
             print(f"ESP32 명령 전송 성공: {command}")
         else:
             print(f"ESP32 명령 전송 실패, 상태 코드: {response.status_code}")
-    except requests.RequestException as e:
+    except TransportError as e:
         print(f"ESP32 통신 오류: {e}")
 
-def listen_command():
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("🎤 음성 입력 대기 중...")
-        audio = r.listen(source)
-    try:
-        text = r.recognize_google(audio, language='ko-KR')
-        print(f"🎧 인식된 텍스트: {text}")
-        return text
-    except sr.UnknownValueError:
-        return "인식 실패"
-    except sr.RequestError as e:
-        return f"API 오류: {e}"
-
 def kogpt2_classify(text):
     """
     KoGPT2 모델을 실제로 생성형 분류기로 사용하지 않고,
@@ -80,16 +41,16 @@ def kogpt2_classify(text):
         content = text[2:].strip()
         m = re.match(r"(.+?)\s*(\d+)$", content)
         if m:
-            name = get_canonical_name(m.group(1).strip())
+            name = find_canonical_name(m.group(1).strip())
             slot_num = int(m.group(2))
             return ("저장", name, slot_num)
         else:
             return ("오류", "슬롯 번호 인식 실패", None)
     elif text.startswith("삭제"):
-        name = get_canonical_name(text[2:].strip())
+        name = find_canonical_name(text[2:].strip())
         return ("삭제", name, None)
     else:
-        name = get_canonical_name(text)
+        name = find_canonical_name(text)
         return ("이동", name, None)
 
 def process_command(text):
@@ -97,11 +58,14 @@ def process_command(text):
     print(f"명령 분류 결과 -> cmd: {cmd}, name: {name}, num: {num}")
 
     if cmd == "저장":
-        slots[name] = num
-        send_esp32_command(f"M{num * 1000};")
+        try:
+            slots[name] = num
+        except SlotError as e:
+            speak(str(e))
+            return
+        # 이동 → 대기 → 놓기를 한 메시지로 보내고 대기는 ESP32 가 한다
+        MotorFrame().save(num).flush(send_esp32_command)
         speak(f"{name} 슬롯을 {num}번 위치에 저장했습니다.")
-        time.sleep(1)
-        send_esp32_command(f"R{num * 1000};")
         speak("카드가 정상적으로 보관되었습니다. 설정이 완료되었습니다!")
     elif cmd == "삭제":
         if name in slots:
@@ -112,7 +76,7 @@ def process_command(text):
     elif cmd == "이동":
         if name in slots:
             pos = slots[name]
-            send_esp32_command(f"M{pos * 1000};")
+            MotorFrame().move(pos).flush(send_esp32_command)
             speak(f"{name} 슬롯으로 이동합니다.")
         else:
             speak(f"{name} 슬롯 정보가 없습니다.")
@@ -130,14 +94,35 @@ def listen():
         print(f"받은 음성 명령: {text}")
         if text in ["인식 실패", "API 오류"]:
             speak("음성 인식에 실패했습니다. 다시 시도해 주세요.")
-            return
+            return {"text": text, "recognized": False}
         process_command(text)
-    threading.Thread(target=worker).start()
-    return jsonify({"status": "음성 명령 처리 중..."})
+        return {"text": text, "recognized": True}
+    try:
+        job = voice_jobs.submit(worker)
+    except JobQueueFullError as e:
+        return jsonify({"status": "busy", "error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify({"status": "음성 명령 처리 중...", "job_id": job["id"], "position": job["position"]}), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = voice_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "없는 작업 id (끝난 지 오래되어 지워졌을 수 있음)"}), 404
+    return jsonify(job)
+
+@app.route("/healthz")
+def healthz():
+    # 규칙 기반 분류만 사용하므로 모델 로딩 없이 바로 준비 완료
+    return jsonify({"status": "ok", "device_transport": transport.stats(), "voice_jobs": voice_jobs.stats()})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/slots")
 def get_slots():
-    return jsonify(slots)
+    status, body, headers = slots_feed.respond(request.args.get("since"), request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,163 +1,108 @@
-from flask import Flask, jsonify, render_template
-import paho.mqtt.client as mqtt
-import time
-import pyttsx3
-import speech_recognition as sr
-import threading
-import re
-from transformers import PreTrainedTokenizerFast, GPT2LMHeadModel
-import torch
-import numpy as np
+from flask import Flask, Response, jsonify, render_template, request
+from command_parser import parse_command
+import os
+from model import start_warmup, is_model_ready, model_status
+from command_classifier import make_classifier
+from slots_feed import SlotsFeed
+from slot_store import open_slot_store, SlotError
+from motor_frame import MotorFrame
+from mqtt_transport import MqttTransport
+from tts import speak
+from voice_jobs import VoiceJobs, JobQueueFullError
+import speech_stream
+import metrics
 
 app = Flask(__name__)
+voice_jobs = VoiceJobs()
 
 # ===== MQTT 설정 =====
 MQTT_BROKER = "your.mqtt.broker.address"  # 실제 MQTT 브로커 주소로 변경하세요
 MQTT_PORT = 1883
 MQTT_TOPIC = "esp32/commands"  # ESP32가 구독하는 토픽
 
-mqtt_client = mqtt.Client()
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("MQTT 브로커 연결 성공")
-    else:
-        print(f"MQTT 연결 실패, 코드: {rc}")
-
-mqtt_client.on_connect = on_connect
-mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-mqtt_client.loop_start()
-
-# ===== TTS 엔진 및 락 =====
-tts_engine = pyttsx3.init()
-tts_lock = threading.Lock()
+# 연결 하나 (QoS 1, 끊기면 자동 재연결 + outbox)
+mqtt_transport = MqttTransport(broker=MQTT_BROKER, port=MQTT_PORT, topic=MQTT_TOPIC)
+mqtt_transport.start()
 
 # ===== 슬롯 데이터 =====
-slots = {}
-
-# ===== KoGPT2 모델 로드 =====
-tokenizer = PreTrainedTokenizerFast.from_pretrained("skt/kogpt2-base-v2")
-model = GPT2LMHeadModel.from_pretrained("skt/kogpt2-base-v2")
-model.eval()
-
-# ===== 동의어 그룹 =====
-synonym_groups = [
-    ["주민등록증", "민증", "등록증"],
-    ["롯데카드", "롯데"],
-    ["삼성카드", "삼성"],
-]
-
-def find_canonical_name(name):
-    name = name.strip()
-    for group in synonym_groups:
-        if name in group:
-            return group[0]
-    return name
-
-# ===== 음성 합성 함수 =====
-def speak(text):
-    with tts_lock:
-        tts_engine.say(text)
-        tts_engine.runAndWait()
+slots = open_slot_store()
+slots_feed = SlotsFeed(slots)
 
 # ===== MQTT 명령 전송 함수 =====
 def send_esp32_command(command):
-    try:
-        mqtt_client.publish(MQTT_TOPIC, command)
+    if mqtt_transport.publish(command):
         print(f"MQTT 명령 전송: {command}")
-    except Exception as e:
-        print(f"MQTT 명령 전송 오류: {e}")
-
-# ===== 음성 인식 함수 =====
-def listen_command():
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("🎤 음성 입력 대기 중...")
-        audio = r.listen(source)
-    try:
-        text = r.recognize_google(audio, language='ko-KR')
-        print(f"🎿 인식된 텍스트: {text}")
-        return text
-    except sr.UnknownValueError:
-        return "인식 실패"
-    except sr.RequestError as e:
-        return f"API 오류: {e}"
-
-# ===== 문장 임베딩 함수 =====
-def get_embedding(text):
-    inputs = tokenizer(text, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**inputs, output_hidden_states=True)
-    last_hidden = outputs.hidden_states[-1]
-    sentence_embedding = torch.mean(last_hidden, dim=1).squeeze().cpu().numpy()
-    return sentence_embedding
+    else:
+        print(f"MQTT 연결 대기 중, 명령 보관: {command}")
 
 # ===== 명령 템플릿과 임베딩 =====
 command_templates = {
-    "save": "저장 롯데카드 1 저장 삼성카드 2번 저장 민증 3",
-    "delete": "삭제 롯데카드 삭제 민증 삭제 삼성카드",
-    "move": "롯데카드 민증 삼성카드 이동"
+    "save": ["저장 롯데카드 1", "저장 삼성카드 2번", "저장 민증 3"],
+    "delete": ["삭제 롯데카드", "삭제 민증", "삭제 삼성카드"],
+    "move": ["롯데카드", "민증", "삼성카드", "이동"]
 }
-command_embeddings = {k: get_embedding(v) for k, v in command_templates.items()}
+classifier = make_classifier(command_templates)
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+# ===== 음성 인식 함수 =====
+# 말하는 도중의 부분 결과로 임베딩을 미리 계산 → 말이 끝나면 바로 분류
+def listen_command():
+    return speech_stream.listen_command(on_partial=classifier.prefetch)
 
 # ===== 명령 분류 함수 =====
 def classify_command(text):
-    keywords = {"save": "저장", "delete": "삭제", "move": "이동"}
-    for intent, keyword in keywords.items():
-        if keyword in text:
-            return intent
-
-    emb = get_embedding(text)
-    sims = {cmd: cosine_similarity(emb, command_embeddings[cmd]) for cmd in command_embeddings}
-    best_cmd = max(sims, key=sims.get)
-    print(f"AI 분류: {best_cmd} (유사도: {sims[best_cmd]:.3f})")
-    return best_cmd
+    return classifier.classify(text)
 
 # ===== 명령 처리 함수 =====
+@metrics.timer("command")
 def process_text_command(text):
-    cmd_type = classify_command(text)
-
-    if cmd_type == "save":
-        content = text.replace("저장", "").strip()
-        slot_num_match = re.search(r'(\d+)', content)
-        if not slot_num_match:
-            speak("슬롯 번호가 인식되지 않았습니다.")
-            return
-        slot_num = int(slot_num_match.group(1))
-        slot_name = content[:slot_num_match.start()].strip()
-        if not slot_name:
-            speak("슬롯 이름이 인식되지 않았습니다.")
-            return
-        slot_name = find_canonical_name(slot_name)
-        slots[slot_name] = slot_num
-        send_esp32_command(f"M{slot_num * 1000};")
-        speak(f"{slot_name} 슬롯을 {slot_num}번 위치에 저장했습니다.")
-        time.sleep(1)
-        send_esp32_command(f"R{slot_num * 1000};")
-        speak("카드가 정상적으로 보관되었습니다. 설정이 완료되었습니다!")
-
-    elif cmd_type == "delete":
-        slot_name = text.replace("삭제", "").strip()
-        slot_name = find_canonical_name(slot_name)
-        if slot_name in slots:
-            del slots[slot_name]
-            speak(f"{slot_name} 슬롯을 삭제했습니다.")
-        else:
-            speak(f"{slot_name} 슬롯이 없습니다.")
-
-    elif cmd_type == "move":
-        slot_name = find_canonical_name(text.strip())
-        if slot_name in slots:
-            pos = slots[slot_name]
-            send_esp32_command(f"M{pos * 1000};")
-            speak(f"{slot_name} 슬롯으로 이동합니다.")
-        else:
-            speak("해당 슬롯이 없습니다. 다시 말씀해 주세요.")
-    else:
+    # 문장 하나에 여러 카드가 있으면 ("롯데카드 1 삼성카드 2 저장") 카드마다 처리
+    commands = parse_command(text, classify=classify_command)
+    if not commands:
         speak("명령을 이해하지 못했습니다.")
+        return
+
+    # 모터 동작은 프레임 하나에 모아서 마지막에 MQTT 메시지 한 번으로 보낸다
+    frame = MotorFrame()
+    saved = False
+    for cmd in commands:
+        slot_name = cmd.card or ""
+
+        if cmd.intent == "save":
+            if cmd.slot is None:
+                speak("슬롯 번호가 인식되지 않았습니다.")
+                continue
+            if not slot_name:
+                speak("슬롯 이름이 인식되지 않았습니다.")
+                continue
+            slot_num = cmd.slot
+            try:
+                slots[slot_name] = slot_num
+            except SlotError as e:
+                speak(str(e))
+                continue
+            frame.save(slot_num)
+            saved = True
+            speak(f"{slot_name} 슬롯을 {slot_num}번 위치에 저장했습니다.")
+
+        elif cmd.intent == "delete":
+            if slot_name in slots:
+                del slots[slot_name]
+                speak(f"{slot_name} 슬롯을 삭제했습니다.")
+            else:
+                speak(f"{slot_name} 슬롯이 없습니다.")
+
+        elif cmd.intent == "move":
+            if slot_name in slots:
+                pos = slots[slot_name]
+                frame.move(pos)
+                speak(f"{slot_name} 슬롯으로 이동합니다.")
+            else:
+                speak("해당 슬롯이 없습니다. 다시 말씀해 주세요.")
+
+    if frame:
+        frame.flush(send_esp32_command)
+    if saved:
+        speak("카드가 정상적으로 보관되었습니다. 설정이 완료되었습니다!")
 
 # ===== Flask 라우터 =====
 @app.route("/")
@@ -171,14 +116,43 @@ def listen():
         print(f"받은 음성 명령: {text}")
         if text == "인식 실패" or text.startswith("API 오류"):
             speak("음성 인식에 실패했습니다. 다시 시도해 주세요.")
-            return
+            return {"text": text, "recognized": False}
         process_text_command(text)
-    threading.Thread(target=worker).start()
-    return jsonify({"status": "listening..."})
+        return {"text": text, "recognized": True}
+    try:
+        job = voice_jobs.submit(worker)
+    except JobQueueFullError as e:
+        return jsonify({"status": "busy", "error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify({"status": "listening...", "job_id": job["id"], "position": job["position"]}), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = voice_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "없는 작업 id (끝난 지 오래되어 지워졌을 수 있음)"}), 404
+    return jsonify(job)
+
+@app.before_request
+def warmup_model():
+    # 첫 요청이 들어오면 백그라운드에서 모델 로딩 시작 (gunicorn 워커 포함)
+    start_warmup()
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "model": model_status(), "model_ready": is_model_ready(),
+                    "voice_jobs": voice_jobs.stats()})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/slots")
 def get_slots():
-    return jsonify(slots)
+    status, body, headers = slots_feed.respond(request.args.get("since"), request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
 
 if __name__ == "__main__":
+    # debug 리로더의 감시 프로세스는 요청을 받지 않으므로 실제 서버 프로세스에서만 워밍업
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warmup()
     app.run(debug=True)
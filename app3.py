@@ -1,20 +1,23 @@
-from flask import Flask, jsonify, render_template
-import threading
-from slot_manager import process_text_command, slots
-from tts import speak
-import speech_recognition as sr
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+import os
+from slot_manager import process_text_command, slots, prerender_prompts
+from slots_feed import SlotsFeed
+from event_hub import EventHub, parse_event_id
+from device_transport import transport
+import tts
+from tts import speak, PRIORITY_HIGH
+from model import start_warmup, is_model_ready, model_status
+from voice_jobs import VoiceJobs, JobQueueFullError
+from speech_stream import listen_command
+import metrics
 
 app = Flask(__name__)
-
-def listen_command():
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("🎤 음성 입력 대기 중...")
-        audio = r.listen(source)
-    try:
-        return r.recognize_google(audio, language='ko-KR')
-    except:
-        return "인식 실패"
+voice_jobs = VoiceJobs()
+slots_feed = SlotsFeed(slots)
+# 웹 UI 로 슬롯 변경과 음성 안내 문구를 바로 알린다 (/events)
+event_hub = EventHub()
+event_hub.follow_slots(slots_feed)
+tts.worker.add_listener(lambda text: event_hub.publish("tts", {"text": text}))
 
 @app.route("/")
 def index():
@@ -26,15 +29,53 @@ def listen():
         text = listen_command()
         print(f"받은 명령어: {text}")
         if text == "인식 실패":
-            speak("음성 인식 실패")
-            return
+            speak("음성 인식 실패", PRIORITY_HIGH)
+            return {"text": text, "recognized": False}
         process_text_command(text)
-    threading.Thread(target=worker).start()
-    return jsonify({"status": "listening"})
+        return {"text": text, "recognized": True}
+    try:
+        job = voice_jobs.submit(worker)
+    except JobQueueFullError as e:
+        return jsonify({"status": "busy", "error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify({"status": "listening", "job_id": job["id"], "position": job["position"]}), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = voice_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "없는 작업 id (끝난 지 오래되어 지워졌을 수 있음)"}), 404
+    return jsonify(job)
+
+@app.before_request
+def warmup_model():
+    # 첫 요청이 들어오면 백그라운드에서 모델 로딩 + 안내 음성 미리 합성 (gunicorn 워커 포함)
+    start_warmup()
+    prerender_prompts()
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "model": model_status(), "model_ready": is_model_ready(),
+                    "device_transport": transport.stats(), "voice_jobs": voice_jobs.stats()})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/slots")
 def get_slots():
-    return jsonify(slots)
+    status, body, headers = slots_feed.respond(request.args.get("since"), request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+@app.route("/events")
+def events():
+    return Response(
+        stream_with_context(event_hub.stream(parse_event_id(request.headers.get("Last-Event-ID")))),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 if __name__ == "__main__":
+    # debug 리로더의 감시 프로세스는 요청을 받지 않으므로 실제 서버 프로세스에서만 워밍업
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warmup()
     app.run(debug=True)
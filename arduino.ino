@@ -5,8 +5,37 @@
 // WiFi 설정
 const char* ssid = "admin";
 const char* password = "123456789";
-const char* commandUrl = "https://voicecardwallet.r-e.kr/command";
+// 롱폴링: 서버가 명령이 생기거나 25초가 지날 때까지 응답을 붙잡아둔다
+const char* commandUrl = "https://voicecardwallet.r-e.kr/command?wait=25";
 const char* ackUrl = "https://voicecardwallet.r-e.kr/ack";
+// 서버는 지갑마다 명령 큐를 따로 둔다
+const char* deviceId = "default";
+
+const int httpTimeoutMs = 30000;  // 롱폴링 대기(25초)보다 길게
+const int retryDelayMs = 5000;    // 실패했을 때만 쉬었다가 다시 요청
+
+// 연결을 재사용해서 요청마다 TLS 핸드셰이크를 하지 않도록 전역으로 둔다
+HTTPClient http;
+
+// 마지막으로 실행한 명령 (epoch, seq). 같은 명령이 다시 오면 (ack 유실 후 재전송) 실행하지 않고 ack 만 다시 보낸다
+// epoch 는 서버가 재시작할 때마다 바뀐다
+long lastEpoch = 0;
+long lastSeq = 0;
+
+void sendAck(long seq) {
+  http.begin(ackUrl);
+  http.addHeader("Content-Type", "application/json");
+
+  StaticJsonDocument<128> ackDoc;
+  ackDoc["ack"] = true;
+  ackDoc["seq"] = seq;
+  ackDoc["device"] = deviceId;
+  String ackPayload;
+  serializeJson(ackDoc, ackPayload);
+  int ackCode = http.POST(ackPayload);
+  Serial.printf("ACK 전송 결과: %d\n", ackCode);
+  http.end();
+}
 
 // 핀 설정
 const int buzzerPin = 25;
@@ -54,12 +83,54 @@ void runMotorForward() {
   delay(500);
 }
 
-// 명령 처리
-void handleCommand(String cmd) {
-  if (cmd == "l" || cmd == "r" || cmd == "s") {
+// 짧게 역방향으로 돌려서 카드를 놓기
+void runMotorRelease() {
+  Serial.println(">> 카드 놓기");
+  digitalWrite(motorPinA1, LOW);
+  ledcWrite(pwmChannel2, 250);
+  delay(500);
+
+  ledcWrite(pwmChannel2, 0);
+  digitalWrite(motorPinA2, LOW);
+  delay(500);
+}
+
+// 단계 하나 처리: r/s/l (배출), M<위치> (이동), R<위치> (놓기), W<ms> (대기)
+void handleStep(String step) {
+  step.trim();
+  if (step.length() == 0) {
+    return;
+  }
+  if (step == "l" || step == "r" || step == "s") {
     runMotorForward();
+    return;
+  }
+
+  char op = step.charAt(0);
+  long arg = step.substring(1).toInt();
+  if (op == 'M') {
+    Serial.printf(">> 이동: %ld\n", arg);
+    runMotorForward();
+  } else if (op == 'R') {
+    Serial.printf(">> 놓기: %ld\n", arg);
+    runMotorRelease();
+  } else if (op == 'W') {
+    delay(arg);
   } else {
-    Serial.println(">> 알 수 없는 명령: " + cmd);
+    Serial.println(">> 알 수 없는 명령: " + step);
+  }
+}
+
+// 명령 처리: "M3000;W1000;R3000;" 처럼 ';' 로 이어진 프레임을 순서대로 실행 (단일 명령도 그대로 동작)
+void handleCommand(String cmd) {
+  int start = 0;
+  while (start < (int)cmd.length()) {
+    int end = cmd.indexOf(';', start);
+    if (end < 0) {
+      end = cmd.length();
+    }
+    handleStep(cmd.substring(start, end));
+    start = end + 1;
   }
 }
 
@@ -81,51 +152,52 @@ void setup() {
     Serial.print(".");
   }
   Serial.println("WiFi 연결 완료!");
+
+  http.setReuse(true);
+  http.setTimeout(httpTimeoutMs);
 }
 
 void loop() {
-  if (WiFi.status() == WL_CONNECTED) {
-    HTTPClient http;
-    http.begin(commandUrl);
-    
-    int httpCode = http.GET();
-    if (httpCode > 0) {
-      String payload = http.getString();
-      Serial.println("서버 응답: " + payload);
-
-      StaticJsonDocument<200> doc;
-      DeserializationError error = deserializeJson(doc, payload);
-      if (!error) {
-        const char* command = doc["command"];
-        if (command && String(command) != "none") {
-          Serial.println("받은 명령: " + String(command));
-
-          buzz(500);
-          handleCommand(command);
-
-          // ACK 전송
-          HTTPClient ackHttp;
-          ackHttp.begin(ackUrl);
-          ackHttp.addHeader("Content-Type", "application/json");
-
-          StaticJsonDocument<100> ackDoc;
-          ackDoc["ack"] = true;
-          String ackPayload;
-          serializeJson(ackDoc, ackPayload);
-          int ackCode = ackHttp.POST(ackPayload);
-          Serial.printf("ACK 전송 결과: %d\n", ackCode);
-          ackHttp.end();
-        }
-      } else {
-        Serial.println("JSON 파싱 실패");
-      }
-    } else {
-      Serial.printf("HTTP 요청 실패, 코드: %d\n", httpCode);
-    }
-    http.end();
-  } else {
+  if (WiFi.status() != WL_CONNECTED) {
     Serial.println("WiFi 연결 끊김");
+    delay(retryDelayMs);
+    return;
   }
 
-  delay(5000);
+  http.begin(String(commandUrl) + "&device=" + deviceId + "&after=" + String(lastSeq));
+  int httpCode = http.GET();
+  if (httpCode <= 0) {
+    Serial.printf("HTTP 요청 실패, 코드: %d\n", httpCode);
+    http.end();
+    delay(retryDelayMs);
+    return;
+  }
+
+  String payload = http.getString();
+  http.end();
+
+  StaticJsonDocument<512> doc;  // 여러 단계가 묶인 프레임도 들어가도록
+  DeserializationError error = deserializeJson(doc, payload);
+  if (error) {
+    Serial.println("JSON 파싱 실패");
+    delay(retryDelayMs);
+    return;
+  }
+
+  const char* command = doc["command"];
+  if (command && String(command) != "none") {
+    long seq = doc["seq"] | 0L;
+    long epoch = doc["epoch"] | 0L;
+    if (seq != 0 && seq == lastSeq && epoch == lastEpoch) {
+      Serial.printf("이미 실행한 명령 (seq %ld), ACK 만 다시 보냄\n", seq);
+    } else {
+      Serial.println("받은 명령: " + String(command));
+      buzz(500);
+      handleCommand(command);
+      lastEpoch = epoch;
+      lastSeq = seq;
+    }
+    sendAck(seq);
+  }
+  // 명령이 없었으면 (롱폴링 타임아웃) 쉬지 않고 바로 다시 기다린다
 }
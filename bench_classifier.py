@@ -0,0 +1,112 @@
+"""
+분류기 백엔드 벤치마크: 지연시간(p50/p99), 메모리(최대 RSS), KoGPT2 임베딩 경로와의 일치율.
+
+    python bench_classifier.py --corpus data/bench_utterances.txt --backends embedding ngram
+
+백엔드마다 별도 프로세스에서 측정해서 메모리가 서로 섞이지 않게 한다.
+키워드 빠른 경로는 끄고 모델 경로만 측정한다.
+"""
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # 리눅스는 KB, macOS 는 바이트 단위
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def run_worker(backend, corpus, repeat):
+    from command_classifier import command_templates, make_classifier
+    import model
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        clf = make_classifier(command_templates, backend=backend, keywords={}, min_score=0, min_margin=0)
+        clf.classify_batch([corpus[0]])
+    load_s = time.perf_counter() - start
+
+    cold, warm = [], []
+    predictions = []
+    for r in range(repeat):
+        for text in corpus:
+            if backend == "embedding" and r == 0:
+                model.embedding_service.clear()  # 캐시 없이 forward 를 매번 수행
+            t = time.perf_counter()
+            result = clf.classify_batch([text])[0]
+            (cold if r == 0 else warm).append(time.perf_counter() - t)
+            if r == 0:
+                predictions.append(result.intent)
+
+    t = time.perf_counter()
+    clf.classify_batch(corpus)
+    batch_s = time.perf_counter() - t
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "p50_ms": percentile_ms(cold, 50),
+        "p99_ms": percentile_ms(cold, 99),
+        "warm_p50_ms": percentile_ms(warm, 50),
+        "batch_ms_per_item": batch_s / len(corpus) * 1000,
+        "max_rss_mb": max_rss_mb(),
+        "predictions": predictions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="분류기 백엔드 벤치마크")
+    parser.add_argument("--corpus", default="data/bench_utterances.txt")
+    parser.add_argument("--backends", nargs="+", default=["embedding", "ngram"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, corpus, args.repeat), ensure_ascii=False))
+        return
+
+    results = {}
+    for backend in args.backends:
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", backend, "--corpus", args.corpus, "--repeat", str(args.repeat)],
+            capture_output=True, text=True, encoding="utf-8",
+        )
+        if out.returncode != 0:
+            print(f"[{backend}] 실패:\n{out.stderr}")
+            continue
+        results[backend] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"코퍼스: {args.corpus} ({len(corpus)}문장)")
+    print(f"{'backend':<10} {'load(s)':>8} {'p50(ms)':>8} {'p99(ms)':>8} {'warm p50':>9} {'batch/item':>11} {'RSS(MB)':>8} {'일치율':>7}")
+    reference = results.get("embedding", {}).get("predictions")
+    for backend, r in results.items():
+        if reference:
+            agreement = np.mean([a == b for a, b in zip(r["predictions"], reference)])
+            agreement = f"{agreement:.1%}"
+        else:
+            agreement = "-"
+        rss = f"{r['max_rss_mb']:.0f}" if r["max_rss_mb"] is not None else "-"
+        print(f"{backend:<10} {r['load_s']:>8.2f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['warm_p50_ms']:>9.3f} {r['batch_ms_per_item']:>11.3f} {rss:>8} {agreement:>7}")
+
+
+if __name__ == "__main__":
+    main()
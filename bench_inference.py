@@ -0,0 +1,101 @@
+"""
+KoGPT2 CPU 추론 모드 벤치마크: 문장 하나 임베딩 지연시간(p50/p99), 최대 RSS, 기존 경로와의 분류 일치율.
+
+    python bench_inference.py --threads 1
+    python bench_inference.py --modes legacy base base-int8 base-L6-int8
+
+모드마다 환경변수(CALLET_MODEL_*)를 바꿔서 별도 프로세스로 측정한다.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from bench_classifier import max_rss_mb
+
+MODES = {
+    "legacy": {"CALLET_MODEL_HEAD": "lm"},
+    "base": {"CALLET_MODEL_HEAD": "base"},
+    "base-int8": {"CALLET_MODEL_HEAD": "base", "CALLET_MODEL_QUANTIZE": "int8"},
+    "base-L6": {"CALLET_MODEL_HEAD": "base", "CALLET_MODEL_LAYERS": "6"},
+    "base-L6-int8": {"CALLET_MODEL_HEAD": "base", "CALLET_MODEL_LAYERS": "6", "CALLET_MODEL_QUANTIZE": "int8"},
+}
+
+
+def run_worker(corpus, repeat):
+    import model
+    from command_classifier import command_templates, TemplateClassifier
+
+    start = time.perf_counter()
+    model.load_model()
+    load_s = time.perf_counter() - start
+
+    model.encode_batch([corpus[0]])  # 첫 호출 워밍업
+    latencies = []
+    for _ in range(repeat):
+        for text in corpus:
+            # 캐시를 거치지 않고 forward 만 측정
+            t = time.perf_counter()
+            model.encode_batch([text])
+            latencies.append(time.perf_counter() - t)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        clf = TemplateClassifier(command_templates, keywords={}, min_score=0, min_margin=0)
+        predictions = [r.intent for r in clf.classify_batch(corpus)]
+
+    return {
+        "mode": model.inference_mode(),
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "max_rss_mb": max_rss_mb(),
+        "predictions": predictions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KoGPT2 추론 모드 벤치마크")
+    parser.add_argument("--corpus", default="data/bench_utterances.txt")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--threads", type=int, default=0, help="CALLET_TORCH_THREADS (0 이면 기본값)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+
+    if args.worker:
+        print(json.dumps(run_worker(corpus, args.repeat), ensure_ascii=False))
+        return
+
+    results = {}
+    for name in args.modes:
+        env = dict(os.environ, **MODES[name], CALLET_TORCH_THREADS=str(args.threads))
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", "--corpus", args.corpus, "--repeat", str(args.repeat)],
+            capture_output=True, text=True, encoding="utf-8", env=env,
+        )
+        if out.returncode != 0:
+            print(f"[{name}] 실패:\n{out.stderr}")
+            continue
+        results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"코퍼스: {args.corpus} ({len(corpus)}문장 x {args.repeat}회), threads={args.threads or 'default'}")
+    print(f"{'mode':<14} {'load(s)':>8} {'p50(ms)':>8} {'p99(ms)':>8} {'RSS(MB)':>8} {'일치율':>7}")
+    reference = results.get("legacy", {}).get("predictions")
+    for name, r in results.items():
+        if reference:
+            agreement = f"{np.mean([a == b for a, b in zip(r['predictions'], reference)]):.1%}"
+        else:
+            agreement = "-"
+        rss = f"{r['max_rss_mb']:.0f}" if r["max_rss_mb"] is not None else "-"
+        print(f"{name:<14} {r['load_s']:>8.2f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {rss:>8} {agreement:>7}")
+
+
+if __name__ == "__main__":
+    main()
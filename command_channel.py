@@ -0,0 +1,315 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+# 롱폴링으로 한 번에 붙잡아둘 수 있는 최대 시간(초). ESP32 HTTP 타임아웃보다 짧아야 한다
+COMMAND_WAIT_MAX = float(os.environ.get("CALLET_COMMAND_WAIT_MAX", "25"))
+# SSE 연결이 프록시에서 끊기지 않도록 보내는 keep-alive 주기(초)
+SSE_KEEPALIVE = float(os.environ.get("CALLET_SSE_KEEPALIVE", "15"))
+# 지갑 하나에 쌓아둘 수 있는 최대 명령 수 (넘으면 set_command 가 429)
+COMMAND_QUEUE_MAX = int(os.environ.get("CALLET_COMMAND_QUEUE_MAX", "16"))
+# 보낸 명령의 ack 를 기다리는 시간(초). 지나면 같은 seq 로 다시 보낸다
+COMMAND_ACK_TIMEOUT = float(os.environ.get("CALLET_COMMAND_ACK_TIMEOUT", "30"))
+# 이만큼 보내도 ack 가 없으면 그 명령은 버리고 다음 명령으로 넘어간다
+COMMAND_MAX_ATTEMPTS = int(os.environ.get("CALLET_COMMAND_MAX_ATTEMPTS", "5"))
+# device 를 지정하지 않은 요청이 쓰는 지갑 id (지갑이 하나뿐인 기존 구성)
+DEFAULT_DEVICE = os.environ.get("CALLET_DEVICE_ID", "default")
+
+NO_COMMAND = {"command": "none"}
+
+# device id = 지갑 id. 요청마다 큐가 새로 생기고 파일 이름에도 쓰이므로 글자와 길이를 제한한다
+_WALLET_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class InvalidWalletError(ValueError):
+    def __init__(self, wallet_id):
+        super().__init__(f"잘못된 지갑 id: {wallet_id!r} (영문/숫자/-/_ 64자 이내)")
+        self.wallet_id = wallet_id
+
+
+def validate_device_id(device):
+    """device(지갑) id 를 문자열로 돌려준다. 형식이 틀리면 InvalidWalletError."""
+    device = str(device)
+    if not _WALLET_ID.fullmatch(device):
+        raise InvalidWalletError(device)
+    return device
+
+
+class QueueFullError(Exception):
+    def __init__(self, device, depth):
+        super().__init__(f"{device} 명령 큐가 가득 찼습니다 ({depth}개)")
+        self.device = device
+        self.depth = depth
+
+
+class CommandRelayError(Exception):
+    """
+    명령 큐가 있는 다른 서버로 명령을 넘기지 못함 (연결 실패, 타임아웃, 오류 응답).
+    status 는 /listen 이 돌려줄 HTTP 상태: 그 서버의 큐가 가득 찼으면 429, 나머지는 502.
+    """
+
+    def __init__(self, device, reason, status=502):
+        super().__init__(f"{device} 명령 전달 실패: {reason}")
+        self.device = device
+        self.status = status
+
+
+class DeviceWaiters:
+    """
+    지갑(device)별로 잠들어 있는 쪽의 목록. notify(device) 는 그 지갑을 기다리는 쪽만 깨운다
+    (한 지갑의 명령/이벤트가 다른 지갑의 롱폴링/SSE 연결까지 모두 깨우지 않도록).
+    스레드는 lock 을 같이 쓰는 Condition 으로, asyncio 쪽은 이벤트 루프의 Future 로 잠든다.
+    wait/register/notify 는 lock 을 잡은 채로 부른다. 확인과 등록이 한 잠금 안이라 그 사이의 notify 를 놓치지 않는다.
+    """
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._waiters = {}  # device → {Condition 또는 Future}
+
+    def _discard(self, device, waiter):
+        waiters = self._waiters.get(device)
+        if waiters is not None:
+            waiters.discard(waiter)
+            if not waiters:
+                del self._waiters[device]
+
+    def wait(self, device, timeout):
+        """스레드: notify(device) 또는 timeout 초까지 잠든다 (자는 동안만 lock 을 놓는다)."""
+        cond = threading.Condition(self._lock)
+        self._waiters.setdefault(device, set()).add(cond)
+        try:
+            cond.wait(timeout)
+        finally:
+            self._discard(device, cond)
+
+    def register(self, device):
+        """asyncio: notify(device) 때 끝나는 Future. lock 을 놓은 뒤 async_wait 로 기다린다."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(device, set()).add(future)
+        return future
+
+    async def async_wait(self, device, future, timeout):
+        """register 로 받은 future 를 timeout 초까지 기다린다. lock 을 잡지 않은 채로 부른다."""
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._discard(device, future)
+
+    def notify(self, device):
+        for waiter in self._waiters.pop(device, ()):
+            if isinstance(waiter, asyncio.Future):
+                # notify 는 다른 스레드(분류 작업)에서도 불리므로 Future 는 자기 이벤트 루프에서 완료
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+            else:
+                waiter.notify()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _DeviceQueue:
+    """지갑 하나의 FIFO 명령 큐. 맨 앞 명령만 전달하고, ack 되면 다음 명령으로 넘어간다."""
+
+    def __init__(self):
+        self.seq = 0            # 마지막으로 발급한 seq (지갑별로 단조 증가)
+        self.items = deque()    # {"command": ..., "seq": ...}
+        self.sent_at = None     # 맨 앞 명령을 마지막으로 보낸 시각
+        self.attempts = 0       # 맨 앞 명령을 보낸 횟수
+
+    def pop_head(self):
+        self.items.popleft()
+        self.sent_at = None
+        self.attempts = 0
+
+
+class CommandChannel:
+    """
+    서버 → ESP32 명령 전달 창구. 지갑(device id)마다 FIFO 큐를 두고, 명령마다 seq 를 붙인다.
+    기다리는 쪽(롱폴링/SSE)은 자기 지갑에 명령이 들어오거나 ack 타임아웃으로 다시 보낼 때가 되면 깨어난다.
+    ESP32 는 이미 실행한 (epoch, seq) 를 다시 받으면 실행하지 않고 ack 만 다시 보낸다.
+    epoch 는 서버가 뜰 때마다 바뀌어서, 재시작 후 seq 가 1 부터 다시 시작해도 중복으로 오인하지 않는다.
+    """
+
+    def __init__(self, max_depth=COMMAND_QUEUE_MAX, ack_timeout=COMMAND_ACK_TIMEOUT,
+                 max_attempts=COMMAND_MAX_ATTEMPTS):
+        self.max_depth = max_depth
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.epoch = int(time.time())
+        self._lock = threading.Lock()
+        self._waiters = DeviceWaiters(self._lock)
+        self._queues = {}
+
+    def _queue(self, device):
+        queue = self._queues.get(device)
+        if queue is None:
+            queue = self._queues[validate_device_id(device)] = _DeviceQueue()
+        return queue
+
+    def _check_depth(self, queue, device):
+        # self._lock 을 잡은 채로 호출
+        if len(queue.items) >= self.max_depth:
+            raise QueueFullError(device, len(queue.items))
+
+    def check_capacity(self, device=DEFAULT_DEVICE):
+        """명령을 하나 더 넣을 자리가 없으면 QueueFullError (슬롯을 바꾸기 전에 미리 확인할 때)."""
+        with self._lock:
+            self._check_depth(self._queue(device), device)
+
+    def publish(self, command, device=DEFAULT_DEVICE):
+        with self._lock:
+            queue = self._queue(device)
+            self._check_depth(queue, device)
+            queue.seq += 1
+            message = {"command": command, "seq": queue.seq, "epoch": self.epoch}
+            queue.items.append(message)
+            self._waiters.notify(device)
+            return message
+
+    def current(self, device=DEFAULT_DEVICE):
+        with self._lock:
+            queue = self._queues.get(device)
+            return queue.items[0] if queue and queue.items else NO_COMMAND
+
+    def depth(self, device=DEFAULT_DEVICE):
+        with self._lock:
+            queue = self._queues.get(device)
+            return len(queue.items) if queue else 0
+
+    def _next(self, queue, after_seq, now):
+        """
+        지금 보낼 명령, 없으면 (None, 다시 확인할 시각).
+        after_seq 까지 이미 받은 쪽에는 ack_timeout 이 지나야 같은 명령을 다시 보낸다.
+        after_seq 가 0 이면 (기존 폴링) ack 전까지 맨 앞 명령을 매번 준다.
+        """
+        while queue.items:
+            head = queue.items[0]
+            if after_seq and head["seq"] <= after_seq and queue.sent_at is not None:
+                retry_at = queue.sent_at + self.ack_timeout
+                if now < retry_at:
+                    return None, retry_at
+            if queue.attempts >= self.max_attempts:
+                print(f"⚠️ ack 없음, 명령 버림: {head} ({queue.attempts}회 전송)")
+                queue.pop_head()
+                continue
+            return head, None
+        return None, None
+
+    def _take(self, device, after_seq):
+        """(보낼 명령 또는 None, 다시 확인할 시각). self._lock 을 잡은 채로 호출."""
+        queue = self._queue(device)
+        if after_seq > queue.seq:
+            # 서버가 재시작되어 seq 가 처음부터 다시 시작된 경우
+            after_seq = 0
+        now = time.monotonic()
+        message, retry_at = self._next(queue, after_seq, now)
+        if message is not None:
+            queue.sent_at = now
+            queue.attempts += 1
+        return message, retry_at
+
+    def wait(self, timeout, after_seq=0, device=DEFAULT_DEVICE):
+        """보낼 명령이 생길 때까지 최대 timeout 초 기다린다. 없으면 NO_COMMAND."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                message, retry_at = self._take(device, after_seq)
+                if message is not None:
+                    return message
+                now = time.monotonic()
+                remaining = deadline - now
+                if remaining <= 0:
+                    return NO_COMMAND
+                if retry_at is not None:
+                    remaining = min(remaining, retry_at - now)
+                self._waiters.wait(device, remaining)
+
+    def ack(self, seq=None, device=DEFAULT_DEVICE):
+        """
+        맨 앞 명령을 완료 처리하고 다음 명령으로 넘어간다.
+        seq 를 주면 그 명령일 때만 (이미 ack 된 seq 가 다시 오면 무시), 없으면 맨 앞 명령.
+        """
+        with self._lock:
+            queue = self._queues.get(device)
+            if not queue or not queue.items:
+                return False
+            if seq is not None and queue.items[0]["seq"] != seq:
+                return False
+            queue.pop_head()
+            self._waiters.notify(device)
+            return True
+
+    def stream(self, after_seq=0, device=DEFAULT_DEVICE, keepalive=SSE_KEEPALIVE):
+        """
+        text/event-stream 본문 생성기. 새 명령(과 ack 타임아웃 재전송)마다 event 하나,
+        조용할 때는 keep-alive 주석. after_seq 는 재연결 시 Last-Event-ID.
+        """
+        last_seq = after_seq
+        while True:
+            message = self.wait(keepalive, after_seq=last_seq, device=device)
+            if message is NO_COMMAND:
+                yield ": keep-alive\n\n"
+                continue
+            last_seq = message["seq"]
+            yield _sse_event(message)
+
+
+def _sse_event(message):
+    return f"id: {message['seq']}\nevent: command\ndata: {json.dumps(message)}\n\n"
+
+
+class AsyncCommandChannel(CommandChannel):
+    """
+    asyncio 서버용. 큐와 재전송 규칙은 CommandChannel 과 같고, 기다리는 쪽만 스레드 대신
+    이벤트 루프의 Future 로 잠든다. publish/ack 는 다른 스레드(분류 작업)에서 불러도 된다.
+    """
+
+    async def async_wait(self, timeout, after_seq=0, device=DEFAULT_DEVICE):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                message, retry_at = self._take(device, after_seq)
+                if message is not None:
+                    return message
+                now = time.monotonic()
+                remaining = deadline - now
+                if remaining <= 0:
+                    return NO_COMMAND
+                future = self._waiters.register(device)
+            if retry_at is not None:
+                remaining = min(remaining, retry_at - now)
+            await self._waiters.async_wait(device, future, remaining)
+
+    async def async_stream(self, after_seq=0, device=DEFAULT_DEVICE, keepalive=SSE_KEEPALIVE):
+        last_seq = after_seq
+        while True:
+            message = await self.async_wait(keepalive, after_seq=last_seq, device=device)
+            if message is NO_COMMAND:
+                yield ": keep-alive\n\n"
+                continue
+            last_seq = message["seq"]
+            yield _sse_event(message)
+
+
+def parse_wait(value, default=0.0):
+    """?wait= 쿼리 값을 0 ~ COMMAND_WAIT_MAX 범위의 초로."""
+    try:
+        wait = float(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+    return max(0.0, min(wait, COMMAND_WAIT_MAX))
+
+
+def parse_seq(value):
+    """?after= / Last-Event-ID 값을 seq 로 (숫자가 아니면 0)."""
+    value = str(value or "0")
+    return int(value) if value.isdigit() else 0
@@ -1,16 +1,208 @@
-from model import get_embedding, cosine_similarity
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import numpy as np
+from model import get_embedding, get_embeddings, prefetch_embedding, embedding_signature
+from template_index import load_or_build
+import metrics
 
+# 의도별 예문 (많을수록 정확, 예문 수가 늘어도 분류는 행렬곱 한 번)
 command_templates = {
-    "save": "저장해줘 카드 보관해줘 넣어줘 맡겨 저장",
-    "delete": "지워줘 삭제 필요없어 빼 삭제해줘",
-    "move": "꺼내줘 꺼내 필요해 줘 이동"
+    "save": [
+        "저장해줘", "카드 보관해줘", "넣어줘", "맡겨", "저장",
+        "롯데카드 1번에 넣어줘", "삼성카드 보관해줘", "민증 맡아줘",
+    ],
+    "delete": [
+        "지워줘", "삭제", "필요없어", "빼", "삭제해줘",
+        "롯데카드 지워줘", "민증 이제 필요없어", "삼성카드 없애줘",
+    ],
+    "move": [
+        "꺼내줘", "꺼내", "필요해", "줘", "이동",
+        "롯데카드 꺼내줘", "민증 줘", "삼성카드 필요해",
+    ],
 }
 
-command_embeddings = {k: get_embedding(v) for k, v in command_templates.items()}
+# 키워드가 있으면 모델 없이 바로 분류 (모델 로딩 전에도 즉시 응답)
+command_keywords = {"save": "저장", "delete": "삭제", "move": "이동"}
+
+# 가장 높은 유사도가 MIN_SCORE 미만이거나 2등과의 차이가 MIN_MARGIN 미만이면 거절 (None)
+INTENT_MIN_SCORE = float(os.environ.get("CALLET_INTENT_MIN_SCORE", "0"))
+INTENT_MIN_MARGIN = float(os.environ.get("CALLET_INTENT_MIN_MARGIN", "0"))
+
+# 분류기 백엔드: embedding (KoGPT2 임베딩) | ngram (가벼운 문자 n-gram 선형 모델)
+CLASSIFIER_BACKEND = os.environ.get("CALLET_CLASSIFIER_BACKEND", "embedding")
+
+# intent: 최종 분류 (거절 시 None), ranking: [(intent, score), ...] 높은 순
+Classification = namedtuple("Classification", ["intent", "score", "margin", "ranking", "source"])
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _normalized_embeddings(texts):
+    return _normalize_rows(get_embeddings(texts))
+
+
+class IntentClassifier(ABC):
+    """
+    분류기 백엔드 공통 부분: 키워드 빠른 경로, top-k / 차이 계산, 거절 임계값.
+    백엔드는 intents 와 _intent_scores(texts) → (문장 수, 의도 수) 점수 행렬만 구현하면 된다.
+    """
+
+    source = "model"
+
+    def __init__(self, keywords=command_keywords,
+                 min_score=INTENT_MIN_SCORE, min_margin=INTENT_MIN_MARGIN):
+        self.keywords = keywords
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+    @property
+    @abstractmethod
+    def intents(self):
+        """점수 행렬의 열 순서와 같은 의도 이름 목록."""
+
+    @abstractmethod
+    def _intent_scores(self, texts):
+        """(문장 수, 의도 수) 점수 행렬."""
+
+    def _keyword_intent(self, text):
+        for intent, keyword in self.keywords.items():
+            if keyword in text:
+                return intent
+        return None
+
+    def _decide(self, scores, top_k):
+        intents = self.intents
+        order = np.argsort(-scores)
+        best = scores[order[0]]
+        margin = best - scores[order[1]] if len(order) > 1 else best
+        ranking = [(intents[i], float(scores[i])) for i in order[:top_k]]
+        intent = intents[order[0]]
+        if best < self.min_score or margin < self.min_margin:
+            intent = None
+        return Classification(intent, float(best), float(margin), ranking, self.source)
+
+    @metrics.timer("classify")
+    def classify_topk(self, text, top_k=3):
+        intent = self._keyword_intent(text)
+        if intent is not None:
+            return Classification(intent, 1.0, 1.0, [(intent, 1.0)], "keyword")
+
+        result = self._decide(self._intent_scores([text])[0], top_k)
+        print(f"AI 분류: {result.intent} (유사도: {result.score:.3f}, 차이: {result.margin:.3f})")
+        return result
+
+    def classify_batch(self, texts, top_k=3):
+        results = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            intent = self._keyword_intent(text)
+            if intent is not None:
+                results[i] = Classification(intent, 1.0, 1.0, [(intent, 1.0)], "keyword")
+            else:
+                pending.append(i)
+
+        if pending:
+            scores = self._intent_scores([texts[i] for i in pending])
+            for row, i in enumerate(pending):
+                results[i] = self._decide(scores[row], top_k)
+        return results
+
+    def classify(self, text):
+        return self.classify_topk(text).intent
+
+    def prefetch(self, text):
+        """음성 인식 부분 결과가 나올 때 불린다. 최종 분류 때 쓸 것을 미리 계산해 두는 백엔드만 구현."""
+
+
+class TemplateClassifier(IntentClassifier):
+    """
+    KoGPT2 임베딩 백엔드: 의도별 예문 임베딩과의 코사인 유사도로 분류한다.
+    예문 임베딩은 정규화된 하나의 행렬로 디스크 인덱스에 저장되어 있고
+    (첫 AI 분류 때 읽거나 생성), 문장 하나/여러 개를 행렬곱 한 번으로 채점한다.
+    의도 점수 = 그 의도의 예문들 중 최대 유사도.
+    """
+
+    source = "embedding"
+
+    def __init__(self, templates, **kwargs):
+        super().__init__(**kwargs)
+        self.templates = templates
+        self._matrix = None
+        self._intents = None
+        self._starts = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    index = load_or_build(self.templates, _normalized_embeddings,
+                                          embedding_signature() + "/l2")
+                    # 같은 의도의 예문은 인덱스에서 연속으로 저장됨 → 의도별 시작 위치만 기억
+                    intents, starts = [], []
+                    for i, label in enumerate(index.labels):
+                        if not intents or intents[-1] != label:
+                            intents.append(label)
+                            starts.append(i)
+                    self._intents = intents
+                    self._starts = np.array(starts)
+                    self._matrix = index.matrix
+        return self._matrix
+
+    @property
+    def intents(self):
+        self._load()
+        return self._intents
+
+    def _intent_scores(self, texts):
+        matrix = self._load()
+        if len(texts) == 1:
+            queries = get_embedding(texts[0])[None, :]
+        else:
+            queries = get_embeddings(texts)
+        # (B, D) @ (D, N) → 예문별 유사도, 의도별 최대값으로 축약 → (B, 의도 수)
+        sims = _normalize_rows(queries) @ matrix.T
+        return np.maximum.reduceat(sims, self._starts, axis=1)
+
+    def prefetch(self, text):
+        if self._keyword_intent(text) is None:
+            prefetch_embedding(text)
+
+
+def make_classifier(templates, backend=None, **kwargs):
+    """CALLET_CLASSIFIER_BACKEND 설정에 따라 분류기 백엔드를 만든다 (embedding | ngram)."""
+    backend = backend or CLASSIFIER_BACKEND
+    if backend == "ngram":
+        # n-gram 백엔드는 오프라인에서 학습한 가중치를 쓰므로 templates 는 사용하지 않음
+        # 가중치 파일이 없으면 FileNotFoundError (무거운 embedding 백엔드로 몰래 바꾸지 않는다)
+        from ngram_classifier import NgramClassifier
+        return NgramClassifier(**kwargs)
+    if backend != "embedding":
+        raise ValueError(f"알 수 없는 분류기 백엔드: {backend}")
+    return TemplateClassifier(templates, **kwargs)
+
+
+_default_classifier = None
+_default_lock = threading.Lock()
+
+
+def default_classifier():
+    """
+    command_templates 로 만든 기본 분류기. import 할 때가 아니라 처음 분류할 때 만든다
+    (ngram_classifier, train_ngram_classifier 가 이 모듈을 import 해도 분류기를 만들지 않도록).
+    """
+    global _default_classifier
+    if _default_classifier is None:
+        with _default_lock:
+            if _default_classifier is None:
+                _default_classifier = make_classifier(command_templates)
+    return _default_classifier
 
 def classify_command(text: str):
-    emb = get_embedding(text)
-    sims = {cmd: cosine_similarity(emb, command_embeddings[cmd]) for cmd in command_embeddings}
-    best_cmd = max(sims, key=sims.get)
-    print(f"AI 분류: {best_cmd} (유사도: {sims[best_cmd]:.3f})")
-    return best_cmd
+    return default_classifier().classify(text)
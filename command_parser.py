@@ -0,0 +1,116 @@
+import time
+from collections import namedtuple
+from pattern import AhoCorasick, registry, find_canonical_name
+from command_classifier import command_keywords, classify_command
+import metrics
+
+# intent: save/delete/move, card: 대표 카드 이름 (없으면 None), slot: 슬롯 번호 (없으면 None)
+# span: 이 명령에 해당하는 문장 내 위치 (start, end)
+ParsedCommand = namedtuple("ParsedCommand", ["intent", "card", "slot", "span"])
+
+# 이름 앞뒤에서 떼어낼 군더더기 ("1번 신한카드" 의 "번", 쉼표 등)
+_NAME_STRIP = " \t,.·번"
+
+
+def _build_matcher():
+    # 카드 별칭 + 명령 키워드 + 숫자를 하나의 오토마톤에 넣어서 문장을 한 번만 훑는다
+    matcher = AhoCorasick()
+    for alias, canonical in registry.canonical.items():
+        matcher.add(alias, ("card", canonical))
+    for intent, keyword in command_keywords.items():
+        matcher.add(keyword, ("intent", intent))
+    for digit in "0123456789":
+        matcher.add(digit, ("digit", digit))
+    matcher.build()
+    return matcher
+
+
+_matcher = _build_matcher()
+
+
+def tokenize(text):
+    """문장을 (종류, 값, start, end) 토큰 리스트로. 연속된 숫자는 하나의 number 토큰으로 합친다."""
+    tokens = []
+    for start, end, (kind, value) in _matcher.find_all(text):
+        if kind == "digit":
+            if tokens and tokens[-1][0] == "number" and tokens[-1][3] == start:
+                _, number, num_start, _ = tokens[-1]
+                tokens[-1] = ("number", number * 10 + int(value), num_start, end)
+                continue
+            kind, value = "number", int(value)
+        tokens.append((kind, value, start, end))
+    return tokens
+
+
+def _clean_name(fragment):
+    name = fragment.strip(_NAME_STRIP)
+    return find_canonical_name(name) if name else None
+
+
+def parse_command(text, classify=classify_command):
+    """
+    "롯데카드 1 삼성카드 2 저장" → [ParsedCommand(save, 롯데카드, 1, ...), ParsedCommand(save, 삼성카드, 2, ...)]
+    명령 키워드가 없으면 classify 로 의도를 정한다. 의도를 모르면 빈 리스트.
+    """
+    start = time.perf_counter()
+    classify_time = 0.0
+
+    def timed_classify(sentence):
+        # 분류는 따로 재므로 파싱 시간에서는 뺀다
+        nonlocal classify_time
+        t = time.perf_counter()
+        try:
+            return classify(sentence)
+        finally:
+            classify_time += time.perf_counter() - t
+
+    try:
+        return _parse(text, timed_classify)
+    finally:
+        metrics.observe("parse", time.perf_counter() - start - classify_time)
+
+
+def _parse(text, classify):
+    tokens = tokenize(text)
+
+    intent = next((value for kind, value, _, _ in tokens if kind == "intent"), None)
+    if intent is None:
+        intent = classify(text)
+        if intent is None:
+            return []
+
+    items = []       # [card, slot, start, end]
+    open_item = None  # 아직 번호가 붙지 않은 마지막 카드
+    prev_end = 0
+    for kind, value, start, end in tokens:
+        if kind == "card":
+            if items and items[-1][0] is None and items[-1][1] is not None and open_item is None \
+                    and not text[items[-1][3]:start].strip(_NAME_STRIP):
+                # "1번 롯데카드" 처럼 번호가 먼저 나온 경우 앞의 번호와 합친다
+                items[-1][0] = value
+                items[-1][3] = end
+            else:
+                open_item = [value, None, start, end]
+                items.append(open_item)
+        elif kind == "number":
+            if open_item is not None:
+                open_item[1] = value
+                open_item[3] = end
+            else:
+                # 사전에 없는 카드: 앞 토큰과 번호 사이의 글자를 이름으로 사용 ("저장 신한카드 4")
+                fragment = text[prev_end:start]
+                name_start = prev_end + len(fragment) - len(fragment.lstrip(_NAME_STRIP))
+                name = _clean_name(fragment)
+                items.append([name, value, name_start if name else start, end])
+            open_item = None
+        prev_end = end
+
+    if not items:
+        # 카드/번호가 하나도 없으면 키워드를 뺀 나머지를 이름으로 ("삭제 신한카드")
+        rest = text
+        for kind, _, start, end in reversed(tokens):
+            if kind == "intent":
+                rest = rest[:start] + " " + rest[end:]
+        return [ParsedCommand(intent, _clean_name(rest), None, (0, len(text)))]
+
+    return [ParsedCommand(intent, card, slot, (start, end)) for card, slot, start, end in items]
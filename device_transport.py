@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import metrics
+
+# ESP32/중계 서버로 보내는 HTTP 요청 설정
+DEVICE_CONNECT_TIMEOUT = float(os.environ.get("CALLET_DEVICE_CONNECT_TIMEOUT", "2"))
+DEVICE_READ_TIMEOUT = float(os.environ.get("CALLET_DEVICE_READ_TIMEOUT", "3"))
+# 연결 자체가 안 된 경우에만 다시 시도 (요청이 장치에 닿았을 수도 있는 읽기 타임아웃은 재시도하면 카드가 두 번 나옴)
+DEVICE_RETRIES = int(os.environ.get("CALLET_DEVICE_RETRIES", "2"))
+DEVICE_BACKOFF = float(os.environ.get("CALLET_DEVICE_BACKOFF", "0.2"))
+# 장치(호스트) 하나당 열어둘 keep-alive 연결 수
+DEVICE_POOL_SIZE = int(os.environ.get("CALLET_DEVICE_POOL_SIZE", "4"))
+
+# 서버 → ESP32 명령 경로: http (/set_command → ESP32 가 /command 로 가져감) | mqtt (브로커로 바로 publish)
+COMMAND_TRANSPORT = os.environ.get("CALLET_COMMAND_TRANSPORT", "http")
+
+# 호출하는 쪽에서 requests 를 따로 import 하지 않아도 되도록
+TransportError = requests.RequestException
+
+
+def _never_sent(error):
+    """연결을 맺지도 못한 실패인지 (이때만 재시도해도 명령이 두 번 실행되지 않는다)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class _HostStats:
+    def __init__(self, window=512):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=window)  # 최근 요청들의 지연시간(초), 재시도 포함
+
+    def summary(self):
+        latencies = list(self.latencies)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+            "p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else None,
+        }
+
+
+class DeviceTransport:
+    """
+    장치 호스트마다 keep-alive Session 을 하나씩 두고 재사용한다.
+    저장 명령처럼 M…/R… 를 연달아 보내도 연결(TCP/TLS)은 한 번만 맺는다.
+    """
+
+    def __init__(self, connect_timeout=DEVICE_CONNECT_TIMEOUT, read_timeout=DEVICE_READ_TIMEOUT,
+                 retries=DEVICE_RETRIES, backoff=DEVICE_BACKOFF, pool_size=DEVICE_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._stats = {}
+
+    @staticmethod
+    def _host(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+                self._stats.setdefault(host, _HostStats())
+            return session, self._stats[host]
+
+    def post(self, url, **kwargs):
+        """requests.post 와 같은 사용법. 연결 실패는 backoff 를 두고 재시도, 최종 실패는 TransportError."""
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        session, stats = self._session(self._host(url))
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    return session.request(method, url, **kwargs)
+                except requests.ConnectionError as e:
+                    if attempt >= self.retries or not _never_sent(e):
+                        raise
+                    time.sleep(self.backoff * (2 ** attempt))
+                    attempt += 1
+                    with self._lock:
+                        stats.retries += 1
+        except TransportError:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe("device_send", elapsed)
+            with self._lock:
+                stats.requests += 1
+                stats.latencies.append(elapsed)
+
+    def stats(self):
+        """호스트별 {requests, errors, retries, p50_ms, p99_ms}."""
+        with self._lock:
+            return {host: s.summary() for host, s in self._stats.items()}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+transport = DeviceTransport()
@@ -1,71 +1,35 @@
-from flask import Flask, jsonify, render_template
-import requests
+from flask import Flask, Response, jsonify, render_template, request
 import time
-import pyttsx3
-import threading
 import re
-import speech_recognition as sr
-from google.cloud import speech
+from slots_feed import SlotsFeed
+from slot_store import open_slot_store
+from device_transport import transport, TransportError
+from tts import speak
+from voice_jobs import VoiceJobs, JobQueueFullError
+import speech_stream
+import metrics
 
 app = Flask(__name__)
+voice_jobs = VoiceJobs()
 
-tts_engine = pyttsx3.init()
-tts_lock = threading.Lock()
-slots = {}
+slots = open_slot_store()
+slots_feed = SlotsFeed(slots)
 
 ESP32_URL = "http://192.168.0.50"  # ESP32 주소
 
-def speak(text):
-    with tts_lock:
-        tts_engine.say(text)
-        tts_engine.runAndWait()
-
 def send_to_esp32(slot_value):
     try:
-        response = requests.post(f"{ESP32_URL}/move", json={"slot": slot_value})
+        response = transport.post(f"{ESP32_URL}/move", json={"slot": slot_value})
         if response.status_code == 200:
             print("✅ ESP32로 명령 전송 성공")
         else:
             print(f"❌ ESP32 응답 오류: {response.status_code}")
-    except Exception as e:
+    except TransportError as e:
         print(f"ESP32 통신 실패: {e}")
 
+# 녹음을 audio.wav 로 썼다 다시 읽지 않고 메모리의 PCM 을 바로 Google Cloud Speech 로 보낸다
 def listen_command():
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("🎤 음성 입력 대기 중...")
-        audio = r.listen(source)
-
-    with open("audio.wav", "wb") as f:
-        f.write(audio.get_wav_data())
-
-    try:
-        # Google Cloud Speech-to-Text 클라이언트 초기화
-        client = speech.SpeechClient()
-
-        with open("audio.wav", "rb") as audio_file:
-            content = audio_file.read()
-
-        audio_data = speech.RecognitionAudio(content=content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,  # 마이크 샘플링레이트 맞춰야함
-            language_code="ko-KR",
-        )
-
-        response = client.recognize(config=config, audio=audio_data)
-
-        if response.results:
-            result_text = response.results[0].alternatives[0].transcript
-            print(f"🧠 Google Speech 인식 결과: {result_text}")
-            return result_text
-        else:
-            print("음성 인식 결과 없음")
-            return "인식 실패"
-
-    except Exception as e:
-        print(f"Google Speech 오류: {e}")
-        return "인식 실패"
+    return speech_stream.listen_command(backend="google-cloud")
 
 def process_voice_command():
     text = listen_command()
@@ -119,12 +83,27 @@ def index():
 
 @app.route("/listen")
 def listen():
-    threading.Thread(target=process_voice_command).start()
-    return jsonify({"status": "음성 명령 인식 시작"})
+    try:
+        job = voice_jobs.submit(process_voice_command)
+    except JobQueueFullError as e:
+        return jsonify({"status": "busy", "error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify({"status": "음성 명령 인식 시작", "job_id": job["id"], "position": job["position"]}), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = voice_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "없는 작업 id (끝난 지 오래되어 지워졌을 수 있음)"}), 404
+    return jsonify(job)
 
 @app.route("/slots")
 def get_slots():
-    return jsonify(slots)
+    status, body, headers = slots_feed.respond(request.args.get("since"), request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
     app.run(debug=True)
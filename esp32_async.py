@@ -0,0 +1,226 @@
+"""
+esp32_main 의 asyncio(ASGI) 버전.
+
+    hypercorn esp32_async:app --bind 0.0.0.0:2506
+    python esp32_async.py            # 개발용
+
+/listen 에서 나온 모터 명령은 HTTP 로 자기 자신의 /set_command 를 다시 부르지 않고
+같은 프로세스의 명령 큐에 바로 넣는다. CALLET_COMMAND_URL 을 주면 (명령 큐가 다른 서버에 있을 때)
+커넥션 풀을 쓰는 비동기 HTTP 클라이언트로 그 서버에 넘긴다.
+분류(KoGPT2)와 슬롯 저장은 블로킹 작업이라 스레드 풀에서 돌리고, 이벤트 루프는
+롱폴링/SSE 로 기다리는 많은 ESP32 연결을 붙잡고 있는 데만 쓴다.
+"""
+import asyncio
+import concurrent.futures
+import os
+import httpx
+from quart import Quart, Response, jsonify, make_response, render_template, request
+from model import start_warmup, is_model_ready, model_status
+from device_transport import COMMAND_TRANSPORT
+import wallet_commands
+import metrics
+from event_hub import AsyncEventHub, parse_event_id
+from command_channel import (InvalidWalletError, validate_device_id, AsyncCommandChannel, CommandRelayError,
+                             QueueFullError, DEFAULT_DEVICE, parse_wait, parse_seq)
+
+app = Quart(__name__)
+
+# 명령 큐가 다른 서버에 있으면 그 서버의 /set_command 주소 (비워두면 이 프로세스의 큐 사용)
+COMMAND_URL = os.environ.get("CALLET_COMMAND_URL", "")
+# 장치/중계 서버로 보내는 HTTP 요청 타임아웃(초)과 커넥션 풀 크기
+DEVICE_HTTP_TIMEOUT = float(os.environ.get("CALLET_DEVICE_HTTP_TIMEOUT", "5"))
+DEVICE_HTTP_POOL = int(os.environ.get("CALLET_DEVICE_HTTP_POOL", "20"))
+
+command_channel = AsyncCommandChannel()
+event_hub = AsyncEventHub()
+# 지갑이 처음 열릴 때마다 그 지갑의 슬롯 변경도 보낸다
+wallet_commands.wallets.add_listener(lambda wallet: event_hub.follow_slots(wallet.feed, wallet.id))
+http_client = None
+
+# CALLET_COMMAND_TRANSPORT=mqtt 이면 명령 큐 대신 MQTT 브로커로 보낸다 (publish 는 블로킹하지 않음)
+mqtt_transport = None
+if COMMAND_TRANSPORT == "mqtt":
+    from mqtt_transport import MqttTransport
+    mqtt_transport = MqttTransport()
+
+
+@app.before_serving
+async def startup():
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=DEVICE_HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=DEVICE_HTTP_POOL, max_keepalive_connections=DEVICE_HTTP_POOL),
+    )
+    if mqtt_transport is not None:
+        mqtt_transport.start()
+    start_warmup()
+
+
+@app.after_serving
+async def shutdown():
+    await http_client.aclose()
+
+
+async def forward_command(command_char, device):
+    """COMMAND_URL 서버의 큐로 넘긴다. 연결 실패/오류 응답은 CommandRelayError."""
+    try:
+        with metrics.timer("device_send"):
+            response = await http_client.post(COMMAND_URL, json={"command": command_char, "device": device})
+    except httpx.HTTPError as e:
+        raise CommandRelayError(device, e) from e
+    print(f"🔄 요청 보냄 → {command_char} ({response.status_code})")
+    if response.status_code == 429:
+        raise CommandRelayError(device, response.text, 429)
+    if response.is_error:
+        raise CommandRelayError(device, f"HTTP {response.status_code} {response.text}")
+
+
+def make_sender(loop, device=DEFAULT_DEVICE):
+    """스레드 풀에서 도는 wallet_commands 가 부를 send(command_char)."""
+    if mqtt_transport is not None:
+        def send(command_char):
+            sent = mqtt_transport.publish(command_char, device)
+            event_hub.publish("command", {"device": device, "command": command_char, "queued": not sent}, device)
+        return send
+
+    if not COMMAND_URL:
+        def send(command_char):
+            message = command_channel.publish(command_char, device)
+            print(f"🔄 명령 큐 → {device}: {message}")
+            event_hub.publish("command", {"device": device, **message, "depth": command_channel.depth(device)}, device)
+        return send
+
+    def send(command_char):
+        future = asyncio.run_coroutine_threadsafe(forward_command(command_char, device), loop)
+        try:
+            future.result(DEVICE_HTTP_TIMEOUT + 1)
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            raise CommandRelayError(device, "응답 시간 초과") from e
+    return send
+
+
+def _device_id(data=None):
+    # 지갑 id: 쿼리 ?device= 또는 JSON "device". 없으면 기본 지갑. 형식이 틀리면 InvalidWalletError → 400
+    if data and data.get("device"):
+        return validate_device_id(data["device"])
+    return validate_device_id(request.args.get("device") or DEFAULT_DEVICE)
+
+
+@app.errorhandler(InvalidWalletError)
+async def invalid_device(e):
+    # 잘못된 device id 로는 명령 큐/지갑을 만들지 않는다 (/command, /set_command, /ack ...)
+    return jsonify({"error": str(e)}), 400
+
+
+# ===== 웹 라우트 =====
+
+@app.route("/")
+async def index():
+    return await render_template("index.html", device=_device_id())
+
+@app.route("/command", methods=["GET"])
+async def command():
+    # ?wait=N 롱폴링. 기다리는 동안 스레드를 차지하지 않는다
+    device = _device_id()
+    wait = parse_wait(request.args.get("wait"))
+    if wait:
+        return jsonify(await command_channel.async_wait(wait, parse_seq(request.args.get("after")), device))
+    return jsonify(command_channel.current(device))
+
+@app.route("/command/stream", methods=["GET"])
+async def command_stream():
+    after_seq = parse_seq(request.headers.get("Last-Event-ID"))
+    response = await make_response(
+        command_channel.async_stream(after_seq, _device_id()),
+        {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.timeout = None  # SSE 는 연결을 계속 열어둔다
+    return response
+
+@app.route("/set_command", methods=["POST"])
+async def set_command():
+    data = await request.get_json()
+    if not data or "command" not in data:
+        return jsonify({"error": "No command provided"}), 400
+
+    device = _device_id(data)
+    try:
+        current_command = command_channel.publish(data["command"], device)
+    except QueueFullError as e:
+        return jsonify({"error": str(e), "device": device, "depth": e.depth}), 429
+    depth = command_channel.depth(device)
+    event_hub.publish("command", {"device": device, **current_command, "depth": depth}, device)
+    return jsonify({"status": "ok", "device": device, "command": current_command, "depth": depth})
+
+@app.route("/ack", methods=["POST"])
+async def ack_command():
+    data = await request.get_json()
+    if not data or "ack" not in data or not data["ack"]:
+        return jsonify({"error": "No acknowledgment provided"}), 400
+
+    device = _device_id(data)
+    acked = command_channel.ack(data.get("seq"), device)
+    if acked:
+        event_hub.publish("ack", {"device": device, "seq": data.get("seq"), "depth": command_channel.depth(device)},
+                          device)
+    return jsonify({"status": "acknowledged" if acked else "ignored", "device": device})
+
+@app.route("/events", methods=["GET"])
+async def events():
+    response = await make_response(
+        event_hub.async_stream(parse_event_id(request.headers.get("Last-Event-ID")), _device_id()),
+        {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.timeout = None
+    return response
+
+@app.route("/healthz")
+async def healthz():
+    return jsonify({"status": "ok", "model": model_status(), "model_ready": is_model_ready()})
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/slots")
+async def get_slots():
+    # 캐시가 최신이면 SQLite 는 version 한 줄만 읽는다. 지갑 저장소를 처음 여는 것도 스레드에서
+    try:
+        wallet = await asyncio.to_thread(wallet_commands.wallets.get, _device_id())
+    except InvalidWalletError as e:
+        return jsonify({"error": str(e)}), 400
+    status, body, headers = await asyncio.to_thread(
+        wallet.feed.respond, request.args.get("since"), request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+@app.route("/listen", methods=["POST"])
+async def listen():
+    data = await request.get_json()
+    if not data or "command" not in data:
+        return jsonify({"result": "fail", "message": "명령어가 없습니다."}), 400
+
+    text_command = data["command"]
+    print(f"클라이언트에서 받은 명령어: {text_command}")
+    device = _device_id(data)
+    send = make_sender(asyncio.get_running_loop(), device)
+    # 이 프로세스의 명령 큐로 보낼 때는 큐가 가득 찼는지 슬롯을 바꾸기 전에 확인한다
+    # (슬롯은 바뀌었는데 모터 명령은 429 로 버려지는 일이 없도록)
+    precheck = None
+    if mqtt_transport is None and not COMMAND_URL:
+        precheck = lambda: command_channel.check_capacity(device)
+    try:
+        result = await asyncio.to_thread(wallet_commands.process_text_command, text_command, send, device, precheck)
+    except InvalidWalletError as e:
+        return jsonify({"result": "fail", "message": str(e)}), 400
+    except QueueFullError as e:
+        return jsonify({"result": "fail", "message": str(e)}), 429
+    except CommandRelayError as e:
+        # frame.flush 는 슬롯을 바꾼 뒤라 슬롯 변경은 이미 저장됐다. 성공으로 답하지 않고 모터 명령이 나가지 않았다고 알린다
+        return jsonify({"result": "fail", "message": f"슬롯은 바뀌었지만 모터 명령을 보내지 못했습니다: {e}"}), e.status
+    print(result)
+    return jsonify(result)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=2506)
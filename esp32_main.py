@@ -1,282 +1,182 @@
-from flask import Flask, jsonify, render_template, request
-import paho.mqtt.client as mqtt
-import ssl
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
 import time
-import pyttsx3
-import speech_recognition as sr
-import threading
-import re
-from transformers import PreTrainedTokenizerFast, GPT2LMHeadModel
-import torch
-import numpy as np
-import requests
+import os
+from model import start_warmup, is_model_ready, model_status
+import wallet_commands
+import speech_stream
+import metrics
+from device_transport import transport, TransportError, COMMAND_TRANSPORT
+from event_hub import EventHub, parse_event_id
+from command_channel import (InvalidWalletError, validate_device_id, CommandChannel, CommandRelayError, QueueFullError,
+                             DEFAULT_DEVICE, parse_wait, parse_seq)
 
 app = Flask(__name__)
+# 웹 UI 로 슬롯 변경 / 명령 큐 / ack 를 바로 알린다 (/events)
+event_hub = EventHub()
+# 지갑이 처음 열릴 때마다 그 지갑의 슬롯 변경도 보낸다
+wallet_commands.wallets.add_listener(lambda wallet: event_hub.follow_slots(wallet.feed, wallet.id))
 
-# ===== MQTT 설정 =====
-MQTT_BROKER = "voicecardwallet.r-e.kr"
-MQTT_PORT = 8883
-MQTT_TOPIC = "esp32/commands"
-HTTP_COMMAND_URL = "https://voicecardwallet.r-e.kr/set_command"
+command_channel = CommandChannel()
+# 명령 큐가 다른 서버에 있으면 그 서버의 /set_command 주소 (비워두면 이 프로세스의 큐에 바로 넣는다)
+COMMAND_URL = os.environ.get("CALLET_COMMAND_URL", "")
 
-slot_num_to_cmd = {
-    1: "r",
-    2: "s",
-    3: "l"
-}
-
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("MQTT 브로커 연결 성공")
-    else:
-        print(f"MQTT 연결 실패, 코드: {rc}")
-
-
-
-# ===== TTS 엔진 =====
-tts_engine = pyttsx3.init()
-tts_lock = threading.Lock()
-
-# ===== 슬롯 저장 =====
-slots = {}
-
-# ===== KoGPT2 모델 로딩 =====
-tokenizer = PreTrainedTokenizerFast.from_pretrained("skt/kogpt2-base-v2")
-model = GPT2LMHeadModel.from_pretrained("skt/kogpt2-base-v2")
-model.eval()
-
-# ===== 동의어 그룹 처리 =====
-synonym_groups = [
-    ["주민등록증", "민증", "등록증"],
-    ["롯데카드", "롯데"],
-    ["삼성카드", "삼성"],
-]
-
-def find_canonical_name(name):
-    name = name.strip()
-    for group in synonym_groups:
-        if name in group:
-            return group[0]
-    return name
-
-def speak(text):
-    with tts_lock:
-        tts_engine.say(text)
-        tts_engine.runAndWait()
+# CALLET_COMMAND_TRANSPORT=mqtt 이면 /set_command 를 거치지 않고 MQTT 브로커로 바로 보낸다
+mqtt_transport = None
+if COMMAND_TRANSPORT == "mqtt":
+    from mqtt_transport import MqttTransport
+    mqtt_transport = MqttTransport()
+    mqtt_transport.start()
 
 
 def listen_command():
-    r = sr.Recognizer()
-    try:
-        with sr.Microphone() as source:
-            print("🎤 음성 입력 대기 중...")
-            audio = r.listen(source, timeout=5, phrase_time_limit=7)
-    except Exception as e:
-        print(f"마이크 에러: {e}")
-        return "인식 실패"
-
+    return speech_stream.listen_command(on_partial=wallet_commands.classifier.prefetch)
+
+def send_command_char(command_char, device=DEFAULT_DEVICE):
+    """모터 명령 하나를 보낸다. 보내지 못하면 QueueFullError / CommandRelayError."""
+    if mqtt_transport is not None:
+        sent = mqtt_transport.publish(command_char, device)
+        print(f"🔄 MQTT {'전송' if sent else '보관 (연결 대기)'} → {command_char}")
+        event_hub.publish("command", {"device": device, "command": command_char, "queued": not sent}, device)
+        return
+    if not COMMAND_URL:
+        # 자기 자신의 /set_command 를 HTTP 로 다시 부르지 않고 이 프로세스의 큐에 바로 넣는다
+        message = command_channel.publish(command_char, device)
+        print(f"🔄 명령 큐 → {device}: {message}")
+        event_hub.publish("command", {"device": device, **message, "depth": command_channel.depth(device)}, device)
+        return
     try:
-        text = r.recognize_google(audio, language='ko-KR')
-        print(f"🎿 인식된 텍스트: {text}")
-        return text
-    except sr.UnknownValueError:
-        return "인식 실패"
-    except sr.RequestError as e:
-        return f"API 오류: {e}"
-
-def get_embedding(text):
-    inputs = tokenizer(text, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**inputs, output_hidden_states=True)
-    last_hidden = outputs.hidden_states[-1]
-    sentence_embedding = torch.mean(last_hidden, dim=1).squeeze().cpu().numpy()
-    return sentence_embedding
-
-command_templates = {
-    "save": "저장 롯데카드 1 저장 삼성카드 2번 저장 민증 3",
-    "delete": "삭제 롯데카드 삭제 민증 삭제 삼성카드",
-    "move": "롯데카드 민증 삼성카드 이동"
-}
-command_embeddings = {k: get_embedding(v) for k, v in command_templates.items()}
-
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def classify_command(text):
-    keywords = {"save": "저장", "delete": "삭제", "move": "이동"}
-    for key, kw in keywords.items():
-        if kw in text:
-            return key
-    emb_text = get_embedding(text)
-    sims = {k: cosine_similarity(emb_text, emb) for k, emb in command_embeddings.items()}
-    return max(sims, key=sims.get)
-
-def parse_slots(text):
-    pattern_save = r"(주민등록증|민증|등록증|롯데카드|롯데|삼성카드|삼성)\s*(\d+)\s*저장"
-    pattern_delete = r"(주민등록증|민증|등록증|롯데카드|롯데|삼성카드|삼성)\s*삭제"
-    pattern_move = r"((?:주민등록증|민증|등록증|롯데카드|롯데|삼성카드|삼성)\s*\d+\s*)+이동"
-
-    slots_local = {}
-
-    if "저장" in text:
-        for match in re.finditer(pattern_save, text):
-            card, num = match.groups()
-            slots_local[find_canonical_name(card)] = int(num)
-    elif "삭제" in text:
-        for match in re.finditer(pattern_delete, text):
-            card = find_canonical_name(match.group(1))
-            slots_local[card] = slots.get(card, 0)
-    elif "이동" in text:
-        move_part = re.search(pattern_move, text)
-        if move_part:
-            pairs = re.findall(r"(주민등록증|민증|등록증|롯데카드|롯데|삼성카드|삼성)\s*(\d+)", move_part.group(0))
-            for card, num in pairs:
-                slots_local[find_canonical_name(card)] = int(num)
-    return slots_local
-
-def process_text_command(text):
-    cmd_type = classify_command(text)
-
-    if cmd_type == "save":
-        content = text.replace("저장", "").strip()
-        slot_num_match = re.search(r'(\d+)', content)
-        if not slot_num_match:
-            return {"result": "fail", "message": "번호 인식 실패"}
-        slot_num = int(slot_num_match.group(1))
-        slot_name = content[:slot_num_match.start()].strip()
-        if not slot_name:
-            return {"result": "fail", "message": "이름 인식 실패"}
-
-        slot_name = find_canonical_name(slot_name)
-        slots[slot_name] = slot_num
-        command_char = slot_num_to_cmd[slot_num]
-        response = requests.post(HTTP_COMMAND_URL, json={"command": command_char})
-        print(f"🔄 요청 보냄 → {command_char}")
-        print(f"📬 응답 코드: {response.status_code}")
-        print(f"📨 응답 본문: {response.text}")
-        return {"result": "success", "message": f"{slot_name} → {slot_num} 저장 완료"}
-
-    elif cmd_type == "delete":
-        slot_name = find_canonical_name(text.replace("삭제", "").strip())
-        if slot_name in slots:
-            slot_num = slots[slot_name]
-            command_char = slot_num_to_cmd[slot_num]
-            del slots[slot_name]
-            response = requests.post(HTTP_COMMAND_URL, json={"command": command_char})
-            print(f"🔄 요청 보냄 → {command_char}")
-            print(f"📬 응답 코드: {response.status_code}")
-            print(f"📨 응답 본문: {response.text}")
-            return {"result": "success", "message": f"{slot_name} 삭제 완료"}
-        return {"result": "fail", "message": "해당 슬롯 없음"}
-
-    elif cmd_type == "move":
-        slot_name = find_canonical_name(text.strip())
-        if slot_name in slots:
-            slot_num = slots[slot_name]
-            command_char = slot_num_to_cmd[slot_num]
-            response = requests.post(HTTP_COMMAND_URL, json={"command": command_char})
-            print(f"🔄 요청 보냄 → {command_char}")
-            print(f"📬 응답 코드: {response.status_code}")
-            print(f"📨 응답 본문: {response.text}")
-            return {"result": "success", "message": f"{slot_name} 이동 완료"}
-        return {"result": "fail", "message": "해당 슬롯 없음"}
-
-    return {"result": "fail", "message": "명령 분류 실패"}
-
-def process_voice_command():
+        response = transport.post(COMMAND_URL, json={"command": command_char, "device": device})
+    except TransportError as e:
+        raise CommandRelayError(device, e) from e
+    print(f"🔄 요청 보냄 → {command_char} ({response.status_code})")
+    if response.status_code == 429:
+        raise CommandRelayError(device, response.text, 429)
+    if not response.ok:
+        raise CommandRelayError(device, f"HTTP {response.status_code} {response.text}")
+
+def process_text_command(text, device=DEFAULT_DEVICE):
+    # 모터 명령은 명령을 받은 지갑(장치)으로만 보낸다
+    # 이 프로세스의 큐로 보낼 때는 큐가 가득 찼는지 슬롯을 바꾸기 전에 확인한다 (슬롯만 바뀌고 명령은 버려지지 않도록)
+    precheck = None
+    if mqtt_transport is None and not COMMAND_URL:
+        precheck = lambda: command_channel.check_capacity(device)
+    return wallet_commands.process_text_command(
+        text, lambda command_char: send_command_char(command_char, device), device, precheck)
+
+def process_voice_command(device=DEFAULT_DEVICE):
     text = listen_command()
     if text == "인식 실패":
         return {"result": "fail", "message": "음성 인식 실패"}
 
-    cmd_type = classify_command(text)
-    new_slots = parse_slots(text)
-
-    if cmd_type == "save":
-        for card, num in new_slots.items():
-            slots[card] = num
-            command_char = slot_num_to_cmd[num]
-            response = requests.post(HTTP_COMMAND_URL, json={"command": command_char})
-            print(f"🔄 요청 보냄 → {command_char}")
-            print(f"📬 응답 코드: {response.status_code}")
-            print(f"📨 응답 본문: {response.text}")
-
-    elif cmd_type == "delete":
-        for card in new_slots.keys():
-            if card in slots:
-                num = slots[card]
-                command_char = slot_num_to_cmd[num]
-                response = requests.post(HTTP_COMMAND_URL, json={"command": command_char})
-                print(f"🔄 요청 보냄 → {command_char}")
-                print(f"📬 응답 코드: {response.status_code}")
-                print(f"📨 응답 본문: {response.text}")
-                del slots[card]
-
-    elif cmd_type == "move":
-        for card in new_slots.keys():
-            if card in slots:
-                num = slots[card]
-                command_char = slot_num_to_cmd[num]
-                response = requests.post(HTTP_COMMAND_URL, json={"command": command_char})
-                print(f"🔄 요청 보냄 → {command_char}")
-                print(f"📬 응답 코드: {response.status_code}")
-                print(f"📨 응답 본문: {response.text}")
-    else:
-        return {"result": "fail", "message": "알 수 없는 명령"}
-
-    print(f"📦 현재 슬롯 상태: {slots}")
-    return {"result": "success", "message": f"{cmd_type} 명령 처리 완료"}
-
-
+    result = process_text_command(text, device)
+    print(f"📦 현재 슬롯 상태: {wallet_commands.wallets.get(device).slots}")
+    return result
 
 
 # ===== 웹 라우트 =====
 
 @app.route("/")
 def index():
-    return render_template("index.html")
+    # 기본 지갑 화면도 자기 지갑 id 로 /slots, /events 를 구독한다
+    return render_template("index.html", device=_device_id())
+
+
+def _device_id(data=None):
+    # 지갑 id: 쿼리 ?device= 또는 JSON "device". 없으면 기본 지갑. 형식이 틀리면 InvalidWalletError → 400
+    if data and data.get("device"):
+        return validate_device_id(data["device"])
+    return validate_device_id(request.args.get("device") or DEFAULT_DEVICE)
+
+
+@app.errorhandler(InvalidWalletError)
+def invalid_device(e):
+    # 잘못된 device id 로는 명령 큐/지갑을 만들지 않는다 (/command, /set_command, /ack ...)
+    return jsonify({"error": str(e)}), 400
 
-current_command = {"command": "none"}
-command_acknowledged = False
 
 @app.route("/command", methods=["GET"])
 def command():
-    global current_command, command_acknowledged
-
-    if not command_acknowledged and current_command["command"] != "none":
-        return jsonify(current_command)
-    else:
-        return jsonify({"command": "none"})
+    # ?wait=N 이면 명령이 들어오거나 N초가 지날 때까지 응답을 붙잡아둔다 (롱폴링)
+    # ?after=seq 는 마지막으로 실행한 명령. 그 명령은 ack 타임아웃이 지나야 다시 보낸다
+    device = _device_id()
+    wait = parse_wait(request.args.get("wait"))
+    if wait:
+        return jsonify(command_channel.wait(wait, parse_seq(request.args.get("after")), device))
+    return jsonify(command_channel.current(device))
+
+@app.route("/command/stream", methods=["GET"])
+def command_stream():
+    # SSE: 연결을 열어두고 명령이 들어올 때마다 바로 보낸다
+    after_seq = parse_seq(request.headers.get("Last-Event-ID"))
+    return Response(
+        stream_with_context(command_channel.stream(after_seq, _device_id())),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/set_command", methods=["POST"])
 def set_command():
-    global current_command, command_acknowledged
-
     data = request.get_json()
     if not data or "command" not in data:
         return jsonify({"error": "No command provided"}), 400
 
-    current_command = {"command": data["command"]}
-    command_acknowledged = False
-    return jsonify({"status": "ok", "command": current_command})
+    device = _device_id(data)
+    try:
+        current_command = command_channel.publish(data["command"], device)
+    except QueueFullError as e:
+        return jsonify({"error": str(e), "device": device, "depth": e.depth}), 429
+    depth = command_channel.depth(device)
+    event_hub.publish("command", {"device": device, **current_command, "depth": depth}, device)
+    return jsonify({"status": "ok", "device": device, "command": current_command, "depth": depth})
 
 @app.route("/ack", methods=["POST"])
 def ack_command():
-    global current_command, command_acknowledged
-
     data = request.get_json()
     if not data or "ack" not in data or not data["ack"]:
         return jsonify({"error": "No acknowledgment provided"}), 400
 
-    # ESP32가 ack 보냈으니 명령 초기화
-    command_acknowledged = True
-    current_command = {"command": "none"}
-    return jsonify({"status": "acknowledged"})
+    # ESP32가 ack 보냈으니 다음 명령으로 (seq 가 있으면 그 명령일 때만, 중복 ack 는 무시)
+    device = _device_id(data)
+    acked = command_channel.ack(data.get("seq"), device)
+    if acked:
+        event_hub.publish("ack", {"device": device, "seq": data.get("seq"), "depth": command_channel.depth(device)},
+                          device)
+    return jsonify({"status": "acknowledged" if acked else "ignored", "device": device})
+
+@app.route("/events", methods=["GET"])
+def events():
+    # 웹 UI 용 SSE: ?device= 지갑의 slots / command / ack 이벤트만
+    return Response(
+        stream_with_context(event_hub.stream(parse_event_id(request.headers.get("Last-Event-ID")), _device_id())),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.before_request
+def warmup_model():
+    # 첫 요청이 들어오면 백그라운드에서 모델 로딩 시작 (gunicorn 워커 포함)
+    start_warmup()
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "model": model_status(), "model_ready": is_model_ready(),
+                    "device_transport": transport.stats(),
+                    "mqtt": mqtt_transport.stats() if mqtt_transport is not None else None,
+                    "event_subscribers": event_hub.subscribers})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/slots")
 def get_slots():
-    # 예: {"주민등록증": 3, "롯데카드": 1, "삼성카드": 2}
-    return jsonify(slots)
+    # 예: {"주민등록증": 3, "롯데카드": 1, "삼성카드": 2}, ?since= 면 바뀐 카드만, ?device= 면 그 지갑
+    try:
+        feed = wallet_commands.wallets.get(_device_id()).feed
+    except InvalidWalletError as e:
+        return jsonify({"error": str(e)}), 400
+    status, body, headers = feed.respond(request.args.get("since"), request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
 
 @app.route("/listen", methods=["POST"])
 def listen():
@@ -286,11 +186,22 @@ def listen():
 
     text_command = data["command"]
     print(f"클라이언트에서 받은 명령어: {text_command}")
-    result = process_text_command(text_command)
+    try:
+        result = process_text_command(text_command, _device_id(data))
+    except InvalidWalletError as e:
+        return jsonify({"result": "fail", "message": str(e)}), 400
+    except QueueFullError as e:
+        return jsonify({"result": "fail", "message": str(e)}), 429
+    except CommandRelayError as e:
+        # 슬롯 변경은 이미 저장됐다. 성공으로 답하지 않고 모터 명령이 나가지 않았다고 알린다
+        return jsonify({"result": "fail", "message": f"슬롯은 바뀌었지만 모터 명령을 보내지 못했습니다: {e}"}), e.status
     print(result)
     return jsonify(result)
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=2506, debug=True)
+    # debug 리로더의 감시 프로세스는 요청을 받지 않으므로 실제 서버 프로세스에서만 워밍업
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warmup()
+    app.run(host="0.0.0.0", port=2506, debug=True, threaded=True)
 
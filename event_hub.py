@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from command_channel import SSE_KEEPALIVE, DeviceWaiters
+
+# 재연결한 브라우저에 다시 보내줄 수 있는 최근 이벤트 수 (더 오래 끊겨 있었으면 resync)
+EVENT_BUFFER = int(os.environ.get("CALLET_EVENT_BUFFER", "256"))
+# 연결이 끊긴 브라우저가 다시 붙기까지 기다리는 시간(ms), EventSource 의 retry
+EVENT_RETRY_MS = 3000
+
+
+class _EventBuffer:
+    """지갑 하나의 최근 이벤트. id 는 지갑마다 따로 1 부터 늘어난다."""
+
+    def __init__(self, size):
+        self.events = deque(maxlen=size)  # (id, SSE 프레임)
+        self.last_id = 0
+
+
+class EventHub:
+    """
+    웹 UI 로 보내는 이벤트(슬롯 변경, 명령 큐/ack, 음성 안내 문구)의 fan-out.
+    publish 할 때 SSE 프레임을 한 번만 만들어 그 지갑(device)의 링 버퍼에 넣고, 연결마다 자기 지갑 버퍼에서
+    마지막으로 본 id 이후의 프레임을 그대로 보낸다. 다른 지갑의 카드 이름/슬롯/명령은 그 지갑 구독자에게만 간다.
+    구독자가 몇 명이든 직렬화는 이벤트당 한 번이고, 느린 연결이 다른 연결을 막지 않는다.
+    지갑이 하나뿐인 서버(app3)는 device 없이(None) 쓴다.
+    """
+
+    def __init__(self, buffer_size=EVENT_BUFFER):
+        self._lock = threading.Lock()
+        self._waiters = DeviceWaiters(self._lock)  # 그 지갑에 publish 될 때만 깨어난다
+        self._buffer_size = buffer_size
+        self._buffers = {}  # device → _EventBuffer (그 지갑에 처음 publish 할 때 생김)
+        self.subscribers = 0
+
+    def publish(self, event, data, device=None):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            buffer = self._buffers.get(device)
+            if buffer is None:
+                buffer = self._buffers[device] = _EventBuffer(self._buffer_size)
+            buffer.last_id += 1
+            buffer.events.append((buffer.last_id, f"id: {buffer.last_id}\nevent: {event}\ndata: {payload}\n\n"))
+            self._waiters.notify(device)
+            return buffer.last_id
+
+    def _current(self, device):
+        buffer = self._buffers.get(device)
+        return (buffer.events, buffer.last_id) if buffer is not None else ((), 0)
+
+    def _after(self, last_id, device):
+        """(device 의 last_id 이후 프레임들, 새 last_id). self._lock 을 잡은 채로 호출."""
+        events, current = self._current(device)
+        if last_id > current or (events and last_id < events[0][0] - 1):
+            # 서버 재시작(id 가 처음부터) 또는 버퍼에서 밀려나 놓친 이벤트가 있음 → 전체를 다시 받으라고 알림
+            return [f"id: {current}\nevent: resync\ndata: {{}}\n\n"], current
+        return [frame for event_id, frame in events if event_id > last_id], current
+
+    def wait(self, last_id, timeout, device=None):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                frames, last_id = self._after(last_id, device)
+                if frames:
+                    return frames, last_id
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], last_id
+                self._waiters.wait(device, remaining)
+
+    def _start_id(self, last_id, device):
+        # 처음 연결한 브라우저는 지금부터의 이벤트만 (현재 상태는 /slots 로 받는다)
+        if last_id is None:
+            with self._lock:
+                return self._current(device)[1]
+        return last_id
+
+    def _subscribed(self, delta):
+        with self._lock:
+            self.subscribers += delta
+
+    def stream(self, last_id=None, device=None, keepalive=SSE_KEEPALIVE):
+        """device 지갑의 text/event-stream 본문 생성기. last_id 는 재연결 시 Last-Event-ID."""
+        last_id = self._start_id(last_id, device)
+        self._subscribed(1)
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            while True:
+                frames, last_id = self.wait(last_id, keepalive, device)
+                yield "".join(frames) if frames else ": keep-alive\n\n"
+        finally:
+            self._subscribed(-1)
+
+    def follow_slots(self, feed, device=None):
+        """
+        슬롯 저장소가 바뀔 때마다 바뀐 카드만 "slots" 이벤트로 보낸다 (/slots?since= 와 같은 형식 + since).
+        브라우저는 since 가 자기 버전과 같을 때만 합치고, 아니면 /slots 를 다시 받는다.
+        device 를 주면 그 지갑의 구독자에게만 보낸다.
+        """
+        store = feed.store
+        lock = threading.Lock()
+        state = {"version": store.version}
+
+        def on_change():
+            with lock:
+                since = state["version"]
+                delta = store.changes_since(since)
+                if delta is None:
+                    version, by_name, _ = store.snapshot()
+                    data = {"version": feed.token(version), "full": True, "slots": dict(by_name)}
+                else:
+                    version, changes = delta
+                    if version == since:
+                        return
+                    data = {"version": feed.token(version), "full": False, "changes": changes}
+                data["since"] = feed.token(since)
+                if device is not None:
+                    data["device"] = device
+                state["version"] = version
+                self.publish("slots", data, device)
+
+        store.add_listener(on_change)
+
+
+class AsyncEventHub(EventHub):
+    """asyncio 서버용. publish 는 어느 스레드에서 불러도 되고, 기다리는 쪽은 이벤트 루프의 Future 로 잠든다."""
+
+    async def async_wait(self, last_id, timeout, device=None):
+        with self._lock:
+            frames, last_id = self._after(last_id, device)
+            if frames:
+                return frames, last_id
+            future = self._waiters.register(device)
+        await self._waiters.async_wait(device, future, timeout)
+        with self._lock:
+            return self._after(last_id, device)
+
+    async def async_stream(self, last_id=None, device=None, keepalive=SSE_KEEPALIVE):
+        last_id = self._start_id(last_id, device)
+        self._subscribed(1)
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            while True:
+                frames, last_id = await self.async_wait(last_id, keepalive, device)
+                yield "".join(frames) if frames else ": keep-alive\n\n"
+        finally:
+            self._subscribed(-1)
+
+
+def parse_event_id(value):
+    """Last-Event-ID 헤더 → 정수 (없거나 숫자가 아니면 None = 지금부터)."""
+    value = str(value or "")
+    return int(value) if value.isdigit() else None
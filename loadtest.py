@@ -0,0 +1,333 @@
+"""
+서버 하나가 지갑을 몇 개까지 감당하는지 보는 부하 생성기.
+
+    ESP32 N 대   arduino.ino 와 같은 루프: GET /command?wait=&device=&after=<seq> → (실행) → POST /ack {seq}
+    웹 클라이언트 M 개   POST /listen {command, device} 를 보내고, 웹 UI 처럼 /slots 를 ETag/since 로 폴링
+
+    python loadtest.py                                   # esp32_main 을 띄우고 (분류 모델은 stub) 장치 8, 웹 4, 30초
+    python loadtest.py --devices 200 --clients 50 --duration 60
+    python loadtest.py --model real                      # KoGPT2 분류기 그대로
+    python loadtest.py --url http://127.0.0.1:2506       # 이미 떠 있는 서버 (gunicorn, esp32_async 등)
+
+--url 을 주지 않으면 esp32_main 을 하위 프로세스로 띄운다 (부하 생성기와 GIL 을 나눠 쓰지 않도록).
+  - 슬롯 저장소는 임시 디렉터리 (실제 slots.db 는 건드리지 않음)
+  - /listen 의 모터 명령은 운영 중계 서버 대신 그 서버 자신의 명령 큐로 바로 넣는다
+  - 명령에 발급 시각을 붙여서 "명령 발급 → ack" 지연을 잰다.
+    --url 로 붙은 서버면 발급 시각을 모르므로 장치가 명령을 받은 때부터 잰다
+
+결과: 엔드포인트별 요청 수/초당 요청/p50/p99/오류(429 는 따로), 명령 → ack 지연, 중복 수신/무시된 ack 수.
+오류가 하나라도 있으면 종료 코드 1.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+
+CARDS = ["롯데카드", "삼성카드", "민증"]
+# 웹 클라이언트가 보내는 문장. 키워드가 없는 문장은 분류기(stub 또는 KoGPT2)를 거친다
+SENTENCES = [
+    "{card} {slot}번 저장", "{card} {slot} 저장", "{card} 이동", "{card} 삭제",
+    "{card} 꺼내줘", "{card} {slot}번에 넣어줘", "{card} 지워줘",
+]
+ENDPOINTS = ["GET /command", "POST /ack", "POST /listen", "GET /slots"]
+
+
+# ===== 서버 (하위 프로세스) =====
+
+def serve(port, model, stub_ms):
+    """--serve 로 불린다. esp32_main 을 부하 테스트용으로 조금 바꿔서 띄운다."""
+    from werkzeug.serving import make_server
+    from command_channel import DEFAULT_DEVICE
+    import esp32_main
+    import wallet_commands
+
+    if model == "stub":
+        wallet_commands.classifier = _stub_classifier(stub_ms / 1000)
+        esp32_main.start_warmup = lambda: None
+
+    # CALLET_COMMAND_URL 이 없으면 /listen 의 모터 명령은 이 프로세스의 큐로 바로 간다
+    esp32_main.COMMAND_URL = ""
+    channel = esp32_main.command_channel
+    publish = channel.publish
+
+    def publish_with_time(command, device=DEFAULT_DEVICE):
+        # 장치는 모르는 필드를 무시한다. 같은 호스트라 장치 쪽 time.time() 과 바로 비교할 수 있음
+        message = publish(command, device)
+        message["issued_at"] = time.time()
+        return message
+
+    channel.publish = publish_with_time
+    print(f"부하 테스트 서버: http://127.0.0.1:{port} (분류기 {model})", flush=True)
+    make_server("127.0.0.1", port, esp32_main.app, threaded=True).serve_forever()
+
+
+def _stub_classifier(delay):
+    """KoGPT2 대신 쓰는 분류기. 모델 대신 delay 초 기다린 뒤 낱말로 의도를 고른다 (키워드 빠른 경로는 그대로)."""
+    from command_classifier import IntentClassifier
+
+    class StubClassifier(IntentClassifier):
+        source = "stub"
+        hints = {"save": ("넣", "보관", "맡"), "delete": ("지워", "빼", "없애"), "move": ("꺼내", "줘", "필요")}
+
+        @property
+        def intents(self):
+            return list(self.hints)
+
+        def _intent_scores(self, texts):
+            time.sleep(delay)
+            return np.array([[float(any(h in text for h in hints)) for hints in self.hints.values()]
+                             for text in texts])
+
+    return StubClassifier()
+
+
+def start_server(port, model, stub_ms, log_path):
+    directory = tempfile.mkdtemp(prefix="callet-loadtest-")
+    env = dict(os.environ, CALLET_SLOT_DB=os.path.join(directory, "slots.db"), PYTHONUNBUFFERED="1")
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+         "--model", model, "--stub-ms", str(stub_ms)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"서버가 시작하지 못했습니다 (종료 코드 {process.returncode}, --server-log 로 확인)")
+        try:
+            if requests.get(f"{url}/healthz", timeout=1).ok:
+                return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("서버가 120초 안에 응답하지 않습니다")
+
+
+# ===== 부하 생성 =====
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.busy = {name: 0 for name in ENDPOINTS}  # 429
+        self.command_to_ack = []
+        self.commands = 0
+        self.duplicates = 0
+        self.acks_ignored = 0
+        self.listen_results = {}
+        self.error_samples = []
+
+    def request(self, name, session, method, url, **kwargs):
+        """요청 하나를 보내고 기록한다. 실패면 None."""
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            self._error(name, f"{type(e).__name__}: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if response.status_code == 429:
+                self.busy[name] += 1
+                return None
+        if response.status_code >= 400:
+            self._error(name, f"HTTP {response.status_code}: {response.text[:120]}")
+            return None
+        return response
+
+    def _error(self, name, message):
+        with self._lock:
+            self.errors[name] += 1
+            if len(self.error_samples) < 10:
+                self.error_samples.append(f"{name}: {message}")
+
+    def add(self, field, value=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+
+def device_loop(url, device, recorder, stop, poll_wait, exec_ms):
+    session = requests.Session()
+    last_seq, last_epoch = 0, None
+    while not stop.is_set():
+        response = recorder.request("GET /command", session, "GET", f"{url}/command",
+                                    params={"wait": poll_wait, "device": device, "after": last_seq},
+                                    timeout=poll_wait + 10)
+        if response is None:
+            stop.wait(1)
+            continue
+        message = response.json()
+        if message.get("command", "none") == "none":
+            continue
+        received_at = time.time()
+        seq, epoch = message.get("seq", 0), message.get("epoch")
+        if seq and seq == last_seq and epoch == last_epoch:
+            recorder.add("duplicates")  # ack 가 늦어서 다시 받은 명령 → 실행하지 않고 ack 만
+        else:
+            time.sleep(exec_ms / 1000)  # 모터 동작
+            last_seq, last_epoch = seq, epoch
+            recorder.add("commands")
+        response = recorder.request("POST /ack", session, "POST", f"{url}/ack",
+                                    json={"ack": True, "seq": seq, "device": device}, timeout=10)
+        if response is None:
+            continue
+        if response.json().get("status") != "acknowledged":
+            recorder.add("acks_ignored")
+            continue
+        issued_at = message.get("issued_at", received_at)
+        with recorder._lock:
+            recorder.command_to_ack.append(time.time() - issued_at)
+
+
+def client_loop(url, devices, recorder, stop, think_ms, slots_interval, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    versions = {}  # 지갑별 마지막 /slots 버전 (웹 UI 처럼 ?since=)
+    next_slots = 0.0
+    while not stop.is_set():
+        device = rng.choice(devices)
+        sentence = rng.choice(SENTENCES).format(card=rng.choice(CARDS), slot=rng.randint(1, 3))
+        response = recorder.request("POST /listen", session, "POST", f"{url}/listen",
+                                    json={"command": sentence, "device": device}, timeout=30)
+        if response is not None:
+            result = response.json().get("result", "?")
+            with recorder._lock:
+                recorder.listen_results[result] = recorder.listen_results.get(result, 0) + 1
+
+        if time.monotonic() >= next_slots:
+            next_slots = time.monotonic() + slots_interval
+            params = {"device": device}
+            if versions.get(device):
+                params["since"] = versions[device]
+            response = recorder.request("GET /slots", session, "GET", f"{url}/slots", params=params, timeout=10)
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                versions[device] = data["version"] if "since" in params else response.headers.get("ETag", "").strip('"')
+        stop.wait(think_ms / 1000)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+
+def run(url, args):
+    devices = [f"load-{i:04d}" for i in range(args.devices)]
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=device_loop, args=(url, device, recorder, stop, args.poll_wait, args.exec_ms),
+                                daemon=True) for device in devices]
+    threads += [threading.Thread(target=client_loop, args=(url, devices, recorder, stop, args.think_ms,
+                                                           args.slots_interval, args.seed + i), daemon=True)
+                for i in range(args.clients)]
+    print(f"장치 {args.devices}대, 웹 클라이언트 {args.clients}개, {args.duration:.0f}초 → {url}")
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    # 장치는 롱폴링 중일 수 있으므로 wait 만큼은 기다려서 마지막 명령의 ack 까지 받는다
+    for thread in threads:
+        thread.join(timeout=max(0.0, args.poll_wait + 10 - (time.perf_counter() - start - args.duration)))
+    wall_s = time.perf_counter() - start
+    return summarize(recorder, wall_s, args.duration)
+
+
+def summarize(recorder, wall_s, duration):
+    with recorder._lock:
+        endpoints = {}
+        for name in ENDPOINTS:
+            samples = recorder.latencies[name]
+            endpoints[name] = {
+                "count": len(samples),
+                "rate_per_s": len(samples) / duration,
+                "p50_ms": percentile_ms(samples, 50),
+                "p99_ms": percentile_ms(samples, 99),
+                "errors": recorder.errors[name],
+                "busy_429": recorder.busy[name],
+            }
+        acks = recorder.command_to_ack
+        return {
+            "wall_s": wall_s,
+            "endpoints": endpoints,
+            "command_to_ack": {"count": len(acks), "p50_ms": percentile_ms(acks, 50),
+                               "p99_ms": percentile_ms(acks, 99),
+                               "max_ms": float(max(acks) * 1000) if acks else None},
+            "commands_executed": recorder.commands,
+            "duplicates": recorder.duplicates,
+            "acks_ignored": recorder.acks_ignored,
+            "listen_results": dict(recorder.listen_results),
+            "error_samples": list(recorder.error_samples),
+        }
+
+
+def _ms(value):
+    return f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+
+
+def print_report(report):
+    print(f"{'endpoint':<13} {'count':>7} {'req/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'errors':>7} {'429':>5}")
+    for name, s in report["endpoints"].items():
+        print(f"{name:<13} {s['count']:>7} {s['rate_per_s']:>8.1f} {_ms(s['p50_ms'])} {_ms(s['p99_ms'])} "
+              f"{s['errors']:>7} {s['busy_429']:>5}")
+    print("  (GET /command 는 롱폴링이라 명령이 없으면 wait 만큼 걸린다)")
+    c = report["command_to_ack"]
+    print(f"명령 → ack: {c['count']}개, p50 {_ms(c['p50_ms']).strip()}ms, p99 {_ms(c['p99_ms']).strip()}ms, "
+          f"최대 {_ms(c['max_ms']).strip()}ms")
+    print(f"장치 실행 {report['commands_executed']}개, 중복 수신 {report['duplicates']}개, "
+          f"무시된 ack {report['acks_ignored']}개")
+    print(f"/listen 결과: {report['listen_results']}")
+    for sample in report["error_samples"]:
+        print(f"  ✗ {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESP32 장치 + 웹 클라이언트 부하 테스트")
+    parser.add_argument("--url", help="이미 떠 있는 서버 주소 (없으면 esp32_main 을 띄움)")
+    parser.add_argument("--port", type=int, default=2599, help="띄울 서버의 포트")
+    parser.add_argument("--model", choices=["stub", "real"], default="stub", help="분류기 (stub 이면 KoGPT2 를 읽지 않음)")
+    parser.add_argument("--stub-ms", type=float, default=20.0, help="stub 분류기가 문장마다 걸리는 시간")
+    parser.add_argument("--server-log", help="띄운 서버의 출력을 저장할 파일")
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="초")
+    parser.add_argument("--poll-wait", type=float, default=5.0, help="장치 롱폴링 wait (ESP32 는 25)")
+    parser.add_argument("--exec-ms", type=float, default=100.0, help="장치가 명령 하나를 실행하는 시간")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="웹 클라이언트가 /listen 사이에 쉬는 시간")
+    parser.add_argument("--slots-interval", type=float, default=2.0, help="웹 클라이언트의 /slots 폴링 주기(초)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="결과를 JSON 파일로 저장")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.model, args.stub_ms)
+        return 0
+
+    process = None
+    url = args.url
+    if not url:
+        process, url = start_server(args.port, args.model, args.stub_ms, args.server_log)
+    try:
+        report = run(url.rstrip("/"), args)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if any(s["errors"] for s in report["endpoints"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 단계별 지연시간(초) 히스토그램 구간. 마지막 +Inf 는 자동으로 붙는다
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 0 이면 측정하지 않는다 (timer/observe 가 아무것도 하지 않음)
+METRICS_ENABLED = os.environ.get("CALLET_METRICS", "1") != "0"
+
+# Prometheus 텍스트 형식
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 단계 이름 (라벨 값)
+#   stt          말이 끝난 뒤 인식 결과가 나올 때까지
+#   embedding    KoGPT2 forward (배치 하나)
+#   classify     의도 분류 (임베딩 대기 포함)
+#   parse        명령 파싱 (안에서 부르는 분류 시간은 뺌)
+#   slot_store   슬롯 DB 쓰기 트랜잭션
+#   device_send  ESP32/중계 서버/MQTT 로 명령 전송
+#   command      문장 하나 처리 전체 (분류 → 파싱 → 슬롯 → 전송)
+#   tts_wait     안내 음성이 큐에서 기다린 시간
+#   tts          안내 음성 합성/재생
+
+
+class Histogram:
+    """라벨 하나(stage)로 나뉘는 누적 히스토그램. 값마다 구간 하나만 올리고 출력할 때 누적한다."""
+
+    def __init__(self, name, help_text, buckets=STAGE_BUCKETS, label="stage"):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._lock = threading.Lock()
+        self._series = {}  # 라벨 값 → [구간별 개수..., +Inf 개수], 합계, 개수
+
+    def observe(self, label_value, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            label = f'{self.label}="{key}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label="stage"):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f'{self.name}{{{self.label}="{key}"}} {value}' for key, value in values]
+        return lines
+
+
+stage_seconds = Histogram("callet_stage_seconds", "Latency of each voice-to-dispense pipeline stage")
+stage_errors = Counter("callet_stage_errors_total", "Exceptions raised inside each pipeline stage")
+
+
+def observe(stage, seconds):
+    if METRICS_ENABLED:
+        stage_seconds.observe(stage, seconds)
+
+
+@contextmanager
+def timer(stage):
+    """with timer("classify"): ...  — 블록 실행 시간을 기록한다 (예외가 나도 기록하고 에러 수를 센다)."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        stage_seconds.observe(stage, time.perf_counter() - start)
+
+
+def render():
+    """/metrics 응답 본문."""
+    return "\n".join(stage_seconds.render() + stage_errors.render()) + "\n"
@@ -1,18 +1,364 @@
-from transformers import PreTrainedTokenizerFast, GPT2LMHeadModel
-import torch
 import numpy as np
+import os
+import threading
+import queue
+import time
+import unicodedata
+from collections import OrderedDict
+import metrics
+
+# ===== KoGPT2 모델 (지연 로딩) =====
+# transformers/torch 임포트와 가중치 로딩은 수 초가 걸리므로 import 시점이 아니라
+# 첫 분류 요청(또는 서버 기동 후 백그라운드 워밍업)에서 한 번만 수행한다.
+MODEL_NAME = "skt/kogpt2-base-v2"
+MODEL_REVISION = os.environ.get("CALLET_MODEL_REVISION", "main")
+POOLING = "masked-mean"  # 임베딩 계산 방식이 바뀌면 저장된 인덱스도 다시 만들어야 함
+
+# ===== CPU 추론 모드 =====
+# base: LM head 없이 GPT2Model 만 사용 (마지막 hidden state 는 lm 과 동일한 값)
+# lm: 기존 방식 (GPT2LMHeadModel + output_hidden_states)
+MODEL_HEAD = os.environ.get("CALLET_MODEL_HEAD", "base")
+MODEL_LAYERS = int(os.environ.get("CALLET_MODEL_LAYERS", "0"))    # 0 이면 전체 레이어, N 이면 앞의 N개만
+MODEL_QUANTIZE = os.environ.get("CALLET_MODEL_QUANTIZE", "")       # "int8" → 동적 양자화
+TORCH_THREADS = int(os.environ.get("CALLET_TORCH_THREADS", "0"))   # 워커당 torch 스레드 수 (0 이면 기본값)
+
+tokenizer = None
+model = None
+_load_lock = threading.Lock()
+_load_error = None
+_warmup_thread = None
+
+
+def _truncate_layers(transformer, n_layers):
+    # 앞쪽 N개 블록만 남긴다 (마지막 ln_f 는 그대로 적용됨)
+    if 0 < n_layers < len(transformer.h):
+        transformer.h = transformer.h[:n_layers]
+        transformer.config.n_layer = n_layers
+
+
+def _conv1d_to_linear(module):
+    # GPT-2 는 nn.Linear 대신 Conv1D(가중치가 전치된 형태)를 써서 동적 양자화 대상이 안 됨 → Linear 로 교체
+    import torch
+    from transformers.pytorch_utils import Conv1D
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def _quantize_int8(m):
+    import torch
+    _conv1d_to_linear(m)
+    return torch.ao.quantization.quantize_dynamic(m, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def inference_mode():
+    layers = MODEL_LAYERS if MODEL_LAYERS > 0 else "all"
+    return f"head={MODEL_HEAD}, layers={layers}, quantize={MODEL_QUANTIZE or 'fp32'}, threads={TORCH_THREADS or 'default'}"
+
+
+def load_model():
+    global tokenizer, model, _load_error
+    if model is not None:
+        return tokenizer, model
+    with _load_lock:
+        if model is None:
+            try:
+                import torch
+                from transformers import PreTrainedTokenizerFast, GPT2Model, GPT2LMHeadModel
+                if TORCH_THREADS > 0:
+                    torch.set_num_threads(TORCH_THREADS)
+                tok = PreTrainedTokenizerFast.from_pretrained(MODEL_NAME, revision=MODEL_REVISION, pad_token="<pad>")
+                tok.padding_side = "right"
+                if MODEL_HEAD == "lm":
+                    m = GPT2LMHeadModel.from_pretrained(MODEL_NAME, revision=MODEL_REVISION)
+                    _truncate_layers(m.transformer, MODEL_LAYERS)
+                else:
+                    m = GPT2Model.from_pretrained(MODEL_NAME, revision=MODEL_REVISION)
+                    _truncate_layers(m, MODEL_LAYERS)
+                m.eval()
+                if MODEL_QUANTIZE == "int8":
+                    m = _quantize_int8(m)
+            except Exception as e:
+                _load_error = e
+                raise
+            tokenizer, _load_error = tok, None
+            model = m
+            print(f"KoGPT2 모델 로딩 완료 ({inference_mode()})")
+    return tokenizer, model
+
+
+def _warmup():
+    try:
+        load_model()
+    except Exception as e:
+        print(f"KoGPT2 모델 로딩 실패: {e}")
+
+
+def start_warmup():
+    """백그라운드 스레드에서 모델을 미리 로딩한다 (여러 번 호출해도 한 번만 실행)."""
+    global _warmup_thread
+    with _load_lock:
+        if model is not None or _warmup_thread is not None:
+            return _warmup_thread
+        _warmup_thread = threading.Thread(target=_warmup, name="kogpt2-warmup", daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
+
+
+def is_model_ready():
+    return model is not None
+
+
+def embedding_signature():
+    """임베딩 값을 결정하는 설정 (모델, 리비전, 풀링, 추론 모드). 템플릿 인덱스 캐시 키로 사용."""
+    # head(lm/base) 는 같은 값을 내므로 제외, 레이어 수와 양자화는 임베딩 값을 바꾸므로 포함
+    layers = MODEL_LAYERS if MODEL_LAYERS > 0 else "all"
+    return f"{MODEL_NAME}@{MODEL_REVISION}/{POOLING}/layers={layers}/{MODEL_QUANTIZE or 'fp32'}"
+
+
+def model_status():
+    if model is not None:
+        return "ready"
+    if _load_error is not None:
+        return "error"
+    if _warmup_thread is not None or _load_lock.locked():
+        return "loading"
+    return "idle"
+
+
+# ===== 임베딩 서비스 설정 =====
+EMBEDDING_CACHE_SIZE = 1024   # LRU 캐시에 보관할 문장 수
+EMBEDDING_MAX_BATCH = 16      # 한 번의 forward 에 묶을 최대 문장 수
+EMBEDDING_MAX_WAIT_MS = 2     # 배치를 채우기 위해 추가로 기다리는 시간
+
+
+def normalize_text(text: str):
+    # 캐시 키: 유니코드 정규화 + 공백 정리 ("롯데카드 " 와 "롯데카드" 를 같은 키로)
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def encode_batch(texts):
+    """
+    여러 문장을 패딩해서 한 번의 forward 로 처리하고,
+    attention mask 를 반영한 평균 풀링으로 문장 임베딩을 만든다.
+    """
+    import torch
+    tokenizer, model = load_model()
+    inputs = tokenizer(list(texts), return_tensors="pt", padding=True)
+    with torch.inference_mode(), metrics.timer("embedding"):
+        if MODEL_HEAD == "lm":
+            last_hidden = model(**inputs, output_hidden_states=True).hidden_states[-1]
+        else:
+            last_hidden = model(**inputs).last_hidden_state
+    mask = inputs["attention_mask"].unsqueeze(-1).to(last_hidden.dtype)
+    summed = (last_hidden * mask).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1)
+    return (summed / counts).cpu().numpy()
+
+
+class _Pending:
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingService:
+    """
+    LRU 캐시 + 마이크로 배칭 임베딩 서비스.
+    같은 문장은 캐시에서 바로 돌려주고, 동시에 들어온 새 문장들은
+    워커 스레드가 모아서 한 번의 패딩된 forward 로 처리한다.
+    """
+
+    def __init__(self, encode_fn, cache_size=EMBEDDING_CACHE_SIZE,
+                 max_batch_size=EMBEDDING_MAX_BATCH, max_wait_ms=EMBEDDING_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.cache_size = cache_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # 캐시에는 없지만 같은 문장이 이미 계산 중이라 그 결과를 같이 기다린 호출
+        self.batches = 0
+        self.batched_items = 0
+        self.max_batch_seen = 0
+
+    # ----- 캐시 -----
+    def _cache_get(self, key):
+        emb = self._cache.get(key)
+        if emb is not None:
+            self._cache.move_to_end(key)
+        return emb
+
+    def _cache_put(self, key, emb):
+        emb.flags.writeable = False  # 캐시된 배열은 여러 호출자가 공유하므로 읽기 전용
+        self._cache[key] = emb
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # ----- 공개 API -----
+    def embed(self, text):
+        key = normalize_text(text)
+        with self._lock:
+            emb = self._cache_get(key)
+            if emb is not None:
+                self.hits += 1
+                return emb
+            pending = self._inflight.get(key)
+            if pending is not None:
+                # 같은 문장이 이미 대기 중이면 그 결과를 같이 기다린다 (새로 계산하지 않으므로 miss 가 아님)
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                pending = _Pending(key)
+                self._inflight[key] = pending
+                self._queue.put(pending)
+                self._ensure_worker()
+
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def prefetch(self, text):
+        """결과를 기다리지 않고 계산만 예약 (음성 인식 부분 결과로 미리 임베딩을 만들어 둘 때)."""
+        key = normalize_text(text)
+        if not key:
+            return
+        with self._lock:
+            if key in self._cache or key in self._inflight:
+                return
+            pending = _Pending(key)
+            self._inflight[key] = pending
+            self._queue.put(pending)
+            self._ensure_worker()
+
+    def embed_many(self, texts):
+        """여러 문장을 한꺼번에 임베딩 (캐시에 없는 것만 배치로 계산)."""
+        keys = [normalize_text(t) for t in texts]
+        results = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in results:
+                    continue
+                emb = self._cache_get(key)
+                if emb is not None:
+                    self.hits += 1
+                    results[key] = emb
+                else:
+                    self.misses += 1
+                    results[key] = None
+                    missing.append(key)
+
+        for i in range(0, len(missing), self.max_batch_size):
+            chunk = missing[i:i + self.max_batch_size]
+            embs = self.encode_fn(chunk)
+            with self._lock:
+                self._record_batch(len(chunk))
+                for key, emb in zip(chunk, embs):
+                    emb = np.array(emb)
+                    self._cache_put(key, emb)
+                    results[key] = emb
+
+        return np.stack([results[key] for key in keys])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "cache_size": len(self._cache),
+                "batches": self.batches,
+                "batched_items": self.batched_items,
+                "avg_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    # ----- 배칭 워커 -----
+    def _record_batch(self, size):
+        self.batches += 1
+        self.batched_items += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        # 이전 forward 동안 쌓인 요청은 기다리지 않고 바로 합친다
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                embs = self.encode_fn([p.key for p in batch])
+                error = None
+            except Exception as e:
+                embs, error = None, e
+
+            with self._lock:
+                if error is None:
+                    self._record_batch(len(batch))
+                for i, p in enumerate(batch):
+                    if error is None:
+                        p.result = np.array(embs[i])
+                        self._cache_put(p.key, p.result)
+                    else:
+                        p.error = error
+                    self._inflight.pop(p.key, None)
+            for p in batch:
+                p.done.set()
+
+
+embedding_service = EmbeddingService(encode_batch)
 
-tokenizer = PreTrainedTokenizerFast.from_pretrained("skt/kogpt2-base-v2")
-model = GPT2LMHeadModel.from_pretrained("skt/kogpt2-base-v2")
-model.eval()
 
 def get_embedding(text: str):
-    inputs = tokenizer(text, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**inputs, output_hidden_states=True)
-    last_hidden = outputs.hidden_states[-1]
-    sentence_embedding = torch.mean(last_hidden, dim=1).squeeze().cpu().numpy()
-    return sentence_embedding
+    return embedding_service.embed(text)
+
+def get_embeddings(texts):
+    return embedding_service.embed_many(texts)
+
+def prefetch_embedding(text: str):
+    embedding_service.prefetch(text)
 
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
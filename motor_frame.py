@@ -0,0 +1,77 @@
+import os
+
+# 슬롯 번호 → 슬라이더 위치 (M/R 명령의 인자)
+SLOT_POSITION_STEP = 1000
+# 저장할 때 카드를 넣을 위치로 간 뒤 놓기 전까지 기다리는 시간(ms). 예전에는 서버에서 time.sleep(1)
+SAVE_SETTLE_MS = int(os.environ.get("CALLET_SAVE_SETTLE_MS", "1000"))
+# 프레임 하나에 넣을 최대 단계 수 (ESP32 수신 버퍼 크기에 맞춤). 넘으면 프레임을 나눠 보낸다
+FRAME_MAX_STEPS = int(os.environ.get("CALLET_FRAME_MAX_STEPS", "32"))
+
+
+class MotorFrame:
+    """
+    모터 단계 여러 개를 한 메시지로 묶는다. ESP32 는 받은 순서대로 실행한다.
+
+        M3000;  슬라이더를 3000 위치로 이동
+        R3000;  3000 위치에서 카드를 놓음
+        W1000;  1000ms 대기 (ESP32 에서 기다리므로 서버 스레드는 막히지 않음)
+        r;      슬롯 문자 명령 (기존 ESP32 배출 명령 r/s/l)
+
+    연달은 대기만 합친다. ESP32 는 M 단계마다 배출 모터를 돌리므로 (arduino.ino runMotorForward)
+    이동을 합치면 여러 카드를 꺼낼 때 한 장만 나온다.
+    """
+
+    def __init__(self, max_steps=FRAME_MAX_STEPS):
+        self.max_steps = max_steps
+        self.steps = []  # [(op, arg)], arg 가 None 이면 인자 없는 명령
+
+    def _append(self, op, arg=None):
+        if self.steps:
+            last_op, last_arg = self.steps[-1]
+            if op == "W" and last_op == "W":
+                self.steps[-1] = ("W", last_arg + arg)
+                return self
+        self.steps.append((op, arg))
+        return self
+
+    def move(self, slot):
+        return self._append("M", slot * SLOT_POSITION_STEP)
+
+    def release(self, slot):
+        return self._append("R", slot * SLOT_POSITION_STEP)
+
+    def wait(self, ms):
+        if ms > 0:
+            self._append("W", ms)
+        return self
+
+    def save(self, slot, settle_ms=SAVE_SETTLE_MS):
+        """저장: 슬롯 위치로 이동 → 잠시 대기 → 카드 놓기."""
+        return self.move(slot).wait(settle_ms).release(slot)
+
+    def dispense(self, command_char):
+        """r/s/l 처럼 문자 하나로 된 기존 배출 명령."""
+        return self._append(command_char)
+
+    def __bool__(self):
+        return bool(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def encode(self):
+        """보낼 프레임 문자열 리스트. 보통 하나, 단계가 많으면 max_steps 개씩 나눈다."""
+        steps = self.steps
+        while steps and steps[-1][0] == "W":
+            steps = steps[:-1]  # 마지막 대기는 기다릴 다음 동작이 없음
+        encoded = [op if arg is None else f"{op}{arg}" for op, arg in steps]
+        return ["".join(f"{step};" for step in encoded[i:i + self.max_steps])
+                for i in range(0, len(encoded), self.max_steps)]
+
+    def flush(self, send):
+        """모인 단계를 send(frame) 으로 보내고 비운다. 보낸 프레임 수를 돌려준다."""
+        frames = self.encode()
+        self.steps = []
+        for frame in frames:
+            send(frame)
+        return len(frames)
@@ -0,0 +1,175 @@
+import os
+import ssl
+import threading
+import time
+from collections import deque
+import numpy as np
+import paho.mqtt.client as mqtt
+from command_channel import DEFAULT_DEVICE
+import metrics
+
+# ===== MQTT 설정 =====
+MQTT_BROKER = os.environ.get("CALLET_MQTT_BROKER", "voicecardwallet.r-e.kr")
+MQTT_PORT = int(os.environ.get("CALLET_MQTT_PORT", "8883"))
+# 8883 이면 TLS. 인증서 경로는 대부분 시스템 기본값으로 충분함
+MQTT_CA_CERTS = os.environ.get("CALLET_MQTT_CA_CERTS", "/etc/ssl/certs/ca-certificates.crt")
+# 고정 client id + clean_session=False → 재접속해도 브로커가 세션(미전달 QoS 1 메시지)을 유지
+MQTT_CLIENT_ID = os.environ.get("CALLET_MQTT_CLIENT_ID", "callet-server")
+MQTT_TOPIC = "esp32/commands"  # ESP32가 구독하는 토픽. 지갑별 토픽은 esp32/commands/<device>
+MQTT_QOS = int(os.environ.get("CALLET_MQTT_QOS", "1"))
+# 브로커와 끊겨 있는 동안 쌓아둘 최대 명령 수 (넘으면 가장 오래된 것부터 버림)
+MQTT_OUTBOX_MAX = int(os.environ.get("CALLET_MQTT_OUTBOX_MAX", "100"))
+MQTT_RECONNECT_MIN = 1
+MQTT_RECONNECT_MAX = 30
+
+
+def _make_client(client_id):
+    if hasattr(mqtt, "CallbackAPIVersion"):  # paho-mqtt 2.x
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id, clean_session=False)
+    return mqtt.Client(client_id=client_id, clean_session=False)
+
+
+class MqttTransport:
+    """
+    MQTT 명령 전송. 연결은 하나만 맺고 끊기면 paho 가 backoff 로 다시 붙는다.
+    QoS 1 로 보내고 PUBACK 이 올 때까지의 지연시간을 잰다.
+    끊겨 있는 동안의 명령은 outbox 에 모아뒀다가 다시 연결되면 순서대로 보낸다.
+    """
+
+    def __init__(self, broker=MQTT_BROKER, port=MQTT_PORT, client_id=MQTT_CLIENT_ID,
+                 topic=MQTT_TOPIC, qos=MQTT_QOS, outbox_max=MQTT_OUTBOX_MAX, ca_certs=MQTT_CA_CERTS):
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self._lock = threading.Lock()
+        self._connected = False
+        self._started = False
+        self._outbox = deque(maxlen=outbox_max)  # (topic, payload)
+        self._inflight = {}    # mid → 보낸 시각
+        self._early_acks = set()  # publish() 가 mid 를 등록하기 전에 도착한 PUBACK
+        self._latencies = deque(maxlen=512)
+        self.published = 0
+        self.acked = 0
+        self.dropped = 0
+
+        self._client = _make_client(client_id)
+        if port == 8883:
+            self._client.tls_set(ca_certs=ca_certs, tls_version=ssl.PROTOCOL_TLSv1_2)
+        self._client.reconnect_delay_set(min_delay=MQTT_RECONNECT_MIN, max_delay=MQTT_RECONNECT_MAX)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_publish = self._on_publish
+
+    def start(self):
+        """연결은 백그라운드 스레드에서 (브로커가 죽어 있어도 import/기동이 막히지 않음). 여러 번 불러도 한 번만."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._client.connect_async(self.broker, self.port, 60)
+        self._client.loop_start()
+
+    def stop(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def topic_for(self, device=DEFAULT_DEVICE):
+        # 기본 지갑은 기존 토픽 그대로, 나머지는 지갑별 하위 토픽
+        return self.topic if device == DEFAULT_DEVICE else f"{self.topic}/{device}"
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"MQTT 연결 실패, 코드: {rc}")
+            return
+        print("MQTT 브로커 연결 성공")
+        # outbox 를 다 비운 뒤에 connected 로 바꿔야 새 명령이 밀린 명령을 앞지르지 않는다
+        while True:
+            with self._lock:
+                if not self._outbox:
+                    self._connected = True
+                    return
+                pending = list(self._outbox)
+                self._outbox.clear()
+            for i, (topic, payload) in enumerate(pending):
+                if not self._publish(topic, payload, requeue=False):
+                    # 다시 끊김 → 못 보낸 것을 순서대로 outbox 앞에 되돌려 두고 다음 연결 때 이어서
+                    self._requeue_front(pending[i:])
+                    return
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            self._connected = False
+        if rc != 0:
+            print(f"MQTT 연결 끊김 (코드: {rc}), 재연결 시도")
+
+    def _on_publish(self, client, userdata, mid):
+        now = time.perf_counter()
+        with self._lock:
+            sent_at = self._inflight.pop(mid, None)
+            if sent_at is None:
+                self._early_acks.add(mid)
+                return
+            self.acked += 1
+            self._latencies.append(now - sent_at)
+
+    def _enqueue(self, topic, payload):
+        with self._lock:
+            if len(self._outbox) == self._outbox.maxlen:
+                self.dropped += 1
+                print(f"⚠️ MQTT outbox 가득 참, 가장 오래된 명령 버림: {self._outbox[0]}")
+            self._outbox.append((topic, payload))
+
+    def _requeue_front(self, items):
+        with self._lock:
+            merged = list(items) + list(self._outbox)
+            overflow = max(0, len(merged) - self._outbox.maxlen)
+            if overflow:
+                self.dropped += overflow
+                print(f"⚠️ MQTT outbox 가득 참, 가장 오래된 명령 {overflow}개 버림: {merged[:overflow]}")
+            self._outbox.clear()
+            self._outbox.extend(merged[overflow:])
+
+    def _publish(self, topic, payload, requeue=True):
+        sent_at = time.perf_counter()
+        info = self._client.publish(topic, payload, qos=self.qos)
+        # QoS 1 이상은 그 사이에 끊겨도 (MQTT_ERR_NO_CONN) paho 가 들고 있다가 재연결 때 다시 보낸다
+        kept_by_client = info.rc == mqtt.MQTT_ERR_NO_CONN and self.qos > 0
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and not kept_by_client:
+            if requeue:
+                self._enqueue(topic, payload)
+            return False
+        with self._lock:
+            self.published += 1
+            if info.mid in self._early_acks:
+                self._early_acks.discard(info.mid)
+                self.acked += 1
+                self._latencies.append(time.perf_counter() - sent_at)
+            else:
+                self._inflight[info.mid] = sent_at
+        return True
+
+    @metrics.timer("device_send")
+    def publish(self, command, device=DEFAULT_DEVICE):
+        """명령을 보낸다. 연결이 없으면 outbox 에 넣고 False (다시 연결되면 자동으로 보냄)."""
+        topic = self.topic_for(device)
+        with self._lock:
+            connected = self._connected
+        if not connected:
+            self._enqueue(topic, command)
+            return False
+        return self._publish(topic, command)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                "connected": self._connected,
+                "published": self.published,
+                "acked": self.acked,
+                "inflight": len(self._inflight),
+                "outbox": len(self._outbox),
+                "dropped": self.dropped,
+                "puback_p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+                "puback_p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else None,
+            }
@@ -0,0 +1,113 @@
+import os
+import threading
+import zlib
+import numpy as np
+from command_classifier import IntentClassifier
+from model import normalize_text
+
+# 오프라인에서 학습한 가중치 (train_ngram_classifier.py 로 생성)
+NGRAM_MODEL_PATH = os.environ.get(
+    "CALLET_NGRAM_MODEL",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "ngram_intent.npz"),
+)
+NGRAM_DIM = 2 ** 14   # 해시 버킷 수
+NGRAM_MAX_N = 3       # 문자 1~3-gram
+
+
+def ngram_features(text, dim=NGRAM_DIM, max_n=NGRAM_MAX_N):
+    """
+    문자 n-gram 을 해시해서 (버킷 인덱스, 값) 으로 돌려준다.
+    crc32 를 쓰므로 프로세스가 달라도 같은 버킷 (파이썬 hash() 는 프로세스마다 다름).
+    """
+    padded = f" {normalize_text(text)} "
+    counts = {}
+    for n in range(1, max_n + 1):
+        for i in range(len(padded) - n + 1):
+            bucket = zlib.crc32(padded[i:i + n].encode("utf-8")) & (dim - 1)
+            counts[bucket] = counts.get(bucket, 0) + 1
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    vals = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    vals /= max(np.linalg.norm(vals), 1e-12)
+    return idx, vals
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def train(texts, labels, intents=None, dim=NGRAM_DIM, epochs=300, lr=1.0, l2=1e-4):
+    """
+    해시 n-gram 특징 위에 다항 로지스틱 회귀를 학습한다 (전체 배치 경사하강).
+    returns (W, b, intents)
+    """
+    intents = intents or sorted(set(labels))
+    y = np.array([intents.index(label) for label in labels])
+    X = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        idx, vals = ngram_features(text, dim)
+        X[row, idx] = vals
+
+    W = np.zeros((dim, len(intents)), dtype=np.float32)
+    b = np.zeros(len(intents), dtype=np.float32)
+    onehot = np.eye(len(intents), dtype=np.float32)[y]
+    for _ in range(epochs):
+        probs = _softmax(X @ W + b)
+        grad = (probs - onehot) / len(texts)
+        W -= lr * (X.T @ grad + l2 * W)
+        b -= lr * grad.sum(axis=0)
+    return W, b, intents
+
+
+def save_model(path, W, b, intents):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, W=W, b=b, intents=np.array(intents), dim=NGRAM_DIM, max_n=NGRAM_MAX_N)
+
+
+class NgramClassifier(IntentClassifier):
+    """
+    KoGPT2 없이 CPU 에서 도는 가벼운 의도 분류기.
+    해시된 문자 n-gram + 선형 모델이라 문장당 수십 µs, 메모리는 가중치 행렬 하나.
+    점수는 softmax 확률 (거절 임계값도 확률 기준).
+    """
+
+    source = "ngram"
+
+    def __init__(self, path=NGRAM_MODEL_PATH, **kwargs):
+        if not os.path.exists(path):
+            # 첫 문장이 들어왔을 때가 아니라 만들 때 알려준다
+            raise FileNotFoundError(
+                f"n-gram 분류기 가중치가 없습니다: {path} "
+                "(python train_ngram_classifier.py 로 만들거나 CALLET_NGRAM_MODEL 로 경로 지정)"
+            )
+        super().__init__(**kwargs)
+        self.path = path
+        self._W = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._W is None:
+            with self._lock:
+                if self._W is None:
+                    data = np.load(self.path)
+                    self._dim = int(data["dim"])
+                    self._max_n = int(data["max_n"])
+                    self._b = data["b"]
+                    self._intents = [str(intent) for intent in data["intents"]]
+                    self._W = data["W"]
+        return self._W
+
+    @property
+    def intents(self):
+        self._load()
+        return self._intents
+
+    def _intent_scores(self, texts):
+        W = self._load()
+        logits = np.empty((len(texts), len(self._intents)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # 희소 특징이라 0 이 아닌 버킷의 가중치 행만 더하면 됨
+            idx, vals = ngram_features(text, self._dim, self._max_n)
+            logits[row] = vals @ W[idx] + self._b
+        return _softmax(logits)
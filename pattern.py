@@ -1,12 +1,131 @@
-synonym_groups = [
+import json
+import os
+from collections import deque, namedtuple
+
+# 카드 동의어 사전 파일: [["대표이름", "별칭1", "별칭2"], ...]
+SYNONYMS_PATH = os.environ.get(
+    "CALLET_SYNONYMS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "synonyms.json"),
+)
+
+default_synonym_groups = [
     ["주민등록증", "민증", "등록증"],
     ["롯데카드", "롯데"],
     ["삼성카드", "삼성"],
 ]
 
+# canonical: 대표 이름, alias: 문장에 실제로 나온 별칭, [start, end): 문장 내 위치
+Mention = namedtuple("Mention", ["canonical", "alias", "start", "end"])
+
+
+class AhoCorasick:
+    """
+    여러 패턴을 하나의 오토마톤으로 컴파일해서 문장을 한 번만 훑어 모든 등장 위치를 찾는다.
+    패턴 수와 무관하게 O(문장 길이 + 매치 수).
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]      # 이 노드에서 끝나는 패턴 (길이, 값)
+        self._dict_link = [0]   # 실패 링크를 따라가며 만나는 다음 출력 노드 (0 이면 없음)
+        self._built = False
+
+    def add(self, pattern, value):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._dict_link.append(0)
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._out[node] = (len(pattern), value)
+        self._built = False
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[child] = fail
+                self._dict_link[child] = fail if self._out[fail] else self._dict_link[fail]
+                queue.append(child)
+        self._built = True
+
+    def iter_all(self, text):
+        """겹치는 것까지 모든 매치를 (start, end, value) 로 돌려준다 (끝 위치 순)."""
+        if not self._built:
+            self.build()
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] else dict_link[node]
+            while hit:
+                length, value = out[hit]
+                yield i + 1 - length, i + 1, value
+                hit = dict_link[hit]
+
+    def find_all(self, text):
+        """가장 왼쪽에서 시작하는 가장 긴 매치를 겹치지 않게 고른다 ("롯데카드" 안의 "롯데" 는 무시)."""
+        matches = sorted(self.iter_all(text), key=lambda m: (m[0], -m[1]))
+        selected = []
+        last_end = 0
+        for start, end, value in matches:
+            if start >= last_end:
+                selected.append((start, end, value))
+                last_end = end
+        return selected
+
+
+class SynonymRegistry:
+    """별칭 → 대표 이름 정규화와, 문장 안의 카드 언급 찾기를 담당한다."""
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.canonical = {}
+        self.matcher = AhoCorasick()
+        for group in groups:
+            for alias in group:
+                alias = alias.strip()
+                if alias:
+                    self.canonical[alias] = group[0]
+                    self.matcher.add(alias, group[0])
+        self.matcher.build()
+
+    @classmethod
+    def load(cls, path=SYNONYMS_PATH):
+        try:
+            with open(path, encoding="utf-8") as f:
+                groups = json.load(f)
+        except FileNotFoundError:
+            groups = default_synonym_groups
+        return cls(groups)
+
+    def canonicalize(self, name):
+        name = name.strip()
+        return self.canonical.get(name, name)
+
+    def find_mentions(self, text):
+        return [Mention(canonical, text[start:end], start, end)
+                for start, end, canonical in self.matcher.find_all(text)]
+
+
+registry = SynonymRegistry.load()
+synonym_groups = registry.groups
+
 def find_canonical_name(name):
-    name = name.strip()
-    for group in synonym_groups:
-        if name in group:
-            return group[0]
-    return name
+    return registry.canonicalize(name)
+
+def find_mentions(text):
+    return registry.find_mentions(text)
@@ -0,0 +1,267 @@
+"""
+녹음 파일/텍스트 발화를 전체 파이프라인에 돌려서 정확도와 단계별 지연시간을 잰다.
+음성 인식 → 의도 분류 → 파서 → (가짜) 장치 전송. 마이크와 ESP32 없이 회귀 테스트용.
+
+    python replay.py data/replay_cases.jsonl
+    python replay.py recordings/ --stt-backend vosk --workers 4
+    python replay.py data/bench_utterances.txt --repeat 100 --json report.json
+
+입력:
+    *.jsonl  한 줄에 하나: {"text": "롯데카드 1번 저장", "intent": "save", "card": "롯데카드", "slot": 1}
+             녹음이면 "text" 대신 "audio": "rec/0001.wav" (jsonl 파일 기준 상대 경로)
+             intent/card/slot 은 채점할 것만 적으면 된다 (없으면 지연시간만 측정)
+    *.txt    한 줄에 문장 하나 (정답 없음)
+    *.wav    녹음 하나, 디렉터리면 안의 *.wav 전부 (정답 없음)
+
+CPU 를 쓰는 단계(인식/분류/파싱)는 프로세스 풀에서 나눠 돌린다. 워커마다 모델을 따로 읽으므로
+KoGPT2 임베딩 백엔드는 워커 수만큼 메모리를 쓴다. 슬롯 저장소는 워커마다 메모리에 새로 만들며
+실제 slots.db 는 건드리지 않는다 (삭제/이동 성공 여부는 워커에 먼저 들어간 저장 명령에 따라 달라짐).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+STAGES = ["stt", "classify", "parse", "device"]
+FIELDS = ["intent", "card", "slot"]
+
+# ===== 워커 프로세스 =====
+_stt_backend = None
+_device_latency = 0.0
+_warmup_error = None
+
+
+def _init_worker(stt_backend, device_latency_ms):
+    global _stt_backend, _device_latency, _warmup_error
+    # 워커 여러 개가 각자 전체 코어를 쓰려고 하면 오히려 느려진다
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    # 재생 중인 명령이 실제 지갑 슬롯 DB 에 저장되면 안 된다
+    os.environ["CALLET_SLOT_DB"] = ":memory:"
+    _stt_backend = stt_backend
+    _device_latency = device_latency_ms / 1000
+    # 모델 로딩 시간이 첫 발화 지연시간에 섞이지 않도록 워커마다 한 번 돌려둔다
+    _warmup_error = _run_case({"text": "롯데카드 꺼내줘"})["error"]
+
+
+class FakeDevice:
+    """보낸 프레임을 기록만 하는 장치. latency 만큼 기다려서 HTTP/MQTT 왕복을 흉내낸다."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.frames = []
+
+    def send(self, frame):
+        if self.latency:
+            time.sleep(self.latency)
+        self.frames.append(frame)
+
+
+def _run_case(case):
+    """발화 하나를 파이프라인에 통과시키고 {예측, 단계별 시간(초), 오류} 를 돌려준다."""
+    # 파이프라인 모듈은 워커 안에서 import (CALLET_SLOT_DB 설정 후, 부모 프로세스는 모델을 읽지 않음)
+    import wallet_commands
+    from command_parser import parse_command
+    from motor_frame import MotorFrame
+
+    record = {"case": case, "timings": {}, "error": None}
+    timings = record["timings"]
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            text = case.get("text")
+            if text is None:
+                import speech_stream
+                t = time.perf_counter()
+                text = speech_stream.recognize_utterance(
+                    speech_stream.WavSource(case["audio"]),
+                    speech_stream.make_recognizer(_stt_backend),
+                )
+                timings["stt"] = time.perf_counter() - t
+                record["transcript"] = text
+                if not text:
+                    record["error"] = speech_stream.FAILED
+                    return record
+
+            t = time.perf_counter()
+            intent = wallet_commands.classifier.classify(text)
+            timings["classify"] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            commands = parse_command(text, classify=lambda _: intent)
+            timings["parse"] = time.perf_counter() - t
+
+            device = FakeDevice(_device_latency)
+            t = time.perf_counter()
+            frame = MotorFrame()
+            results = [wallet_commands.execute_command(cmd, frame.dispense) for cmd in commands]
+            frame.flush(device.send)
+            timings["device"] = time.perf_counter() - t
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        return record
+
+    first = commands[0] if commands else None
+    record["predicted"] = {
+        "intent": first.intent if first else None,
+        "card": first.card if first else None,
+        "slot": first.slot if first else None,
+    }
+    record["commands"] = len(commands)
+    record["executed"] = sum(1 for ok, _ in results if ok)
+    record["frames"] = device.frames
+    return record
+
+
+def _worker_ready(_):
+    return _warmup_error
+
+
+# ===== 입력 읽기 =====
+
+def load_cases(paths):
+    cases = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".wav"):
+                    cases.append({"audio": os.path.join(path, name)})
+        elif path.lower().endswith(".wav"):
+            cases.append({"audio": path})
+        elif path.endswith(".jsonl"):
+            base = os.path.dirname(os.path.abspath(path))
+            with open(path, encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    case = json.loads(line)
+                    if "audio" in case:
+                        case["audio"] = os.path.join(base, case["audio"])
+                    elif "text" not in case:
+                        raise ValueError(f"{path}:{line_no}: text 또는 audio 가 필요합니다")
+                    cases.append(case)
+        else:
+            with open(path, encoding="utf-8") as f:
+                cases.extend({"text": line.strip()} for line in f if line.strip())
+    return cases
+
+
+# ===== 집계 =====
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+
+def summarize(records, wall_s):
+    stage_samples = {stage: [] for stage in STAGES}
+    totals = []
+    scored = {field: [0, 0] for field in FIELDS}  # [맞음, 채점 대상]
+    exact = [0, 0]
+    mistakes = []
+    for r in records:
+        for stage, seconds in r["timings"].items():
+            stage_samples[stage].append(seconds)
+        if r["timings"]:
+            totals.append(sum(r["timings"].values()))
+        expected = {f: r["case"][f] for f in FIELDS if f in r["case"]}
+        if not expected:
+            if r["error"] is not None:
+                mistakes.append({"case": r["case"], "transcript": r.get("transcript"),
+                                 "predicted": {}, "error": r["error"]})
+            continue
+        predicted = r.get("predicted", {})
+        wrong = {}
+        for field, value in expected.items():
+            scored[field][1] += 1
+            if predicted.get(field) == value:
+                scored[field][0] += 1
+            else:
+                wrong[field] = predicted.get(field)
+        exact[1] += 1
+        if not wrong and r["error"] is None:
+            exact[0] += 1
+        else:
+            mistakes.append({"case": r["case"], "transcript": r.get("transcript"),
+                             "predicted": wrong, "error": r["error"]})
+
+    stages = {}
+    for stage, samples in list(stage_samples.items()) + [("total", totals)]:
+        if samples:
+            stages[stage] = {
+                "count": len(samples),
+                "p50_ms": percentile_ms(samples, 50),
+                "p95_ms": percentile_ms(samples, 95),
+                "p99_ms": percentile_ms(samples, 99),
+                "max_ms": float(max(samples) * 1000),
+            }
+    return {
+        "utterances": len(records),
+        "errors": sum(1 for r in records if r["error"] is not None),
+        "wall_s": wall_s,
+        "throughput_per_s": len(records) / wall_s if wall_s > 0 else None,
+        "accuracy": {field: hit / total for field, (hit, total) in scored.items() if total},
+        "exact_match": exact[0] / exact[1] if exact[1] else None,
+        "stages": stages,
+        "mistakes": mistakes,
+    }
+
+
+def print_report(report, show_mistakes):
+    print(f"발화 {report['utterances']}개, 오류 {report['errors']}개, "
+          f"{report['wall_s']:.2f}s ({report['throughput_per_s'] or 0:.1f}개/s)")
+    if report["accuracy"]:
+        parts = [f"{field} {acc:.1%}" for field, acc in report["accuracy"].items()]
+        print(f"정확도: {', '.join(parts)} / 전체 일치 {report['exact_match']:.1%}")
+    print(f"{'stage':<9} {'count':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<9} {s['count']:>6} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+              f"{s['p99_ms']:>9.2f} {s['max_ms']:>9.2f}")
+    for m in report["mistakes"][:show_mistakes]:
+        source = m["case"].get("text") or m["case"].get("audio")
+        detail = m["error"] or ", ".join(f"{f}={v!r}" for f, v in m["predicted"].items())
+        heard = f" (인식: {m['transcript']})" if m["transcript"] else ""
+        print(f"  ✗ {source}{heard} → {detail}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="녹음/텍스트 발화 일괄 재생 (정확도 + 단계별 지연시간)")
+    parser.add_argument("inputs", nargs="+", help="*.jsonl, *.txt, *.wav 또는 WAV 디렉터리")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--stt-backend", default=os.environ.get("CALLET_STT_BACKEND", "google"),
+                        choices=["google", "google-cloud", "vosk"])
+    parser.add_argument("--device-latency-ms", type=float, default=0.0, help="가짜 장치 전송 지연")
+    parser.add_argument("--repeat", type=int, default=1, help="입력 전체를 여러 번 (처리량 측정용)")
+    parser.add_argument("--show-mistakes", type=int, default=20)
+    parser.add_argument("--json", help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    cases = load_cases(args.inputs) * args.repeat
+    if not cases:
+        print("재생할 발화가 없습니다.")
+        return 1
+    workers = max(1, min(args.workers, len(cases)))
+    init_args = (args.stt_backend, args.device_latency_ms)
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args) as pool:
+        # 워커를 띄우고 모델을 읽힌 뒤부터 시간을 잰다
+        for error in set(pool.map(_worker_ready, range(workers * 2))):
+            if error:
+                print(f"⚠️ 워커 준비 중 오류: {error}")
+        start = time.perf_counter()
+        records = list(pool.map(_run_case, cases, chunksize=max(1, len(cases) // (workers * 8))))
+        wall_s = time.perf_counter() - start
+
+    report = summarize(records, wall_s)
+    print_report(report, args.show_mistakes)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,54 +1,86 @@
-import re
-import time
-from pattern import find_canonical_name
-from tts import speak
-from command_classifier import classify_command
+import tts
+from tts import speak, PRIORITY_HIGH
+from slot_store import open_slot_store, slot_num_to_cmd, SlotError
+from pattern import synonym_groups
+from command_parser import parse_command
+from device_transport import transport, TransportError
+from motor_frame import MotorFrame
+import metrics
+
+slots = open_slot_store()  # 슬롯 저장소 (SQLite, 워커 간 공유)
+
+
+def prerender_prompts():
+    """고정 안내 + 카드별 확인 문구를 미리 합성해 둔다 (여러 번 불러도 한 번만)."""
+    names = [group[0] for group in synonym_groups]
+    prompts = list(tts.FIXED_PROMPTS)
+    for name in names:
+        prompts += [f"{name}를 {slot}번에 저장합니다." for slot in slot_num_to_cmd]
+        prompts.append(f"{name}를 꺼냅니다.")
+    tts.prerender(prompts)
 
-slots = {}  # 글로벌 슬롯 저장소
 
 def send_esp32_command(command):
-    import requests
     url = "http://192.168.0.100:80/command"
     try:
-        response = requests.post(url, json={"command": command}, timeout=3)
+        response = transport.post(url, json={"command": command})
         if response.status_code == 200:
             print(f"ESP32 명령 전송 성공: {command}")
         else:
             print(f"ESP32 명령 전송 실패: {response.status_code}")
-    except requests.RequestException as e:
+    except TransportError as e:
         print(f"ESP32 통신 오류: {e}")
 
+@metrics.timer("command")
 def process_text_command(text):
-    cmd_type = classify_command(text)
-    
-    if cmd_type == "save":
-        slot_num_match = re.search(r'(\d+)', text)
-        if not slot_num_match:
-            speak("슬롯 번호를 찾을 수 없습니다.")
-            return
-        slot_num = int(slot_num_match.group(1))
-        name = text[:slot_num_match.start()].strip()
-        name = find_canonical_name(name)
-        slots[name] = slot_num
-        send_esp32_command(f"M{slot_num * 1000};")
-        speak(f"{name}를 {slot_num}번에 저장합니다.")
-        time.sleep(1)
-        send_esp32_command(f"R{slot_num * 1000};")
-        speak("보관 완료!")
+    # 문장을 한 번 훑어서 (의도, 카드, 슬롯) 명령 리스트로 → 여러 카드도 한 번에 처리
+    commands = parse_command(text)
+    if not commands:
+        speak("명령을 이해하지 못했습니다.", PRIORITY_HIGH)
+        return
 
-    elif cmd_type == "delete":
-        name = find_canonical_name(text.replace("삭제", "").strip())
-        if name in slots:
-            del slots[name]
-            speak(f"{name} 정보를 삭제했습니다.")
-        else:
-            speak(f"{name} 정보가 없습니다.")
-
-    elif cmd_type == "move":
-        name = find_canonical_name(text.strip())
-        if name in slots:
-            slot_num = slots[name]
-            send_esp32_command(f"M{slot_num * 1000};")
-            speak(f"{name}를 꺼냅니다.")
-        else:
-            speak(f"{name} 슬롯이 없습니다.")
+    # 모터 동작은 프레임 하나에 모아 두었다가 마지막에 한 번에 보낸다 (카드 N장이어도 요청 1번)
+    frame = MotorFrame()
+    saved = []
+    for cmd in commands:
+        name = cmd.card
+        if not name:
+            # 카드 이름 없이 "... 정보가 없습니다" 처럼 말하지 않도록
+            speak("카드 이름을 인식하지 못했습니다.", PRIORITY_HIGH)
+            continue
+
+        if cmd.intent == "save":
+            if cmd.slot is None:
+                speak("슬롯 번호를 찾을 수 없습니다.", PRIORITY_HIGH)
+                continue
+            slot_num = cmd.slot
+            try:
+                swapped = slots.save(name, slot_num)
+            except SlotError as e:
+                speak(str(e), PRIORITY_HIGH)
+                continue
+            if swapped:
+                speak(f"{swapped}는 {slots[swapped]}번으로 바꿨습니다.")
+            frame.save(slot_num)
+            saved.append(name)
+            speak(f"{name}를 {slot_num}번에 저장합니다.")
+
+        elif cmd.intent == "delete":
+            if name in slots:
+                del slots[name]
+                speak(f"{name} 정보를 삭제했습니다.")
+            else:
+                speak(f"{name} 정보가 없습니다.")
+
+        elif cmd.intent == "move":
+            if name in slots:
+                slot_num = slots[name]
+                frame.move(slot_num)
+                speak(f"{name}를 꺼냅니다.")
+            else:
+                speak(f"{name} 슬롯이 없습니다.")
+
+    if frame:
+        frame.flush(send_esp32_command)
+    if saved:
+        speak("보관 완료!")
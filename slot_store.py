@@ -0,0 +1,429 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import abstractmethod
+from collections import deque
+from collections.abc import MutableMapping
+import metrics
+
+# 슬롯 저장소 위치. "" 또는 ":memory:" 이면 프로세스 메모리에만 저장 (재시작하면 사라짐)
+SLOT_DB_PATH = os.environ.get(
+    "CALLET_SLOT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "slots.db"),
+)
+
+# 지갑 하드웨어의 슬롯 번호 → ESP32 명령 문자 (저장 가능한 슬롯 = 이 키들)
+slot_num_to_cmd = {
+    1: "r",
+    2: "s",
+    3: "l"
+}
+
+# 이미 다른 카드가 있는 슬롯에 저장할 때: reject (거절) | swap (두 카드의 슬롯을 맞바꿈)
+SLOT_CONFLICT_POLICY = os.environ.get("CALLET_SLOT_CONFLICT", "reject")
+
+# 변경 기록을 몇 version 까지 남길지 (/slots?since= 로 이보다 오래된 version 을 주면 전체를 다시 보냄)
+SLOT_CHANGE_LOG_MAX = int(os.environ.get("CALLET_SLOT_CHANGE_LOG", "256"))
+
+
+class SlotError(ValueError):
+    pass
+
+
+class InvalidSlotError(SlotError):
+    def __init__(self, slot):
+        super().__init__(f"없는 슬롯 번호: {slot}")
+        self.slot = slot
+
+
+class SlotConflictError(SlotError):
+    def __init__(self, slot, occupant):
+        super().__init__(f"{slot}번 슬롯에 이미 {occupant} 이(가) 있습니다")
+        self.slot = slot
+        self.occupant = occupant
+
+
+class SlotSchemaError(Exception):
+    """예전 DB 에 한 슬롯에 카드가 여러 장 배정되어 있어 슬롯 유일 제약을 걸 수 없음. 카드 배정을 임의로 지우지 않고 멈춘다."""
+
+    def __init__(self, path, duplicates):
+        detail = ", ".join(f"{slot}번: {names}" for slot, names in duplicates)
+        super().__init__(
+            f"{path} 의 slots 테이블에 한 슬롯에 여러 카드가 있어 slot UNIQUE 제약을 걸 수 없습니다 ({detail}). "
+            "카드 배정을 확인해 정리한 뒤 다시 시작하거나 CALLET_SLOT_DB 로 새 경로를 지정하세요."
+        )
+        self.path = path
+        self.duplicates = duplicates
+
+
+class SlotStore(MutableMapping):
+    """
+    카드 이름 ↔ 슬롯 번호 양방향 저장소 (한 슬롯에는 카드 하나).
+    기존 코드가 쓰던 dict 사용법 (slots[name] = num, del slots[name], name in slots) 을 그대로 지원하고,
+    저장/삭제/이동은 각각 하나의 원자적 연산으로 처리한다.
+    capacity 밖의 슬롯은 InvalidSlotError, 이미 찬 슬롯은 정책에 따라 SlotConflictError 또는 맞바꿈.
+    version 은 변경될 때마다 1씩 증가하는 카운터, epoch 는 저장소가 새로 만들어질 때마다 바뀌는 값
+    (저장소를 지우고 다시 만들어 version 이 처음부터 다시 세어져도 (epoch, version) 은 겹치지 않음).
+    """
+
+    epoch = 0
+
+    def __init__(self, capacity=None, on_conflict=SLOT_CONFLICT_POLICY):
+        self.capacity = frozenset(capacity) if capacity is not None else None
+        self.on_conflict = on_conflict
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """이 프로세스에서 저장/삭제/이동이 끝날 때마다 callback() 을 부른다 (다른 워커 프로세스의 변경은 모름)."""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        # 저장소 잠금/트랜잭션이 끝난 뒤에 호출 (callback 안에서 저장소를 읽어도 됨)
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"슬롯 변경 알림 오류: {e}")
+
+    # ----- 백엔드가 구현할 부분 (MutableMapping 이 ABCMeta 라 빠뜨리면 만들 때 TypeError) -----
+    @abstractmethod
+    def snapshot(self):
+        """(version, {이름: 슬롯}, {슬롯: 이름}) — 반환된 dict 는 수정하지 말 것."""
+
+    @abstractmethod
+    def save(self, name, slot, on_conflict=None):
+        """저장 (이미 있는 카드면 슬롯 변경). 맞바꿈이 일어나면 밀려난 카드 이름을 돌려준다."""
+
+    @abstractmethod
+    def delete(self, name):
+        """삭제한 카드의 슬롯 번호를 돌려준다 (없으면 None)."""
+
+    @abstractmethod
+    def move(self, name, slot, on_conflict=None):
+        """이미 저장된 카드를 다른 슬롯으로 옮긴다 (없으면 False)."""
+
+    @abstractmethod
+    def changes_since(self, version):
+        """
+        version 이후에 바뀐 카드만: (현재 version, {이름: 슬롯, 삭제된 카드는 None}).
+        변경 기록이 남아 있지 않을 만큼 오래됐거나 현재보다 큰 version 이면 None (전체를 다시 읽어야 함).
+        """
+
+    def _plan(self, name, slot, current, occupant, on_conflict):
+        """
+        저장/이동 전 검사. current: name 의 지금 슬롯, occupant: slot 에 있는 카드.
+        맞바꿔야 하면 occupant 를 돌려준다.
+        """
+        if self.capacity is not None and slot not in self.capacity:
+            raise InvalidSlotError(slot)
+        if occupant is None or occupant == name:
+            return None
+        if (on_conflict or self.on_conflict) == "swap" and current is not None:
+            return occupant
+        # 맞바꿀 자리가 없으면 (새 카드) 기존 카드를 지우지 않고 거절
+        raise SlotConflictError(slot, occupant)
+
+    # ----- 조회 -----
+    @property
+    def version(self):
+        return self.snapshot()[0]
+
+    def slot_of(self, name):
+        return self.snapshot()[1].get(name)
+
+    def name_at(self, slot):
+        return self.snapshot()[2].get(slot)
+
+    def free_slots(self):
+        if self.capacity is None:
+            return []
+        occupied = self.snapshot()[2]
+        return sorted(slot for slot in self.capacity if slot not in occupied)
+
+    def to_dict(self):
+        return dict(self.snapshot()[1])
+
+    # ----- dict 호환 -----
+    def __getitem__(self, name):
+        slot = self.slot_of(name)
+        if slot is None:
+            raise KeyError(name)
+        return slot
+
+    def __setitem__(self, name, slot):
+        self.save(name, slot)
+
+    def __delitem__(self, name):
+        if self.delete(name) is None:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in self.snapshot()[1]
+
+    def __iter__(self):
+        return iter(list(self.snapshot()[1]))
+
+    def __len__(self):
+        return len(self.snapshot()[1])
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def _reverse_index(by_name):
+    return {slot: name for name, slot in by_name.items()}
+
+
+class MemorySlotStore(SlotStore):
+    """한 프로세스 안에서만 쓰는 저장소 (테스트/개발용)."""
+
+    def __init__(self, capacity=None, on_conflict=SLOT_CONFLICT_POLICY):
+        super().__init__(capacity, on_conflict)
+        self._lock = threading.Lock()
+        self._version = 0
+        self._by_name = {}
+        self._by_slot = {}
+        self._changes = deque()  # (version, 이름, 슬롯 또는 None), 최근 SLOT_CHANGE_LOG_MAX 개 version 만
+        self.epoch = int(time.time() * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return self._version, self._by_name, self._by_slot
+
+    def _commit(self, by_name, changed):
+        # 조회 쪽에서 들고 있는 dict 는 건드리지 않도록 새 dict 로 교체
+        self._by_name = by_name
+        self._by_slot = _reverse_index(by_name)
+        self._version += 1
+        self._changes.extend((self._version, name, slot) for name, slot in changed.items())
+        while self._changes[0][0] <= self._version - SLOT_CHANGE_LOG_MAX:
+            self._changes.popleft()
+
+    def _assign(self, name, slot, on_conflict):
+        current = self._by_name.get(name)
+        swapped = self._plan(name, slot, current, self._by_slot.get(slot), on_conflict)
+        changed = {name: slot}
+        if swapped is not None:
+            changed[swapped] = current
+        self._commit({**self._by_name, **changed}, changed)
+        return swapped
+
+    def save(self, name, slot, on_conflict=None):
+        with self._lock:
+            swapped = self._assign(name, slot, on_conflict)
+        self._notify()
+        return swapped
+
+    def delete(self, name):
+        with self._lock:
+            if name not in self._by_name:
+                return None
+            by_name = dict(self._by_name)
+            slot = by_name.pop(name)
+            self._commit(by_name, {name: None})
+        self._notify()
+        return slot
+
+    def move(self, name, slot, on_conflict=None):
+        with self._lock:
+            if name not in self._by_name:
+                return False
+            self._assign(name, slot, on_conflict)
+        self._notify()
+        return True
+
+    def changes_since(self, version):
+        with self._lock:
+            if version > self._version or version < self._version - SLOT_CHANGE_LOG_MAX:
+                return None
+            return self._version, {name: slot for v, name, slot in self._changes if v > version}
+
+
+class SQLiteSlotStore(SlotStore):
+    """
+    SQLite(WAL) 저장소 + 메모리 캐시.
+    여러 gunicorn 워커가 같은 파일을 공유하고, 읽기는 version 한 줄만 확인해서
+    바뀌지 않았으면 메모리 캐시를 그대로 돌려준다.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS slots (
+            name TEXT PRIMARY KEY,
+            slot INTEGER NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        CREATE TABLE IF NOT EXISTS slot_changes (
+            version INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            slot INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_slot_changes_version ON slot_changes(version);
+        INSERT OR IGNORE INTO meta (key, value)
+            VALUES ('epoch', CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER));
+    """
+
+    def __init__(self, path, capacity=None, on_conflict=SLOT_CONFLICT_POLICY):
+        super().__init__(capacity, on_conflict)
+        self.path = path
+        self._local = threading.local()
+        self._cache_lock = threading.Lock()
+        self._cache = (-1, {}, {})
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        self._check_schema(conn)
+        self.epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    @staticmethod
+    def _has_unique_slot(conn):
+        for _, index, unique, *_ in conn.execute("PRAGMA index_list(slots)"):
+            columns = [row[2] for row in conn.execute(f"PRAGMA index_info('{index}')")]
+            if unique and columns == ["slot"]:
+                return True
+        return False
+
+    def _check_schema(self, conn):
+        # 이미 있던 파일이면 CREATE TABLE IF NOT EXISTS 가 제약을 추가하지 않으므로 직접 확인하고,
+        # 중복이 없으면 그 자리에서 유일 인덱스를 만든다 (여러 워커가 동시에 열어도 쓰기 잠금 안에서 한 번)
+        if self._has_unique_slot(conn):
+            return
+        with self._transaction() as conn:
+            if self._has_unique_slot(conn):
+                return
+            duplicates = conn.execute(
+                "SELECT slot, group_concat(name, ', ') FROM slots GROUP BY slot HAVING COUNT(*) > 1"
+            ).fetchall()
+            if duplicates:
+                raise SlotSchemaError(self.path, duplicates)
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_slots_slot_unique ON slots(slot)")
+        print(f"{self.path}: slots.slot 에 UNIQUE 인덱스를 추가했습니다")
+
+    def _conn(self):
+        # sqlite3 연결은 스레드 간에 공유하지 않는다 → 스레드마다 하나씩
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    class _Tx:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __enter__(self):
+            # 쓰기 잠금을 바로 잡아서 읽고-쓰기 사이에 다른 워커가 끼어들지 못하게 함
+            self.start = time.perf_counter()
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+            metrics.observe("slot_store", time.perf_counter() - self.start)
+            return False
+
+    def _transaction(self):
+        return self._Tx(self._conn())
+
+    @staticmethod
+    def _bump_version(conn, changed):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        conn.executemany(
+            "INSERT INTO slot_changes (version, name, slot) SELECT value, ?, ? FROM meta WHERE key = 'version'",
+            changed.items(),
+        )
+        conn.execute(
+            "DELETE FROM slot_changes WHERE version <= (SELECT value FROM meta WHERE key = 'version') - ?",
+            (SLOT_CHANGE_LOG_MAX,),
+        )
+
+    def _read_version(self):
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def snapshot(self):
+        version = self._read_version()
+        cached = self._cache
+        if cached[0] == version:
+            return cached
+
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            by_name = dict(conn.execute("SELECT name, slot FROM slots"))
+        finally:
+            conn.execute("COMMIT")
+        snapshot = (version, by_name, _reverse_index(by_name))
+        with self._cache_lock:
+            if snapshot[0] >= self._cache[0]:
+                self._cache = snapshot
+        return snapshot
+
+    def _assign(self, conn, name, slot, on_conflict):
+        row = conn.execute("SELECT slot FROM slots WHERE name = ?", (name,)).fetchone()
+        current = row[0] if row else None
+        row = conn.execute("SELECT name FROM slots WHERE slot = ?", (slot,)).fetchone()
+        swapped = self._plan(name, slot, current, row[0] if row else None, on_conflict)
+        if swapped is not None:
+            # 유일 인덱스 때문에 밀려날 카드를 잠시 비워둔 뒤 맞바꿈
+            conn.execute("UPDATE slots SET slot = -1 WHERE name = ?", (swapped,))
+        conn.execute(
+            "INSERT INTO slots (name, slot) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET slot = excluded.slot",
+            (name, slot),
+        )
+        changed = {name: slot}
+        if swapped is not None:
+            conn.execute("UPDATE slots SET slot = ? WHERE name = ?", (current, swapped))
+            changed[swapped] = current
+        self._bump_version(conn, changed)
+        return swapped
+
+    def save(self, name, slot, on_conflict=None):
+        with self._transaction() as conn:
+            swapped = self._assign(conn, name, slot, on_conflict)
+        self._notify()
+        return swapped
+
+    def delete(self, name):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT slot FROM slots WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM slots WHERE name = ?", (name,))
+            self._bump_version(conn, {name: None})
+        self._notify()
+        return row[0]
+
+    def move(self, name, slot, on_conflict=None):
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM slots WHERE name = ?", (name,)).fetchone() is None:
+                return False
+            self._assign(conn, name, slot, on_conflict)
+        self._notify()
+        return True
+
+    def changes_since(self, version):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            current = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            if version > current or version < current - SLOT_CHANGE_LOG_MAX:
+                return None
+            rows = conn.execute(
+                "SELECT name, slot FROM slot_changes WHERE version > ? ORDER BY version, rowid", (version,)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return current, dict(rows)
+
+
+def open_slot_store(path=SLOT_DB_PATH, capacity=slot_num_to_cmd, on_conflict=SLOT_CONFLICT_POLICY):
+    if not path or path == ":memory:":
+        return MemorySlotStore(capacity, on_conflict)
+    return SQLiteSlotStore(path, capacity, on_conflict)
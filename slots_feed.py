@@ -0,0 +1,67 @@
+import json
+import threading
+
+# /slots 응답 만들기: 웹 UI 가 2초마다 물어봐도 바뀐 게 없으면 본문 없이 304.
+#
+#   GET /slots                      전체 {이름: 슬롯} (기존 형식). ETag = 버전
+#   GET /slots + If-None-Match      버전이 같으면 304
+#   GET /slots?since=<버전>          바뀐 카드만 {"version", "full": false, "changes": {이름: 슬롯 또는 null}}
+#                                   기록이 없을 만큼 오래된 버전이면 {"version", "full": true, "slots": {...}}
+#                                   버전이 같으면 304
+#
+# 버전 문자열은 "<epoch>-<version>" (저장소를 새로 만들면 epoch 가 바뀌어서 예전 버전과 헷갈리지 않음).
+
+
+class SlotsFeed:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._full = (None, b"")  # (버전 문자열, 직렬화된 전체 목록) — 버전이 바뀔 때만 다시 직렬화
+
+    def token(self, version):
+        return f"{self.store.epoch}-{version}"
+
+    def _parse_token(self, token):
+        epoch, _, version = token.strip().strip('"').partition("-")
+        if epoch != str(self.store.epoch) or not version.isdigit():
+            return None
+        return int(version)
+
+    def _full_body(self, token, by_name):
+        with self._lock:
+            if self._full[0] != token:
+                self._full = (token, _dumps(by_name))
+            return self._full[1]
+
+    def respond(self, since=None, if_none_match=None):
+        """(status, 본문 bytes, 헤더 dict). 웹 프레임워크와 상관없이 쓸 수 있도록 값만 돌려준다."""
+        version, by_name, _ = self.store.snapshot()
+        token = self.token(version)
+        headers = {"ETag": f'"{token}"', "Cache-Control": "no-cache"}
+
+        if since is None:
+            if if_none_match and _etag_matches(if_none_match, token):
+                return 304, b"", headers
+            return 200, self._full_body(token, by_name), headers
+
+        base = self._parse_token(since)
+        if base == version:
+            return 304, b"", headers
+        delta = self.store.changes_since(base) if base is not None else None
+        if delta is None:
+            return 200, _dumps({"version": token, "full": True, "slots": by_name}), headers
+        current, changes = delta
+        headers["ETag"] = f'"{self.token(current)}"'
+        return 200, _dumps({"version": self.token(current), "full": False, "changes": changes}), headers
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _etag_matches(header, token):
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == f'"{token}"':
+            return True
+    return False
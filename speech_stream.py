@@ -0,0 +1,356 @@
+"""
+스트리밍 음성 인식: 마이크를 짧은 프레임 단위로 읽으면서 VAD 로 말의 시작/끝을 찾고,
+말하는 동안 프레임을 바로 인식기에 넘긴다. 녹음 파일을 디스크에 쓰지 않는다.
+
+    python speech_stream.py audio.wav --backend vosk     # 녹음 파일로 재생 (테스트용)
+    python speech_stream.py --backend google             # 마이크
+
+인식 백엔드 (CALLET_STT_BACKEND):
+    google        speech_recognition 의 Google Web Speech (말이 끝난 뒤 한 번에 인식)
+    google-cloud  Google Cloud Speech-to-Text (메모리의 PCM 을 그대로 전송)
+    vosk          오프라인 인식. 말하는 중에 부분 결과(partial)를 계속 낸다 (CALLET_VOSK_MODEL)
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import wave
+from collections import deque
+import numpy as np
+import metrics
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+STT_BACKEND = os.environ.get("CALLET_STT_BACKEND", "google")
+STT_LANGUAGE = "ko-KR"
+VOSK_MODEL_PATH = os.environ.get(
+    "CALLET_VOSK_MODEL",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "vosk-model-small-ko"),
+)
+# 마이크 대신 이 WAV 파일로 listen_command 를 돌린다 (마이크 없는 서버/테스트용)
+STT_REPLAY = os.environ.get("CALLET_STT_REPLAY", "")
+
+# VAD: 잡음 수준의 몇 배 이상이면 말소리로 본다 (webrtcvad 가 있으면 그쪽 사용)
+VAD_RATIO = float(os.environ.get("CALLET_VAD_RATIO", "3.0"))
+VAD_MIN_RMS = float(os.environ.get("CALLET_VAD_MIN_RMS", "300"))
+VAD_MODE = int(os.environ.get("CALLET_VAD_MODE", "2"))  # webrtcvad 민감도 0~3
+
+FAILED = "인식 실패"
+
+
+class RecognitionError(Exception):
+    """인식 서비스 호출 실패 (네트워크/API 오류)."""
+
+
+# ===== 오디오 입력 =====
+
+class MicrophoneSource:
+    """마이크에서 16bit mono PCM 프레임을 계속 읽는다."""
+
+    def __init__(self, rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+        self.rate = rate
+        self.frame_ms = frame_ms
+
+    def frames(self):
+        import pyaudio
+        audio = pyaudio.PyAudio()
+        frame_len = self.rate * self.frame_ms // 1000
+        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=self.rate,
+                            input=True, frames_per_buffer=frame_len)
+        try:
+            while True:
+                yield stream.read(frame_len, exception_on_overflow=False)
+        finally:
+            stream.stop_stream()
+            stream.close()
+            audio.terminate()
+
+
+class WavSource:
+    """
+    녹음된 WAV 를 마이크처럼 프레임 단위로 흘려보낸다.
+    mono/16kHz 가 아니면 메모리에서 변환. realtime=True 면 실제 시간만큼 기다리며 보낸다.
+    """
+
+    def __init__(self, path, rate=SAMPLE_RATE, frame_ms=FRAME_MS, realtime=False):
+        self.path = path
+        self.rate = rate
+        self.frame_ms = frame_ms
+        self.realtime = realtime
+
+    def pcm(self):
+        with wave.open(self.path, "rb") as wav:
+            width = wav.getsampwidth()
+            channels = wav.getnchannels()
+            rate = wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+        if width == 1:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) * 256
+        elif width == 2:
+            samples = np.frombuffer(raw, dtype="<i2").astype(np.float32)
+        elif width == 4:
+            samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 65536
+        else:
+            raise ValueError(f"지원하지 않는 샘플 크기: {width}바이트")
+        samples = samples.reshape(-1, channels).mean(axis=1)
+        if rate != self.rate:
+            positions = np.arange(0, len(samples), rate / self.rate)
+            samples = np.interp(positions, np.arange(len(samples)), samples)
+        return np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+
+    def frames(self):
+        pcm = self.pcm()
+        frame_bytes = self.rate * self.frame_ms // 1000 * 2
+        for i in range(0, len(pcm) - frame_bytes + 1, frame_bytes):
+            if self.realtime:
+                time.sleep(self.frame_ms / 1000)
+            yield pcm[i:i + frame_bytes]
+
+
+# ===== VAD =====
+
+class EnergyVAD:
+    """프레임 RMS 를 잡음 수준(말이 없을 때의 이동 평균)과 비교하는 간단한 VAD."""
+
+    def __init__(self, ratio=VAD_RATIO, min_rms=VAD_MIN_RMS):
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.noise = None
+
+    def is_speech(self, frame):
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples ** 2))) if len(samples) else 0.0
+        if self.noise is None:
+            self.noise = rms
+        speech = rms > max(self.min_rms, self.noise * self.ratio)
+        if not speech:
+            self.noise = 0.95 * self.noise + 0.05 * rms
+        return speech
+
+
+class WebRtcVAD:
+    def __init__(self, rate, mode=VAD_MODE):
+        import webrtcvad
+        self.rate = rate
+        self._vad = webrtcvad.Vad(mode)
+
+    def is_speech(self, frame):
+        return self._vad.is_speech(frame, self.rate)
+
+
+def make_vad(rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+    # webrtcvad 는 선택 의존성. 없거나 지원하지 않는 설정이면 에너지 VAD
+    if rate in (8000, 16000, 32000, 48000) and frame_ms in (10, 20, 30):
+        try:
+            return WebRtcVAD(rate)
+        except ImportError:
+            pass
+    return EnergyVAD()
+
+
+# ===== 인식 백엔드 =====
+# start(rate) → 세션. 세션.accept(pcm) 은 부분 결과(없으면 None), 세션.finish() 는 최종 결과(없으면 None)
+
+class _BufferedSession:
+    """말이 끝난 뒤 한 번에 인식하는 백엔드용: 프레임을 메모리에 모아둔다."""
+
+    def __init__(self, rate, recognize):
+        self.rate = rate
+        self._recognize = recognize
+        self._buffer = bytearray()
+
+    def accept(self, pcm):
+        self._buffer.extend(pcm)
+        return None
+
+    def finish(self):
+        return self._recognize(bytes(self._buffer), self.rate) if self._buffer else None
+
+
+class GoogleRecognizer:
+    def start(self, rate):
+        return _BufferedSession(rate, self._recognize)
+
+    @staticmethod
+    def _recognize(pcm, rate):
+        import speech_recognition as sr
+        try:
+            return sr.Recognizer().recognize_google(sr.AudioData(pcm, rate, 2), language=STT_LANGUAGE)
+        except sr.UnknownValueError:
+            return None
+        except sr.RequestError as e:
+            raise RecognitionError(f"API 오류: {e}")
+
+
+class GoogleCloudRecognizer:
+    def __init__(self):
+        self._client = None
+
+    def start(self, rate):
+        return _BufferedSession(rate, self._recognize)
+
+    def _recognize(self, pcm, rate):
+        from google.cloud import speech
+        if self._client is None:
+            self._client = speech.SpeechClient()
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=rate,
+            language_code=STT_LANGUAGE,
+        )
+        try:
+            response = self._client.recognize(config=config, audio=speech.RecognitionAudio(content=pcm))
+        except Exception as e:
+            raise RecognitionError(f"Google Speech 오류: {e}")
+        if not response.results:
+            return None
+        return response.results[0].alternatives[0].transcript
+
+
+class _VoskSession:
+    def __init__(self, recognizer):
+        self._rec = recognizer
+        self._segments = []
+
+    def _text(self, extra=""):
+        return " ".join(s for s in self._segments + [extra] if s).strip() or None
+
+    def accept(self, pcm):
+        if self._rec.AcceptWaveform(pcm):
+            self._segments.append(json.loads(self._rec.Result()).get("text", ""))
+            return self._text()
+        return self._text(json.loads(self._rec.PartialResult()).get("partial", ""))
+
+    def finish(self):
+        self._segments.append(json.loads(self._rec.FinalResult()).get("text", ""))
+        return self._text()
+
+
+class VoskRecognizer:
+    """오프라인 인식. 모델은 처음 쓸 때 한 번만 읽는다."""
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def start(self, rate):
+        import vosk
+        with self._lock:
+            if self._model is None:
+                self._model = vosk.Model(self.model_path)
+        return _VoskSession(vosk.KaldiRecognizer(self._model, rate))
+
+
+_recognizers = {}
+_recognizers_lock = threading.Lock()
+
+
+def make_recognizer(backend=None):
+    """CALLET_STT_BACKEND 설정에 따라 인식 백엔드 (프로세스당 하나씩 재사용)."""
+    backend = backend or STT_BACKEND
+    with _recognizers_lock:
+        recognizer = _recognizers.get(backend)
+        if recognizer is None:
+            if backend == "google":
+                recognizer = GoogleRecognizer()
+            elif backend == "google-cloud":
+                recognizer = GoogleCloudRecognizer()
+            elif backend == "vosk":
+                recognizer = VoskRecognizer()
+            else:
+                raise ValueError(f"알 수 없는 음성 인식 백엔드: {backend}")
+            _recognizers[backend] = recognizer
+        return recognizer
+
+
+# ===== 파이프라인 =====
+
+def recognize_utterance(source, recognizer, vad=None, on_partial=None,
+                        start_timeout=5.0, phrase_time_limit=7.0, pre_roll_ms=300, hangover_ms=600):
+    """
+    발화 하나를 인식해서 최종 텍스트를 돌려준다 (말이 없었거나 못 알아들으면 None).
+    start_timeout 초 안에 말이 시작되지 않으면 포기, 말이 끝나고 hangover_ms 동안 조용하면 끝으로 본다.
+    on_partial(text) 는 인식기가 부분 결과를 낼 때마다 (바뀐 경우만) 불린다.
+    """
+    vad = vad or make_vad(source.rate, source.frame_ms)
+    frame_s = source.frame_ms / 1000
+    pre_roll = deque(maxlen=max(1, pre_roll_ms // source.frame_ms))
+    session = None
+    waited = spoken = silence = 0.0
+    last_partial = None
+
+    for frame in source.frames():
+        speech = vad.is_speech(frame)
+        if session is None:
+            pre_roll.append(frame)
+            waited += frame_s
+            if not speech:
+                if waited >= start_timeout:
+                    return None
+                continue
+            # 말 시작: 조금 앞부분(pre-roll)부터 인식기에 넘긴다
+            session = recognizer.start(source.rate)
+            chunks = list(pre_roll)
+        else:
+            chunks = [frame]
+            spoken += frame_s
+            silence = 0.0 if speech else silence + frame_s
+
+        for chunk in chunks:
+            partial = session.accept(chunk)
+            if partial and partial != last_partial:
+                last_partial = partial
+                if on_partial is not None:
+                    on_partial(partial)
+
+        if silence * 1000 >= hangover_ms or spoken >= phrase_time_limit:
+            break
+
+    if session is None:
+        return None
+    with metrics.timer("stt"):
+        return session.finish()
+
+
+def listen_command(on_partial=None, backend=None, source=None, **kwargs):
+    """
+    기존 listen_command 와 같은 반환값: 인식된 문장, 실패하면 "인식 실패", API 오류면 "API 오류: ...".
+    CALLET_STT_REPLAY 가 있으면 마이크 대신 그 WAV 파일을 쓴다.
+    """
+    if source is None:
+        source = WavSource(STT_REPLAY) if STT_REPLAY else MicrophoneSource()
+    print("🎤 음성 입력 대기 중...")
+    try:
+        text = recognize_utterance(source, make_recognizer(backend), on_partial=on_partial, **kwargs)
+    except RecognitionError as e:
+        return str(e)
+    except OSError as e:
+        print(f"마이크 에러: {e}")
+        return FAILED
+    if not text:
+        return FAILED
+    print(f"🎿 인식된 텍스트: {text}")
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="스트리밍 음성 인식 (WAV 재생 또는 마이크)")
+    parser.add_argument("wav", nargs="?", help="녹음 파일 (없으면 마이크)")
+    parser.add_argument("--backend", default=STT_BACKEND, choices=["google", "google-cloud", "vosk"])
+    parser.add_argument("--realtime", action="store_true", help="녹음 파일을 실제 속도로 흘려보내기")
+    args = parser.parse_args()
+
+    source = WavSource(args.wav, realtime=args.realtime) if args.wav else MicrophoneSource()
+    start = time.perf_counter()
+
+    def on_partial(text):
+        print(f"  … {time.perf_counter() - start:6.2f}s  {text}")
+
+    text = listen_command(on_partial=on_partial, backend=args.backend, source=source)
+    print(f"최종 ({time.perf_counter() - start:.2f}s): {text}")
+
+
+if __name__ == "__main__":
+    main()
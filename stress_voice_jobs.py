@@ -0,0 +1,62 @@
+"""
+음성 명령 대기열 제한 확인. 워커가 막혀 있는 동안 작업을 한꺼번에 몰아넣어서
+max_queue 개(+ 그 사이 워커가 꺼내 간 것)까지만 받고 나머지는 JobQueueFullError 로 거절하는지,
+받은 작업은 풀어준 뒤 모두 done 으로 끝나는지 확인한다.
+
+    python stress_voice_jobs.py
+    python stress_voice_jobs.py --burst 200 --workers 2 --max-queue 4
+
+실패하면 종료 코드 1.
+"""
+import argparse
+import sys
+import threading
+import time
+from voice_jobs import VoiceJobs, JobQueueFullError
+
+
+def run(burst, workers, max_queue):
+    jobs = VoiceJobs(workers=workers, max_queue=max_queue)
+    release = threading.Event()
+    accepted, rejected = [], 0
+    for _ in range(burst):
+        try:
+            accepted.append(jobs.submit(release.wait, 10)["id"])
+        except JobQueueFullError:
+            rejected += 1
+    print(f"{burst}개 중 받음 {len(accepted)}, 거절 {rejected} ({jobs.stats()})")
+    problems = []
+    # 워커가 그 사이에 꺼내 간 작업은 대기열에서 빠지므로 max_queue ~ max_queue + workers 개
+    if not jobs.max_queue <= len(accepted) <= jobs.max_queue + jobs.workers:
+        problems.append(f"받은 작업 {len(accepted)}개 (기대: {jobs.max_queue}~{jobs.max_queue + jobs.workers})")
+    if rejected != jobs.rejected:
+        problems.append(f"거절 수 {rejected} ≠ stats {jobs.rejected}")
+
+    release.set()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and any(jobs.get(i)["status"] != "done" for i in accepted):
+        time.sleep(0.05)
+    unfinished = [i for i in accepted if jobs.get(i)["status"] != "done"]
+    if unfinished:
+        problems.append(f"끝나지 않은 작업 {len(unfinished)}개")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="음성 명령 대기열 제한 확인 (한꺼번에 몰려온 작업)")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-queue", type=int, default=2)
+    args = parser.parse_args()
+
+    problems = run(args.burst, args.workers, args.max_queue)
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if problems:
+        return 1
+    print("  ✅ 대기열 제한 동작")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+지갑별 잠금 스트레스 테스트. 여러 스레드가 여러 지갑에 저장/삭제/이동 문장을
+실제 경로(wallet_commands.process_text_command, 가짜 send)로 동시에 보낸 뒤,
+지갑마다 그 지갑의 잠금을 잡은 순서대로 새 저장소에 한 번에 하나씩 다시 실행해서
+결과, 보낸 모터 프레임, 최종 슬롯, version 이 모두 같은지 확인한다 (= 순서대로 실행한 것과 구별되지 않음).
+
+잠금을 잡은 순서는 wallet.lock 을 감싼 순번 발급기로 기록한다. process_text_command 가 지갑 잠금을
+잡지 않고 슬롯을 바꾸면 순번이 없어서 바로 실패로 잡힌다.
+
+    python stress_wallets.py
+    python stress_wallets.py --backend sqlite --threads 32 --wallets 8 --ops 5000
+    python stress_wallets.py --unlocked --send-ms 0   # 잠금이 서로 막지 않게 → 어긋남을 잡아내는지 확인용
+
+끝에 지갑 1개일 때와 N개일 때의 처리량을 같이 보여준다. 가짜 send 가 --send-ms 만큼 기다리므로
+(실제로도 frame.flush 는 지갑 잠금 안), 다른 지갑끼리 기다리지 않으면 N개 쪽 처리량이 그만큼 높게 나온다.
+실패하면 종료 코드 1.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# 실제 slots.db 를 건드리지 않도록 wallet_commands 를 불러오기 전에
+os.environ.setdefault("CALLET_SLOT_DB", ":memory:")
+
+from slot_store import MemorySlotStore, open_slot_store, slot_num_to_cmd
+from wallets import WalletRegistry
+import wallet_commands
+
+# 키워드(저장/삭제/이동)가 있는 문장만 써서 분류 모델을 읽지 않는다
+CARDS = ["롯데카드", "삼성카드", "민증"]
+INTENTS = ["저장", "저장", "삭제", "이동"]
+
+
+def random_sentence(rng):
+    """문장 하나 = 카드 1~3장 (여러 카드를 한 번에 말한 경우)."""
+    intent = rng.choice(INTENTS)
+    cards = rng.sample(CARDS, rng.randint(1, 3))
+    if intent == "저장":
+        return " ".join(f"{card} {rng.choice(list(slot_num_to_cmd))}" for card in cards) + " 저장"
+    return " ".join(cards) + f" {intent}"
+
+
+class TicketLock:
+    """
+    wallet.lock 대신 끼워 넣는 계측용 잠금. 잡을 때마다 지갑 안에서의 순번을 스레드에 남긴다.
+    exclusive=False 면 서로 막지 않는다 (--unlocked, 검사가 어긋남을 잡는지 확인용).
+    """
+
+    def __init__(self, lock, exclusive=True):
+        self._lock = lock
+        self._exclusive = exclusive
+        self._tickets = itertools.count()
+        self._local = threading.local()
+        self.waited = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        if self._exclusive:
+            self._lock.acquire()
+        self.waited += time.perf_counter() - start
+        self._local.ticket = next(self._tickets)
+        return self
+
+    def __exit__(self, *exc):
+        if self._exclusive:
+            self._lock.release()
+
+    def take_ticket(self):
+        ticket, self._local.ticket = getattr(self._local, "ticket", None), None
+        return ticket
+
+
+@contextmanager
+def using_registry(registry):
+    # process_text_command 는 wallet_commands.wallets 를 쓴다
+    saved = wallet_commands.wallets
+    wallet_commands.wallets = registry
+    try:
+        yield
+    finally:
+        wallet_commands.wallets = saved
+
+
+def worker(wallet_ids, ops, seed, send_delay, histories, errors):
+    rng = random.Random(seed)
+    for _ in range(ops):
+        wallet = wallet_commands.wallets.get(rng.choice(wallet_ids))
+        text = random_sentence(rng)
+        frames = []
+
+        def send(frame):
+            frames.append(frame)
+            time.sleep(send_delay)  # 장치 전송
+
+        try:
+            result = wallet_commands.process_text_command(text, send, wallet.id)
+        except Exception as e:
+            errors.append(f"{wallet.id}: {text!r}: {type(e).__name__}: {e}")
+            continue
+        ticket = wallet.lock.take_ticket()
+        if ticket is None:
+            errors.append(f"{wallet.id}: {text!r} 가 지갑 잠금 없이 실행됨")
+            continue
+        histories[wallet.id].append((ticket, text, result, frames))
+
+
+def check_wallet(wallet, history):
+    """잠금 순서대로 새 저장소에 다시 실행해서 달라지는 첫 지점을 찾는다. 문제 없으면 None."""
+    replay = WalletRegistry(lambda wallet_id: MemorySlotStore(slot_num_to_cmd, wallet.slots.on_conflict))
+    with using_registry(replay):
+        for ticket, text, result, frames in sorted(history, key=lambda entry: entry[0]):
+            expected_frames = []
+            expected = wallet_commands.process_text_command(text, expected_frames.append, wallet.id)
+            if (expected, expected_frames) != (result, frames):
+                return f"{ticket}번째 {text!r}: {result} {frames} ≠ 순차 실행 {expected} {expected_frames}"
+
+    version, by_name, by_slot = wallet.slots.snapshot()
+    replay_version, replay_by_name, _ = replay.get(wallet.id).slots.snapshot()
+    if dict(by_name) != dict(replay_by_name):
+        return f"최종 슬롯 {dict(by_name)} ≠ 순차 실행 {dict(replay_by_name)}"
+    if version != replay_version:
+        return f"version {version} ≠ 순차 실행 {replay_version}"
+    if len(set(by_name.values())) != len(by_name) or dict(by_slot) != {s: n for n, s in by_name.items()}:
+        return f"한 슬롯에 카드 두 장: {dict(by_name)}"
+    return None
+
+
+def make_registry(backend, directory):
+    if backend == "memory":
+        return WalletRegistry(lambda wallet_id: MemorySlotStore(slot_num_to_cmd))
+    return WalletRegistry(lambda wallet_id: open_slot_store(os.path.join(directory, f"slots-{wallet_id}.db")))
+
+
+def run(backend, threads, wallet_count, ops, seed, locked, send_delay):
+    with tempfile.TemporaryDirectory() as directory:
+        registry = make_registry(backend, directory)
+        wallet_ids = [f"w{i}" for i in range(wallet_count)]
+        # 스레드가 돌기 전에 지갑을 모두 열고 잠금을 계측용으로 감싼다
+        for wallet_id in wallet_ids:
+            wallet = registry.get(wallet_id)
+            wallet.lock = TicketLock(wallet.lock, exclusive=locked)
+        histories = {wallet_id: [] for wallet_id in wallet_ids}
+        errors = []
+        per_thread = max(1, ops // threads)
+        workers = [threading.Thread(target=worker, args=(wallet_ids, per_thread, seed + i, send_delay,
+                                                         histories, errors))
+                   for i in range(threads)]
+        with using_registry(registry):
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        problems = list(errors)
+        for wallet_id in wallet_ids:
+            problem = check_wallet(registry.get(wallet_id), histories[wallet_id])
+            if problem:
+                problems.append(f"{wallet_id}: {problem}")
+        total = sum(len(history) for history in histories.values())
+        lock_wait = sum(registry.get(wallet_id).lock.waited for wallet_id in wallet_ids)
+        return {"sentences": total, "elapsed": elapsed, "rate": total / elapsed if elapsed else 0.0,
+                "lock_wait": lock_wait, "problems": problems}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="지갑별 잠금 스트레스 테스트 (순차 실행과 같은 결과인지 확인)")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--wallets", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=4000, help="전체 문장 수 (스레드마다 나눔)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--send-ms", type=float, default=1.0, help="가짜 send 가 프레임마다 기다리는 장치 전송 시간")
+    parser.add_argument("--unlocked", action="store_true", help="지갑 잠금이 서로 막지 않게 (검사가 어긋남을 잡는지 확인)")
+    args = parser.parse_args()
+
+    locked = not args.unlocked
+    if not locked:
+        # GIL 이 스레드를 자주 바꾸도록 → 잠금이 없을 때 생기는 끼어들기가 짧은 실행에서도 드러난다
+        sys.setswitchinterval(1e-6)
+    failed = False
+    for wallet_count in sorted({1, args.wallets}):
+        result = run(args.backend, args.threads, wallet_count, args.ops, args.seed, locked, args.send_ms / 1000)
+        print(f"[{args.backend}] 지갑 {wallet_count}개, 스레드 {args.threads}개: 문장 {result['sentences']}개 "
+              f"{result['elapsed']:.2f}s ({result['rate']:.0f}/s), 잠금 대기 합계 {result['lock_wait']:.2f}s")
+        for problem in result["problems"][:10]:
+            print(f"  ❌ {problem}")
+        if result["problems"]:
+            failed = True
+            print(f"  ❌ 어긋남 {len(result['problems'])}건")
+        else:
+            print("  ✅ 지갑마다 순차 실행과 결과/모터 프레임/최종 슬롯/version 이 모두 같음")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
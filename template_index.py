@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# 템플릿 임베딩 인덱스 저장 위치 (여러 워커가 같은 파일을 메모리 매핑해서 공유)
+INDEX_DIR = os.environ.get(
+    "CALLET_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "template_index"),
+)
+
+
+def expand_examples(templates):
+    """{"save": "문장"} 또는 {"save": ["문장1", "문장2"]} → [(intent, 문장), ...]"""
+    rows = []
+    for intent, examples in templates.items():
+        if isinstance(examples, str):
+            examples = [examples]
+        for example in examples:
+            rows.append((intent, example))
+    return rows
+
+
+def index_key(rows, signature):
+    # 템플릿 내용 + 모델 리비전이 같으면 같은 키 → 바뀐 경우에만 다시 계산
+    payload = json.dumps({"rows": rows, "model": signature}, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class TemplateIndex:
+    def __init__(self, key, labels, texts, matrix):
+        self.key = key
+        self.labels = labels
+        self.texts = texts
+        self.matrix = matrix  # (예문 수, 임베딩 차원), 읽기 전용 memmap
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def _atomic_write(path, write_fn, mode="wb"):
+    # 같은 디렉토리에 임시 파일로 쓴 뒤 rename → 다른 프로세스가 반쯤 쓰인 파일을 읽지 않음
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_index(key, index_dir=INDEX_DIR):
+    npy_path = os.path.join(index_dir, f"{key}.npy")
+    meta_path = os.path.join(index_dir, f"{key}.json")
+    if not os.path.exists(npy_path) or not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(f"템플릿 인덱스 읽기 실패, 다시 생성합니다: {e}")
+        return None
+    if matrix.shape[0] != len(meta["labels"]):
+        return None
+    return TemplateIndex(key, meta["labels"], meta["texts"], matrix)
+
+
+def load_or_build(templates, embed_many, signature, index_dir=INDEX_DIR):
+    """
+    템플릿 임베딩 인덱스를 디스크에서 읽고, 없거나 템플릿/모델이 바뀌었으면 새로 만든다.
+    embed_many: 문장 리스트 → (N, D) 배열 을 돌려주는 함수
+    """
+    rows = expand_examples(templates)
+    key = index_key(rows, signature)
+
+    index = load_index(key, index_dir)
+    if index is not None:
+        return index
+
+    labels = [intent for intent, _ in rows]
+    texts = [text for _, text in rows]
+    matrix = np.asarray(embed_many(texts), dtype=np.float32)
+
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        # 메타데이터를 먼저 쓰고 .npy 를 마지막에 rename → .npy 가 보이면 인덱스가 완성된 것
+        meta = {"labels": labels, "texts": texts, "model": signature}
+        _atomic_write(os.path.join(index_dir, f"{key}.json"),
+                      lambda f: json.dump(meta, f, ensure_ascii=False), mode="w")
+        _atomic_write(os.path.join(index_dir, f"{key}.npy"), lambda f: np.save(f, matrix))
+        print(f"템플릿 인덱스 생성: {key} ({len(labels)}개 예문)")
+    except OSError as e:
+        # 디스크에 못 써도 분류는 계속 동작해야 함
+        print(f"템플릿 인덱스 저장 실패: {e}")
+        return TemplateIndex(key, labels, texts, matrix)
+
+    return load_index(key, index_dir) or TemplateIndex(key, labels, texts, matrix)
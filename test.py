@@ -1,5 +1,5 @@
-import requests
 import json
+from device_transport import transport, TransportError
 
 def send_command_to_esp32(command: str):
     url = "http://172.20.10.7/api/data"  # ESP32의 IP와 경로
@@ -10,7 +10,7 @@ def send_command_to_esp32(command: str):
     print("[INFO] 요청 URL:", url)
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=3)
+        response = transport.post(url, json=payload, headers=headers)
         response.raise_for_status()
 
         try:
@@ -22,7 +22,7 @@ def send_command_to_esp32(command: str):
         print("[SUCCESS] ESP32 응답:", data)
         return data
 
-    except requests.exceptions.RequestException as e:
+    except TransportError as e:
         print("[ERROR] 요청 실패:", e)
         return {"result": "fail", "error": str(e)}
 
@@ -0,0 +1,59 @@
+"""
+KoGPT2 임베딩 분류기를 선생님 모델로 써서 가벼운 n-gram 분류기를 학습한다.
+
+    python train_ngram_classifier.py --corpus data/train_utterances.txt
+
+예문(command_templates)은 정답 라벨 그대로, 코퍼스 문장은 KoGPT2 분류 결과를 라벨로 사용한다.
+"""
+import argparse
+import time
+import numpy as np
+from command_classifier import command_templates, command_keywords, TemplateClassifier
+from template_index import expand_examples
+import ngram_classifier
+
+
+def read_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="n-gram 의도 분류기 학습")
+    parser.add_argument("--corpus", default="data/train_utterances.txt")
+    parser.add_argument("--output", default=ngram_classifier.NGRAM_MODEL_PATH)
+    parser.add_argument("--epochs", type=int, default=300)
+    args = parser.parse_args()
+
+    rows = expand_examples(command_templates)
+    texts = [text for _, text in rows]
+    labels = [intent for intent, _ in rows]
+
+    corpus = read_corpus(args.corpus)
+    teacher = TemplateClassifier(command_templates, keywords=command_keywords, min_score=0, min_margin=0)
+    start = time.perf_counter()
+    teacher_results = teacher.classify_batch(corpus)
+    print(f"KoGPT2 라벨링: {len(corpus)}문장, {time.perf_counter() - start:.1f}초")
+    skipped = 0
+    for text, result in zip(corpus, teacher_results):
+        if result.intent is None:
+            # 선생님 모델이 거절한 문장은 라벨이 없으므로 학습에서 뺀다
+            skipped += 1
+            continue
+        texts.append(text)
+        labels.append(result.intent)
+    if skipped:
+        print(f"라벨 없는 문장 {skipped}개 제외")
+
+    W, b, intents = ngram_classifier.train(texts, labels, intents=list(command_templates), epochs=args.epochs)
+    ngram_classifier.save_model(args.output, W, b, intents)
+
+    # 학습 데이터에서 선생님 모델과의 일치율
+    student = ngram_classifier.NgramClassifier(args.output, keywords={})
+    predicted = [r.intent for r in student.classify_batch(texts)]
+    agreement = np.mean([p == label for p, label in zip(predicted, labels)])
+    print(f"저장: {args.output} (학습 일치율 {agreement:.1%}, 문장 {len(texts)}개)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,239 @@
-import pyttsx3
+import hashlib
+import heapq
+import itertools
+import os
 import threading
+import time
+import wave
+import metrics
 
-engine = pyttsx3.init()
-lock = threading.Lock()
+# 미리 합성해 둔 안내 음성(WAV) 캐시 위치
+TTS_CACHE_DIR = os.environ.get(
+    "CALLET_TTS_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tts"),
+)
+# 음성 설정 (캐시 키에 포함되므로 바꾸면 새로 합성)
+TTS_VOICE = os.environ.get("CALLET_TTS_VOICE", "")
+TTS_RATE = int(os.environ.get("CALLET_TTS_RATE", "0"))       # 0 이면 엔진 기본값
+TTS_VOLUME = float(os.environ.get("CALLET_TTS_VOLUME", "1.0"))
+# 밀려 있는 안내가 이보다 오래되면 말하지 않고 버린다 (HIGH 는 예외)
+TTS_MAX_AGE = float(os.environ.get("CALLET_TTS_MAX_AGE", "10"))
+TTS_QUEUE_MAX = int(os.environ.get("CALLET_TTS_QUEUE_MAX", "16"))
 
-def speak(text):
-    with lock:
+# 우선순위: 숫자가 작을수록 먼저
+PRIORITY_HIGH = 0    # 실패/오류 안내
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2     # 진행 상황처럼 늦으면 의미 없는 안내
+
+# prerender() 기본값: 미리 합성해 두는 고정 문구
+FIXED_PROMPTS = [
+    "보관 완료!",
+    "음성 인식 실패",
+    "명령을 이해하지 못했습니다.",
+    "카드 이름을 인식하지 못했습니다.",
+    "슬롯 번호를 찾을 수 없습니다.",
+    "카드가 정상적으로 보관되었습니다. 설정이 완료되었습니다!",
+]
+
+
+def cache_key(text):
+    settings = f"{TTS_VOICE}|{TTS_RATE}|{TTS_VOLUME}"
+    return hashlib.sha256(f"{settings}\n{text}".encode("utf-8")).hexdigest()[:16]
+
+
+class SpeechWorker:
+    """
+    음성 안내 전용 스레드. speak() 는 큐에 넣고 바로 돌아오므로 명령 처리 스레드가 말이 끝날 때까지 막히지 않는다.
+    pyttsx3 엔진은 이 스레드에서만 만든다/쓴다.
+    같은 문구가 이미 대기 중이면 합치고, 오래된 안내는 버린다.
+    prerender() 로 등록한 문구(고정 안내, 카드별 확인 문구)만 WAV 로 저장해 두고 다음부터는 파일만 재생한다.
+    오류 메시지나 처음 보는 카드 이름이 들어간 문구는 캐시하지 않고 바로 말한다 (캐시 디렉터리가 끝없이 커지지 않도록).
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_age=TTS_MAX_AGE, max_queue=TTS_QUEUE_MAX):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queue = []  # heap: (priority, seq, text, enqueued_at)
+        self._queued_texts = set()
+        self._to_render = []  # 말하지는 않고 미리 합성만 해 둘 문구
+        self._render_requested = set()  # prerender() 로 등록된 문구 = WAV 캐시를 쓰는 문구
+        self._seq = itertools.count()
+        self._busy = False
+        self._thread = None
+        self._engine = None
+        self._audio = None
+        self._listeners = []
+        self.stats = {"spoken": 0, "cache_hits": 0, "rendered": 0, "merged": 0, "dropped": 0}
+
+    # ----- 호출하는 쪽 -----
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def prerender(self, texts):
+        """여러 번 불러도 같은 문구는 한 번만 합성 예약."""
+        with self._cond:
+            texts = [t for t in texts if t not in self._render_requested]
+            if not texts:
+                return
+            self._render_requested.update(texts)
+            self._to_render.extend(texts)
+            self._cond.notify()
+        self.start()
+
+    def speak(self, text, priority=PRIORITY_NORMAL):
+        text = str(text).strip()
+        if not text:
+            return
+        self.start()
+        with self._cond:
+            if text in self._queued_texts:
+                self.stats["merged"] += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                # 가장 덜 중요하고 가장 늦게 들어온 안내를 버린다
+                victim = max(self._queue)
+                if victim[0] < priority:
+                    self.stats["dropped"] += 1
+                    return
+                self._queue.remove(victim)
+                heapq.heapify(self._queue)
+                self._queued_texts.discard(victim[2])
+                self.stats["dropped"] += 1
+            heapq.heappush(self._queue, (priority, next(self._seq), text, time.monotonic()))
+            self._queued_texts.add(text)
+            self._cond.notify()
+
+    def add_listener(self, callback):
+        """말하기 직전마다 callback(text) (웹 UI 에 같은 문구를 띄울 때)."""
+        self._listeners.append(callback)
+
+    def wait_idle(self, timeout=None):
+        """대기 중인 안내를 다 말할 때까지 기다린다 (스크립트/종료용)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # ----- 워커 스레드 -----
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._to_render:
+                    self._busy = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                self._busy = True
+                if self._queue:
+                    priority, _, text, enqueued_at = heapq.heappop(self._queue)
+                    self._queued_texts.discard(text)
+                else:
+                    # 말할 것이 없을 때만 미리 합성
+                    priority, text = None, self._to_render.pop(0)
+
+            if priority is None:
+                try:
+                    self._cached_wav(text)
+                except Exception as e:
+                    print(f"TTS 미리 합성 실패: {text} ({e})")
+                    with self._cond:
+                        self._to_render.clear()
+                continue
+            waited = time.monotonic() - enqueued_at
+            if priority != PRIORITY_HIGH and waited > self.max_age:
+                self.stats["dropped"] += 1
+                continue
+            metrics.observe("tts_wait", waited)
+            for callback in self._listeners:
+                try:
+                    callback(text)
+                except Exception as e:
+                    print(f"TTS 알림 오류: {e}")
+            try:
+                with metrics.timer("tts"):
+                    self._say(text)
+                self.stats["spoken"] += 1
+            except Exception as e:
+                print(f"TTS 오류: {e}")
+
+    def _get_engine(self):
+        if self._engine is None:
+            import pyttsx3
+            engine = pyttsx3.init()
+            if TTS_VOICE:
+                engine.setProperty("voice", TTS_VOICE)
+            if TTS_RATE:
+                engine.setProperty("rate", TTS_RATE)
+            engine.setProperty("volume", TTS_VOLUME)
+            self._engine = engine
+        return self._engine
+
+    def _cached_wav(self, text):
+        path = os.path.join(self.cache_dir, cache_key(text) + ".wav")
+        if os.path.exists(path):
+            self.stats["cache_hits"] += 1
+            return path
+        os.makedirs(self.cache_dir, exist_ok=True)
+        engine = self._get_engine()
+        tmp_path = f"{path}.{os.getpid()}.tmp.wav"
+        engine.save_to_file(text, tmp_path)
+        engine.runAndWait()
+        os.replace(tmp_path, path)
+        self.stats["rendered"] += 1
+        return path
+
+    def _say(self, text):
+        with self._cond:
+            cacheable = text in self._render_requested
+        if cacheable:
+            try:
+                self._play_wav(self._cached_wav(text))
+                return
+            except (OSError, wave.Error, ImportError) as e:
+                # 파일로 합성/재생이 안 되는 환경 (엔진이 WAV 를 못 만드는 경우 등) → 바로 말하기
+                print(f"TTS 캐시 사용 불가, 직접 합성: {e}")
+        engine = self._get_engine()
         engine.say(text)
         engine.runAndWait()
+
+    def _play_wav(self, path):
+        import pyaudio
+        if self._audio is None:
+            self._audio = pyaudio.PyAudio()
+        with wave.open(path, "rb") as wav:
+            stream = self._audio.open(
+                format=self._audio.get_format_from_width(wav.getsampwidth()),
+                channels=wav.getnchannels(),
+                rate=wav.getframerate(),
+                output=True,
+            )
+            try:
+                chunk = wav.readframes(4096)
+                while chunk:
+                    stream.write(chunk)
+                    chunk = wav.readframes(4096)
+            finally:
+                stream.stop_stream()
+                stream.close()
+
+
+worker = SpeechWorker()
+
+
+def speak(text, priority=PRIORITY_NORMAL):
+    """음성 안내를 큐에 넣고 바로 돌아온다."""
+    worker.speak(text, priority)
+
+
+def prerender(texts=FIXED_PROMPTS):
+    """카드별 확인 문구처럼 자주 쓰는 문구를, 말할 것이 없을 때 미리 합성해 둔다 (WAV 캐시는 이 문구들만)."""
+    worker.prerender(list(texts))
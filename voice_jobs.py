@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# 음성 명령 작업을 동시에 처리할 스레드 수 (마이크가 하나라 기본 1)
+VOICE_WORKERS = int(os.environ.get("CALLET_VOICE_WORKERS", "1"))
+# 처리 중인 것 말고 기다릴 수 있는 작업 수. 넘으면 /listen 이 429
+VOICE_QUEUE_MAX = int(os.environ.get("CALLET_VOICE_QUEUE_MAX", "2"))
+# 끝난 작업 상태를 /jobs/<id> 로 조회할 수 있는 시간(초)과 최대 개수
+VOICE_JOB_TTL = float(os.environ.get("CALLET_VOICE_JOB_TTL", "300"))
+VOICE_JOB_HISTORY = 256
+
+
+class JobQueueFullError(Exception):
+    def __init__(self, running, queued):
+        super().__init__(f"음성 명령 처리 중입니다 (처리 중 {running}개, 대기 {queued}개). 잠시 후 다시 시도하세요.")
+        self.running = running
+        self.queued = queued
+
+
+class VoiceJobs:
+    """
+    /listen 요청마다 스레드를 새로 만들지 않고, 정해진 수의 워커 스레드와 길이 제한이 있는 대기열로 처리한다.
+    대기열이 차면 submit 이 JobQueueFullError (→ 429). 작업 상태는 id 로 조회한다.
+        queued → running → done | failed
+    """
+
+    def __init__(self, workers=VOICE_WORKERS, max_queue=VOICE_QUEUE_MAX, ttl=VOICE_JOB_TTL,
+                 history=VOICE_JOB_HISTORY):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.history = history
+        self._cond = threading.Condition()
+        self._queue = deque()       # (job, fn, args)
+        self._jobs = OrderedDict()  # id → 상태 dict (오래된 것부터)
+        self._threads = []
+        self._running = 0
+        self.rejected = 0
+
+    def _ensure_workers(self):
+        # self._cond 를 잡은 채로 호출
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"voice-job-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _prune(self, now):
+        # 끝난 지 오래된 작업, 또는 개수가 넘치면 가장 오래된 끝난 작업부터 지운다
+        for job_id, job in list(self._jobs.items()):
+            if len(self._jobs) <= self.history and (job["finished_at"] is None or now - job["finished_at"] < self.ttl):
+                break
+            if job["finished_at"] is not None:
+                del self._jobs[job_id]
+
+    def submit(self, fn, *args):
+        """fn(*args) 를 대기열에 넣고 작업 상태(dict 복사본)를 돌려준다. 꽉 찼으면 JobQueueFullError."""
+        now = time.time()
+        with self._cond:
+            # 워커가 아직 꺼내 가지 않은 작업만 센다. 한꺼번에 몰려온 요청도 max_queue 개까지만 받는다
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise JobQueueFullError(self._running, len(self._queue))
+            self._prune(now)
+            job = {"id": uuid.uuid4().hex[:12], "status": "queued", "submitted_at": now,
+                   "started_at": None, "finished_at": None, "result": None, "error": None}
+            self._jobs[job["id"]] = job
+            self._queue.append((job, fn, args))
+            self._ensure_workers()
+            self._cond.notify()
+            return dict(job, position=len(self._queue))
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            position = next((i + 1 for i, (queued, _, _) in enumerate(self._queue) if queued is job), 0)
+            return dict(job, position=position)
+
+    def stats(self):
+        with self._cond:
+            return {"workers": self.workers, "running": self._running, "queued": len(self._queue),
+                    "max_queue": self.max_queue, "rejected": self.rejected}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job, fn, args = self._queue.popleft()
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                self._running += 1
+            try:
+                result, error, status = fn(*args), None, "done"
+            except Exception as e:
+                print(f"음성 명령 작업 오류 ({job['id']}): {e}")
+                result, error, status = None, str(e), "failed"
+            with self._cond:
+                self._running -= 1
+                job.update(status=status, result=result, error=error, finished_at=time.time())
+
@@ -0,0 +1,93 @@
+from command_parser import parse_command
+from command_classifier import make_classifier
+from slot_store import slot_num_to_cmd, SlotError
+from motor_frame import MotorFrame
+from command_channel import DEFAULT_DEVICE
+from wallets import WalletRegistry
+import metrics
+
+# esp32_main (Flask) 과 esp32_async (asyncio) 가 같이 쓰는 명령 처리 부분
+
+# ===== 슬롯 저장 =====
+# 지갑(= ESP32 device id)마다 저장소와 잠금이 따로. slots 는 기본 지갑 (예전 코드 호환)
+wallets = WalletRegistry()
+slots = wallets.get(DEFAULT_DEVICE).slots
+
+command_templates = {
+    "save": ["저장 롯데카드 1", "저장 삼성카드 2번", "저장 민증 3"],
+    "delete": ["삭제 롯데카드", "삭제 민증", "삭제 삼성카드"],
+    "move": ["롯데카드", "민증", "삼성카드", "이동"]
+}
+classifier = make_classifier(command_templates)
+
+def classify_command(text):
+    return classifier.classify(text)
+
+def execute_command(cmd, send, slots=slots):
+    """
+    파싱된 명령 하나를 실행하고 (성공 여부, 메시지) 를 돌려준다.
+    send(command_char) 는 ESP32 에 모터 명령을 넘기는 함수 (HTTP 중계, 프로세스 내 큐 등).
+    slots 는 명령을 적용할 지갑의 저장소. 확인 후 쓰기가 끊기지 않도록 그 지갑의 lock 을 잡고 부른다.
+    """
+    if cmd.intent == "save":
+        if cmd.slot is None:
+            return False, "번호 인식 실패"
+        if not cmd.card:
+            return False, "이름 인식 실패"
+        try:
+            swapped = slots.save(cmd.card, cmd.slot)
+        except SlotError as e:
+            return False, str(e)
+        send(slot_num_to_cmd[cmd.slot])
+        if swapped:
+            return True, f"{cmd.card} → {cmd.slot} 저장 완료 ({swapped} → {slots[swapped]})"
+        return True, f"{cmd.card} → {cmd.slot} 저장 완료"
+
+    elif cmd.intent == "delete":
+        # 확인과 삭제를 저장소 연산 하나로 (지갑 잠금은 이 프로세스 안에서만이라, 같은 SQLite 를 쓰는
+        # 다른 워커가 그 사이에 지울 수 있다)
+        slot_num = slots.delete(cmd.card)
+        if slot_num is None:
+            return False, "해당 슬롯 없음"
+        send(slot_num_to_cmd[slot_num])
+        return True, f"{cmd.card} 삭제 완료"
+
+    elif cmd.intent == "move":
+        slot_num = slots.slot_of(cmd.card)
+        if slot_num is None:
+            return False, "해당 슬롯 없음"
+        send(slot_num_to_cmd[slot_num])
+        return True, f"{cmd.card} 이동 완료"
+
+    return False, "명령을 이해하지 못했습니다."
+
+@metrics.timer("command")
+def process_text_command(text, send, wallet_id=DEFAULT_DEVICE, precheck=None):
+    """
+    precheck() 는 지갑 잠금 안에서 슬롯을 바꾸기 직전에 불린다. 예외를 던지면 (예: 명령 큐가 가득 참)
+    슬롯은 그대로 두고 그 예외가 호출한 쪽으로 올라간다.
+    """
+    # 지갑 id 가 잘못됐으면 파싱(분류 모델) 전에 InvalidWalletError
+    wallet = wallets.get(wallet_id)
+    # "롯데카드 1 삼성카드 2 저장" 처럼 여러 카드를 한 번에 말해도 카드별 명령으로 나뉨
+    commands = parse_command(text, classify=classify_command)
+    if not commands:
+        return {"result": "fail", "message": "명령을 이해하지 못했습니다."}
+
+    # 카드마다 바로 보내지 않고 프레임 하나에 모아서 마지막에 한 번만 보낸다 ("r;s;")
+    # 파싱은 잠금 밖에서, 슬롯 변경과 전송은 지갑 잠금 안에서: 같은 지갑의 문장은 하나씩 통째로 적용되고
+    # 모터 명령도 슬롯이 바뀐 순서대로 나간다. 다른 지갑은 이 잠금을 기다리지 않는다.
+    frame = MotorFrame()
+    with wallet.lock:
+        if precheck is not None:
+            precheck()
+        results = [execute_command(cmd, frame.dispense, wallet.slots) for cmd in commands]
+        frame.flush(send)
+    succeeded = sum(1 for ok, _ in results if ok)
+    if succeeded == len(results):
+        status = "success"
+    elif succeeded:
+        status = "partial"
+    else:
+        status = "fail"
+    return {"result": status, "message": ", ".join(message for _, message in results)}
@@ -0,0 +1,70 @@
+import os
+import threading
+import zlib
+from command_channel import DEFAULT_DEVICE, validate_device_id
+from slot_store import SLOT_DB_PATH, open_slot_store
+from slots_feed import SlotsFeed
+
+# 지갑 목록을 나눠 담을 구획 수. 지갑 조회/생성은 그 지갑이 속한 구획의 잠금만 잡는다
+WALLET_STRIPES = int(os.environ.get("CALLET_WALLET_STRIPES", "16"))
+
+def wallet_db_path(wallet_id, base=SLOT_DB_PATH):
+    """기본 지갑은 기존 slots.db 그대로, 나머지는 slots-<id>.db (메모리 저장소면 그대로 메모리)."""
+    if not base or base == ":memory:" or wallet_id == DEFAULT_DEVICE:
+        return base
+    root, ext = os.path.splitext(base)
+    return f"{root}-{wallet_id}{ext or '.db'}"
+
+
+class Wallet:
+    """
+    지갑 하나의 상태. slots 는 이 지갑 전용 저장소라 다른 지갑의 쓰기와 잠금/DB 파일을 같이 쓰지 않는다.
+    lock 은 문장 하나(여러 카드 저장 + 모터 프레임 전송)를 이 지갑에 대해 한 번에 하나씩 실행할 때 잡는다.
+    """
+
+    def __init__(self, wallet_id, slots):
+        self.id = wallet_id
+        self.slots = slots
+        self.feed = SlotsFeed(slots)
+        self.lock = threading.RLock()
+
+    def __repr__(self):
+        return f"Wallet({self.id!r}, {self.slots!r})"
+
+
+class WalletRegistry:
+    """지갑 id → Wallet. 처음 쓰일 때 저장소를 연다. 지갑마다 잠금이 따로라 서로 다른 지갑의 명령은 기다리지 않는다."""
+
+    def __init__(self, open_store=None, stripes=WALLET_STRIPES):
+        self._open_store = open_store or (lambda wallet_id: open_slot_store(wallet_db_path(wallet_id)))
+        self._stripes = [(threading.Lock(), {}) for _ in range(max(1, stripes))]
+        self._listeners = []
+
+    def _stripe(self, wallet_id):
+        return self._stripes[zlib.crc32(wallet_id.encode("utf-8")) % len(self._stripes)]
+
+    def add_listener(self, callback):
+        """새 지갑을 열 때마다 callback(wallet) (이미 열린 지갑에도 바로 한 번씩)."""
+        self._listeners.append(callback)
+        for wallet in self.wallets():
+            callback(wallet)
+
+    def get(self, wallet_id=DEFAULT_DEVICE):
+        # 지갑 id = ESP32 device id (?device=). 명령 큐와 같은 규칙으로 검사 (파일 이름에도 쓰임)
+        wallet_id = validate_device_id(wallet_id or DEFAULT_DEVICE)
+        lock, wallets = self._stripe(wallet_id)
+        with lock:
+            wallet = wallets.get(wallet_id)
+            if wallet is not None:
+                return wallet
+            wallet = wallets[wallet_id] = Wallet(wallet_id, self._open_store(wallet_id))
+        for callback in self._listeners:
+            callback(wallet)
+        return wallet
+
+    def wallets(self):
+        result = []
+        for lock, wallets in self._stripes:
+            with lock:
+                result.extend(wallets.values())
+        return result